@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Parsing many numeric positional arguments: per value coercion compared with
+the bulk list and array conversions.
+
+  python -m benchmarks.bench_bulk [values]
+"""
+import sys
+import timeit
+from typing import List
+
+from tooler import DefaultParser
+from tooler.arrays import IntArray
+
+
+def as_list(*ids: List[int]):
+  pass
+
+
+def as_array(ids: IntArray):
+  pass
+
+
+def main(values=100000):
+  argv = [str(idx) for idx in range(values)]
+  parser = DefaultParser()
+
+  def per_value():
+    # Coercing one value at a time, without any argument parsing
+    return [int(value) for value in argv]
+
+  for label, fn in (
+      ("int() only", per_value),
+      ("List[int]", lambda: parser.parse(as_list, None, None, argv)),
+      ("IntArray", lambda: parser.parse(as_array, None, None, argv)),
+  ):
+    elapsed = min(timeit.repeat(fn, number=5, repeat=3)) / 5
+    print("%-10s %.1fms" % (label, elapsed * 1e3))
+
+  (args, _kv) = parser.parse(as_array, None, None, argv)
+  print("IntArray holds %d values in %d bytes" % (len(args[0]), args[0].itemsize * len(args[0])))
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:]])
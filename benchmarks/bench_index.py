@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Completion and "did you mean" cost with many registered commands.
+
+  python -m benchmarks.bench_index [commands]
+"""
+import sys
+import timeit
+
+from tooler import Tooler
+
+
+def main(commands=10000):
+  tooler = Tooler()
+  for idx in range(commands):
+    tooler.add_command("service-%d-deploy" % idx, None)
+
+  def linear_complete():
+    return [name for name in tooler.commands if name.startswith("service-42")]
+
+  def linear_similar():
+    return [name for name in tooler.commands if "42-dep" in name]
+
+  for label, fn in (
+      ("complete (linear)", linear_complete),
+      ("complete (trie)", lambda: tooler.index.complete("service-42")),
+      ("search (linear)", linear_similar),
+      ("search (n-grams)", lambda: tooler.index.search("42-dep")),
+      ("suggest", lambda: tooler.index.suggest("service-42-deplyo")),
+  ):
+    elapsed = min(timeit.repeat(fn, number=100, repeat=3)) / 100
+    print("%s: %.1fus" % (label, elapsed * 1e6))
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:]])
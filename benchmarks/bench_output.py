@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Compare the registered JSON serializers, and the output formats, on a large
+nested result.
+
+  python -m benchmarks.bench_output [records]
+"""
+import os
+import sys
+import time
+
+from tooler import output
+
+
+def make_result(records):
+  return [
+      {
+          "id": idx,
+          "host": "host-%d.example.com" % idx,
+          "tags": ["web", "prod", "zone-%d" % (idx % 7)],
+          "metrics": {"cpu": idx * 0.01, "mem": idx * 1024, "up": idx % 3 != 0},
+          "note": None,
+      }
+      for idx in range(records)
+  ]
+
+
+def _time(fn):
+  start = time.perf_counter()
+  fn()
+  return time.perf_counter() - start
+
+
+def main(records=200000):
+  result = make_result(records)
+
+  for name, serializer in sorted(output.SERIALIZERS.items()):
+    try:
+      compact = _time(lambda: serializer(result, False))
+      pretty = _time(lambda: serializer(result, True))
+    except ImportError:
+      print("%-8s not installed" % name)
+      continue
+    size = len(serializer(result, False))
+    print(
+        "%-8s compact %.3fs, pretty %.3fs (%.1fMB compact)"
+        % (name, compact, pretty, size / 1e6)
+    )
+
+  # Full output path, written to /dev/null as if piped to another tool
+  stdout = sys.stdout
+  with open(os.devnull, "w") as devnull:
+    timings = {}
+    for name in ["pretty", "json", "ndjson", "csv", "tsv"]:
+      sys.stdout = devnull
+      try:
+        timings[name] = _time(lambda: output.output_default(result, format=name))
+      finally:
+        sys.stdout = stdout
+  for name, elapsed in timings.items():
+    print("format %-8s %.3fs" % (name, elapsed))
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for `DefaultParser.parse`, comparing a warm parser (which reuses
+the compiled parse plan) to a fresh parser per call (which has to inspect the
+signature every time).
+
+  python -m benchmarks.bench_parser [iterations]
+"""
+import sys
+import timeit
+
+from tooler import DefaultParser
+
+
+def command(one, two, three=3, four=4.0, verbose=False, dry_run=False, *rest, **kv):
+  pass
+
+
+ARGV = ["a", "b", "--three=5", "--four", "2.5", "--verbose", "--no-dry-run"]
+
+
+def main(iterations=20000):
+  warm = DefaultParser(shorthands={"v": "verbose"})
+
+  def parse_warm():
+    warm.parse(command, None, None, ARGV)
+
+  def parse_cold():
+    DefaultParser(shorthands={"v": "verbose"}).parse(command, None, None, ARGV)
+
+  cold_time = min(timeit.repeat(parse_cold, number=iterations, repeat=3))
+  warm_time = min(timeit.repeat(parse_warm, number=iterations, repeat=3))
+
+  print("cold: %.2fus/parse" % (cold_time / iterations * 1e6))
+  print("warm: %.2fus/parse" % (warm_time / iterations * 1e6))
+  print("speedup: %.1fx" % (cold_time / warm_time))
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:]])
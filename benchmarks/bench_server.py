@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Compare invocations per second of a tool started cold against the same tool
+running in server mode, both through the standalone client script and with
+the client called in-process.
+
+  python -m benchmarks.bench_server [invocations]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from tooler import client
+
+TOOL = """
+import decimal, email.parser, json, xml.dom.minidom
+from tooler import Tooler
+
+tooler = Tooler()
+
+@tooler.command
+def add(a: int, b: int):
+  return a + b
+
+tooler.main()
+"""
+
+
+def _rate(invocations, fn):
+  start = time.perf_counter()
+  for _ in range(invocations):
+    fn()
+  return invocations / (time.perf_counter() - start)
+
+
+def main(invocations=100):
+  with tempfile.TemporaryDirectory() as root:
+    tool = os.path.join(root, "tool.py")
+    socket_path = os.path.join(root, "tool.sock")
+    with open(tool, "w") as f:
+      f.write(TOOL)
+
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    client_script = os.path.join(os.path.dirname(client.__file__), "client.py")
+
+    server = subprocess.Popen([sys.executable, tool, "--serve", socket_path], env=env)
+    try:
+      while not os.path.exists(socket_path):
+        time.sleep(0.01)
+
+      with open(os.devnull, "wb") as devnull:
+        stdio = (0, devnull.fileno(), 2)
+        cold = _rate(
+            invocations,
+            lambda: subprocess.run(
+                [sys.executable, tool, "add", "1", "2"], env=env, stdout=devnull
+            ),
+        )
+        thin = _rate(
+            invocations,
+            lambda: subprocess.run(
+                [sys.executable, client_script, socket_path, "add", "1", "2"],
+                env=env,
+                stdout=devnull,
+            ),
+        )
+        direct = _rate(invocations, lambda: client.run(socket_path, ["add", "1", "2"], stdio))
+    finally:
+      server.terminate()
+      server.wait()
+
+  print("cold start:        %.1f invocations/s" % cold)
+  print("client script:     %.1f invocations/s" % thin)
+  print("in-process client: %.1f invocations/s" % direct)
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for shell completion and per-command help.
+
+Generates a tool with many command modules, then times `--bash-completion` and
+`<command> --help` for a tool that imports every module up front against one
+using lazy commands answered from a manifest.
+
+  python -m benchmarks.bench_startup [modules] [commands-per-module]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+EAGER_TOOL = """
+from tooler import Tooler
+tooler = Tooler()
+{imports}
+tooler.main()
+"""
+
+LAZY_TOOL = """
+from tooler import Tooler
+tooler = Tooler(manifest={manifest!r})
+{registrations}
+tooler.main()
+"""
+
+
+def _module_source(index, commands, decorated):
+  lines = ["from __main__ import tooler"] if decorated else []
+  # Give every module some weight, like a real command module pulling in
+  # its dependencies
+  lines.append("import decimal, email.parser, json, xml.dom.minidom")
+  for command in range(commands):
+    if decorated:
+      lines.append("@tooler.command")
+    lines.append(
+        "def command_%d_%d(host, port=22, verbose=False, *rest):\n"
+        "  '''Command %d of module %d'''\n"
+        "  return host\n" % (index, command, command, index)
+    )
+  return "\n".join(lines)
+
+
+def _generate(root, modules, commands):
+  for variant in ("eager", "lazy"):
+    package = os.path.join(root, variant + "_commands")
+    os.mkdir(package)
+    open(os.path.join(package, "__init__.py"), "w").close()
+    for index in range(modules):
+      with open(os.path.join(package, "module_%d.py" % index), "w") as f:
+        f.write(_module_source(index, commands, variant == "eager"))
+
+  with open(os.path.join(root, "eager_tool.py"), "w") as f:
+    f.write(
+        EAGER_TOOL.format(
+            imports="\n".join(
+                "import eager_commands.module_%d" % index for index in range(modules)
+            )
+        )
+    )
+
+  with open(os.path.join(root, "lazy_tool.py"), "w") as f:
+    f.write(
+        LAZY_TOOL.format(
+            manifest=os.path.join(root, "manifest.json"),
+            registrations="\n".join(
+                "tooler.lazy_command(%r, %r)"
+                % (
+                    "command-%d-%d" % (index, command),
+                    "lazy_commands.module_%d:command_%d_%d" % (index, index, command),
+                )
+                for index in range(modules)
+                for command in range(commands)
+            ),
+        )
+    )
+
+
+def _time(root, script, args, env, runs):
+  best = None
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(root, script), *args],
+        env=env,
+        check=False,
+        stdout=subprocess.DEVNULL,
+    )
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def main(modules=50, commands=20, runs=5):
+  with tempfile.TemporaryDirectory() as root:
+    _generate(root, modules, commands)
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join([root, os.getcwd()]),
+        COMP_WORDS="t\ncommand-1",
+        COMP_CWORD="1",
+    )
+
+    # Prime the manifest
+    _time(root, "lazy_tool.py", ["--bash-completion"], env, 1)
+
+    for label, args in (
+        ("completion", ["--bash-completion"]),
+        ("command help", ["command-0-0", "--help"]),
+    ):
+      eager = _time(root, "eager_tool.py", args, env, runs)
+      lazy = _time(root, "lazy_tool.py", args, env, runs)
+      print(
+          "%s: eager import %.1fms, manifest %.1fms (%.1fx)"
+          % (label, eager * 1e3, lazy * 1e3, eager / lazy)
+      )
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:]])
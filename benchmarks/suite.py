@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite covering startup, parsing, command lookup and output, writing
+machine readable results so runs can be compared.
+
+  python -m benchmarks.suite [--quick] [--output results.json] [--baseline old.json]
+
+Results are a JSON document with a `results` list of `{"name", "value",
+"unit"}`, where lower values are better. With `--baseline` every result is
+compared to the same one in an earlier run, and it exits with status 1 if any
+is slower by more than `--threshold`. It also exits with status 1 if a
+result is over its entry in `BUDGETS`.
+
+`example/example.py` is used as the realistic tool for startup and
+`Tooler.parse_command`, alongside synthetic signatures and tools.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+from tooler import DefaultParser, Tooler, __version__
+from tooler.output import output_default
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE = os.path.join(ROOT, "example", "example.py")
+
+# Upper limits for results, whatever the baseline. Import time keeps headroom
+# for slower machines; the module count is also checked by the tests.
+BUDGETS = {
+    "import.seconds": 0.05,
+    "import.modules": 60,
+}
+
+IMPORT_SCRIPT = """
+import json, sys, time
+before = len(sys.modules)
+start = time.perf_counter()
+import tooler
+print(json.dumps([time.perf_counter() - start, len(sys.modules) - before]))
+"""
+
+
+def _per_call(fn, number):
+  return min(timeit.repeat(fn, number=number, repeat=3)) / number
+
+
+def _run_python(args, runs):
+  env = dict(os.environ, PYTHONPATH=ROOT)
+  best = None
+  for _ in range(runs):
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, *args], env=env, check=True, stdout=subprocess.PIPE
+    )
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return (best, process.stdout)
+
+
+def bench_import(quick):
+  runs = 3 if quick else 10
+  samples = [json.loads(_run_python(["-c", IMPORT_SCRIPT], 1)[1]) for _ in range(runs)]
+  (example, _) = _run_python([EXAMPLE, "json"], runs)
+  yield ("import.seconds", min(seconds for (seconds, _) in samples), "s")
+  yield ("import.modules", samples[0][1], "modules")
+  yield ("import.example_json_command", example, "s")
+
+
+def _load_example():
+  spec = importlib.util.spec_from_file_location("tooler_example", EXAMPLE)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+
+def _synthetic(params):
+  """A command with `params` parameters of mixed kinds, and argv setting them all"""
+  (required, optional) = ([], [])
+  (positional, argv) = ([], [])
+  for idx in range(params):
+    kind = idx % 4
+    if kind == 0:
+      required.append("p%d" % idx)
+      positional.append("value-%d" % idx)
+    elif kind == 1:
+      optional.append("p%d=%d" % (idx, idx))
+      argv.append("--p%d=%d" % (idx, idx * 2))
+    elif kind == 2:
+      optional.append("p%d=False" % idx)
+      argv.append("--p%d" % idx)
+    else:
+      optional.append("p%d=1.5" % idx)
+      argv += ["--p%d" % idx, "2.5"]
+  namespace = {}
+  exec("def command(%s):\n  pass\n" % ", ".join(required + optional), namespace)
+  return (namespace["command"], positional + argv)
+
+
+def bench_parse(quick):
+  number = 200 if quick else 2000
+  for params in (1, 10, 100, 500):
+    (command, argv) = _synthetic(params)
+    parser = DefaultParser()
+    calls = max(1, number // params)
+    elapsed = _per_call(lambda: parser.parse(command, None, None, argv), calls)
+    yield ("parse.params_%d" % params, elapsed * 1e6, "us")
+
+  example = _load_example().tooler
+  # The example has a default command, so tooler arguments would go to it
+  argv = ["options", "a", "b", "--three=5", "-F"]
+  elapsed = _per_call(lambda: example.parse_command(argv), number * 10)
+  yield ("parse_command.example", elapsed * 1e6, "us")
+
+  command = example.commands["options"]
+  argv = argv[1:]
+  elapsed = _per_call(lambda: command.parser.parse(command.fn, None, None, argv), number * 10)
+  yield ("parse.example_options", elapsed * 1e6, "us")
+
+
+def bench_commands(quick):
+  sizes = (10, 100, 1000) if quick else (10, 100, 1000, 10000)
+  for commands in sizes:
+    tooler = Tooler()
+    for idx in range(commands):
+      tooler.add_command("service-%d-deploy" % idx, None)
+    number = max(1, 10000 // commands)
+
+    elapsed = _per_call(lambda: tooler.usage(output=False), number)
+    yield ("usage.commands_%d" % commands, elapsed * 1e6, "us")
+    elapsed = _per_call(lambda: tooler.index.complete("service-4"), number)
+    yield ("complete.commands_%d" % commands, elapsed * 1e6, "us")
+    elapsed = _per_call(
+        lambda: tooler.usage(search_command="service-4-deplyo", output=False), number
+    )
+    yield ("suggest.commands_%d" % commands, elapsed * 1e6, "us")
+
+
+def bench_output(quick):
+  records = 10000 if quick else 100000
+  result = [
+      {
+          "id": idx,
+          "host": "host-%d.example.com" % idx,
+          "tags": ["web", "prod", "zone-%d" % (idx % 7)],
+          "metrics": {"cpu": idx * 0.01, "mem": idx * 1024, "up": idx % 3 != 0},
+      }
+      for idx in range(records)
+  ]
+
+  with open(os.devnull, "w") as devnull:
+    for output_format in (None, "json", "ndjson", "tsv"):
+      with contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        output_default(result, format=output_format)
+        elapsed = time.perf_counter() - start
+      yield ("output.%s" % (output_format or "default"), elapsed / records * 1e6, "us/record")
+
+
+BENCHMARKS = {
+    "import": bench_import,
+    "parse": bench_parse,
+    "commands": bench_commands,
+    "output": bench_output,
+}
+
+
+def compare(results, baseline, threshold):
+  """Print each result against `baseline`, returning the names that regressed"""
+  previous = {result["name"]: result["value"] for result in baseline["results"]}
+  regressions = []
+  for result in results:
+    before = previous.get(result["name"])
+    if not before:
+      continue
+    ratio = result["value"] / before
+    flag = ""
+    if ratio > threshold:
+      regressions.append(result["name"])
+      flag = "  REGRESSION"
+    print("%-36s %10.3f -> %10.3f %s (%.2fx)%s" % (
+        result["name"], before, result["value"], result["unit"], ratio, flag))
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Tooler benchmark suite")
+  parser.add_argument("--quick", action="store_true", help="Smaller sizes and fewer runs")
+  parser.add_argument("--output", help="Write results as JSON to this path")
+  parser.add_argument("--baseline", help="Compare against results from an earlier run")
+  parser.add_argument(
+      "--threshold", type=float, default=1.25, help="Slowdown ratio counted as a regression"
+  )
+  parser.add_argument("benchmarks", nargs="*", help="Parts to run: %s" % ", ".join(BENCHMARKS))
+  options = parser.parse_args(argv)
+  for name in options.benchmarks:
+    if name not in BENCHMARKS:
+      parser.error("Unknown benchmark: %s" % name)
+
+  results = []
+  for name in options.benchmarks or BENCHMARKS:
+    for (result, value, unit) in BENCHMARKS[name](options.quick):
+      results.append({"name": result, "value": value, "unit": unit})
+      if not options.baseline:
+        print("%-36s %12.3f %s" % (result, value, unit))
+
+  document = {
+      "tooler": __version__,
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "quick": options.quick,
+      "time": time.time(),
+      "results": results,
+  }
+  if options.output:
+    with open(options.output, "w") as f:
+      json.dump(document, f, indent=2)
+
+  over = [
+      result["name"]
+      for result in results
+      if result["name"] in BUDGETS and result["value"] > BUDGETS[result["name"]]
+  ]
+  for name in over:
+    print("%s is over its budget of %s" % (name, BUDGETS[name]))
+
+  regressions = []
+  if options.baseline:
+    with open(options.baseline) as f:
+      baseline = json.load(f)
+    regressions = compare(results, baseline, options.threshold)
+
+  if over or regressions:
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -1,7 +1,21 @@
+import array
+import io
+import dataclasses
+import enum
+import ipaddress
 import shlex
+from datetime import datetime, timedelta
 from functools import partial
+from pathlib import Path
+from typing import List, Literal, Optional, Union
 
-from tooler import DefaultParser, RawParser
+import pytest
+
+from tooler import ByteSize, DefaultParser, RawParser, register_converter
+from tooler import converters
+from tooler.arrays import FloatArray, IntArray
+from tooler.command import _close_arguments
+from tooler.exceptions import CommandParseException
 
 def parse(fn, command, parser=None, parser_factory=DefaultParser):
     if parser is None:
@@ -69,6 +83,247 @@ class TestDefaultParser:
         #assert parse(negated, '--good') == ((), dict(no_good=False))
         assert parse(negated, '--no-good') == ((), dict(no_good=True))
 
+    def test_plan_is_reused(self):
+        def fn(one, two=2, flag=False):
+            pass
+
+        parser = DefaultParser(shorthands={'f': 'flag'})
+        assert parse(fn, 'a --two=3 -f', parser=parser) == (('a',), dict(two=3, flag=True))
+        plan = parser.plan(fn)
+        assert parse(fn, 'b --no-flag', parser=parser) == (('b',), dict(two=2, flag=False))
+        assert parser.plan(fn) is plan
+        assert parser.usage(fn) == (
+            'Usage:\n'
+            '  --one         required\n'
+            '  --two         default 2\n'
+            '  -f, --flag    default no'
+        )
+
+    def test_bulk_lists(self, tmp_path):
+        def ints(*ids: List[int]):
+            pass
+
+        def paths(*paths: List[Path]):
+            pass
+
+        def array_ids(ids: IntArray, scale: FloatArray = None):
+            pass
+
+        assert parse(ints, '1 2 3') == ((1, 2, 3), {})
+        assert parse(paths, 'a b') == ((Path('a'), Path('b')), {})
+
+        (args, kv) = parse(array_ids, '4 5 6')
+        assert args == (array.array('q', [4, 5, 6]),) and kv == dict(scale=None)
+        (args, kv) = parse(array_ids, '7 --scale=0.5')
+        assert args == (array.array('q', [7]),)
+        assert kv == dict(scale=array.array('d', [0.5]))
+
+        argsfile = tmp_path / 'ids'
+        argsfile.write_text('10\n11\n')
+        assert parse(ints, '1 @%s' % argsfile) == ((1, 10, 11), {})
+
+        # A value that is not valid is named, wherever it came from
+        argsfile.write_text('10\nx\n')
+        for (fn, command) in [
+            (ints, '1 @%s' % argsfile),
+            (array_ids, '1 @%s' % argsfile),
+            (ints, '1 x'),
+        ]:
+            with pytest.raises(CommandParseException) as e:
+                parse(fn, command)
+            assert str(e.value).startswith("Argument not valid: 'x'")
+
+        def names(*names: List[str]):
+            pass
+
+        def mention(*users):
+            pass
+
+        def single(name):
+            pass
+
+        assert parse(names, '@@user') == (('@user',), {})
+        # Commands without lists of values take "@" arguments as they are, as
+        # does a plain `*args`
+        assert parse(single, '@user') == (('@user',), {})
+        assert parse(mention, '@alice @bob') == (('@alice', '@bob'), {})
+
+        with pytest.raises(CommandParseException) as e:
+            parse(array_ids, '--scale=0.5')
+        assert str(e.value).startswith('No value provided for required argument: ids')
+
+    def test_argsfiles(self, tmp_path, monkeypatch):
+        def names(*names: List[str]):
+            pass
+
+        def first(name, *rest: List[str]):
+            pass
+
+        argsfile = tmp_path / 'names'
+        argsfile.write_bytes(b'a b\0c\nd\0')
+        assert parse(names, '@%s' % argsfile) == (('a b', 'c\nd'), {})
+        assert parse(first, '@%s' % argsfile) == (('a b', 'c\nd'), {})
+
+        with pytest.raises(CommandParseException):
+            parse(names, '@%s' % (tmp_path / 'missing'))
+
+        # Fan-out targets are read as they are used
+        def ping(host: int):
+            pass
+
+        argsfile.write_text('1\n2\n3\n')
+        (args, kv) = DefaultParser(fan_out=True).parse(
+            ping, 'ping', None, ['@%s' % argsfile])
+        assert not isinstance(args[0], list)
+        assert list(args[0]) == [1, 2, 3]
+
+        # Targets that are not valid are reported as they are taken
+        argsfile.write_text('1\nx\n')
+        (args, kv) = DefaultParser(fan_out=True).parse(
+            ping, 'ping', None, ['@%s' % argsfile])
+        assert next(args[0]) == 1
+        with pytest.raises(CommandParseException) as e:
+            next(args[0])
+        assert str(e.value).startswith("Argument not valid: 'x'")
+
+        # Closing the arguments closes an argsfile that was never read
+        opened = []
+        monkeypatch.setattr(
+            'builtins.open', lambda *a, **kw: opened.append(io.open(*a, **kw)) or opened[-1])
+        (args, kv) = DefaultParser(fan_out=True).parse(
+            ping, 'ping', None, ['@%s' % argsfile])
+        _close_arguments(args, kv)
+        assert opened and opened[0].closed
+
+    def test_converters(self):
+        class Color(enum.Enum):
+            LIGHT_RED = 'lr'
+            BLUE = 'b'
+
+        def fn(
+            color: Color = Color.BLUE,
+            when: Optional[datetime] = None,
+            every: timedelta = timedelta(minutes=1),
+            size: ByteSize = ByteSize(0),
+            address: ipaddress.IPv4Address = None,
+            port: Union[int, Literal['any']] = 'any',
+            mode: Literal['fast', 'slow'] = 'fast',
+        ):
+            pass
+
+        assert parse(fn, '') == ((), {
+            'color': Color.BLUE, 'when': None, 'every': timedelta(minutes=1),
+            'size': 0, 'address': None, 'port': 'any', 'mode': 'fast',
+        })
+        (_, kv) = parse(
+            fn,
+            '--color=light-red --when=2024-01-02T03:04:05Z --every=1h30m '
+            '--size=1.5MiB --address=10.0.0.1 --port=8080 --mode=slow',
+        )
+        assert kv['color'] is Color.LIGHT_RED
+        assert kv['when'].isoformat() == '2024-01-02T03:04:05+00:00'
+        assert kv['every'] == timedelta(hours=1, minutes=30)
+        assert kv['size'] == 1572864 and isinstance(kv['size'], ByteSize)
+        assert kv['address'] == ipaddress.IPv4Address('10.0.0.1')
+        assert (kv['port'], kv['mode']) == (8080, 'slow')
+
+        assert parse(fn, '--color=lr --every=90 --size=10kB')[1]['size'] == 10000
+        assert parse(fn, '--every=1:02:03')[1]['every'] == timedelta(seconds=3723)
+
+        for (argument, message) in [
+            ('--color=green', "Argument not valid: 'green' (allowed are light-red, blue)"),
+            ('--every=soon', "Argument not valid: 'soon' (expected a duration such as 90s or 1h30m)"),
+            ('--address=10.0.0', "Argument not valid: '10.0.0' (expected an IPv4 address)"),
+            ('--port=http', "Argument not valid: 'http' (expected one of int, Literal['any'])"),
+            ('--mode=medium', "Argument not valid: 'medium' (allowed are 'fast', 'slow')"),
+        ]:
+            with pytest.raises(CommandParseException) as e:
+                parse(fn, argument)
+            assert str(e.value) == message
+
+    def test_register_converter(self, monkeypatch):
+        class Version(tuple):
+            pass
+
+        # Registered into a copy, so it does not leak into other tests
+        monkeypatch.setattr(converters, 'CONVERTERS', dict(converters.CONVERTERS))
+        register_converter(Version, lambda value: Version(map(int, value.split('.'))))
+
+        def fn(version: Version, *versions: List[Version]):
+            pass
+
+        assert parse(fn, '1.2 3.4.5') == (((1, 2), (3, 4, 5)), {})
+        assert isinstance(parse(fn, '1.2')[0][0], Version)
+
+    def test_dataclasses(self):
+        @dataclasses.dataclass
+        class Database:
+            host: str
+            port: int = 5432
+            ssl: bool = False
+
+        @dataclasses.dataclass
+        class Config:
+            db: Database
+            name: str = 'app'
+            timeout: timedelta = timedelta(seconds=10)
+
+        def fn(config: Config, verbose=False):
+            pass
+
+        assert parse(
+            fn, '--config.db.host=localhost --config.db.port 6543 --config.db.ssl --verbose'
+        ) == ((Config(Database('localhost', 6543, True)),), {'verbose': True})
+        assert parse(fn, '--config.db.host=h --config.timeout=1m') == (
+            (Config(Database('h'), timeout=timedelta(minutes=1)),), {'verbose': False}
+        )
+        assert parse(fn, '\'{"db": {"host": "h", "port": "1"}, "name": "x"}\'') == (
+            (Config(Database('h', 1), name='x'),), {'verbose': False}
+        )
+
+        for (argument, message) in [
+            ('--config.name=x', 'No value provided for required argument: config.db.host'),
+            ('--config.db.user=x', 'Unknown field: config.db.user'),
+            ('--config.db.port=x --config.db.host=h', "invalid literal for int() with base 10: 'x'"),
+        ]:
+            with pytest.raises((CommandParseException, ValueError)) as e:
+                parse(fn, argument)
+            assert str(e.value) == message
+
+
+    def test_string_annotations(self, tmp_path, monkeypatch):
+        (tmp_path / 'string_annotations_commands.py').write_text(
+            'from __future__ import annotations\n'
+            'from datetime import timedelta\n'
+            'from typing import TYPE_CHECKING, List\n'
+            'from tooler.arrays import IntArray\n'
+            'if TYPE_CHECKING:\n'
+            '    from decimal import Decimal\n'
+            'def resolved(count: int, every: timedelta, *ids: List[int], dry_run: bool):\n'
+            '    pass\n'
+            'def arrays(ids: IntArray):\n'
+            '    pass\n'
+            'def unresolved(price: Decimal = 1.5, count: Decimal = 2):\n'
+            '    pass\n'
+            'def mixed(count: int, flag: bool, price: Decimal = None):\n'
+            '    pass\n'
+        )
+        monkeypatch.syspath_prepend(str(tmp_path))
+        import string_annotations_commands as module
+
+        assert parse(module.resolved, '2 90 3 4 --dry-run') == (
+            (2, timedelta(seconds=90), 3, 4), {'dry_run': True}
+        )
+        (args, kv) = parse(module.arrays, '1 2')
+        assert args == (array.array('q', [1, 2]),)
+        # Annotations that cannot be resolved fall back to the default's type
+        assert parse(module.unresolved, '--price=2.5 --count=3') == (
+            (), {'price': 2.5, 'count': 3}
+        )
+        # and do not keep the others from being resolved
+        assert parse(module.mixed, '3 --flag') == ((3,), {'flag': True, 'price': None})
+
+
 class TestRawParser:
 
     def test_basic(self):
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from tooler import Tooler
+
+
+def square(value: int, offset=0):
+  return value * value + offset
+
+
+def test_fan_out_selector_and_args():
+  tooler = Tooler()
+  tooler.command(fan_out=True)(square)
+
+  assert list(tooler.run(["square", "1", "2", "--offset=1"], output=None)) == [
+      {"target": 1, "result": 2},
+      {"target": 2, "result": 5},
+  ]
+  assert list(tooler.run(["--parallel", "4", "square:3,4", "5"], output=None)) == [
+      {"target": 3, "result": 9},
+      {"target": 4, "result": 16},
+      {"target": 5, "result": 25},
+  ]
+
+
+def test_fan_out_process_executor():
+  tooler = Tooler()
+  tooler.command(fan_out=True)(square)
+
+  rv = tooler.run(["--executor=process", "--parallel=2", "square", "6", "7"], output=None)
+  assert list(rv) == [{"target": 6, "result": 36}, {"target": 7, "result": 49}]
+
+
+def test_fan_out_errors_and_timeouts():
+  tooler = Tooler()
+
+  @tooler.command(fan_out=True)
+  def check(target):
+    if target == "bad":
+      raise ValueError("bad target")
+    if target == "slow":
+      time.sleep(0.5)
+    return target
+
+  assert list(tooler.run(
+      ["--parallel=3", "--target-timeout=0.1", "check", "ok", "bad", "slow"], output=None
+  )) == [
+      {"target": "ok", "result": "ok"},
+      {"target": "bad", "error": "ValueError: bad target"},
+      {"target": "slow", "error": "TimeoutError: Timed out after 0.1s"},
+  ]
+
+  # Streamed to the output, a failed target still fails the command
+  records = []
+  assert tooler.run(["check", "ok", "bad"], output=records.extend) is False
+  assert tooler.run(["check", "ok"], output=records.extend) is None
+  assert len(records) == 3
+
+  batch = []
+  assert tooler.run_batch([["check", "ok"], ["check", "bad"]], output=batch.append) is False
+  assert [(record["status"], len(record["result"])) for record in batch] == [(0, 1), (1, 1)]
+
+  try:
+    list(tooler.run(["--fail-fast", "check", "ok", "bad"], output=None))
+  except ValueError as e:
+    assert str(e) == "bad target"
+  else:
+    raise AssertionError("Expected fail-fast to raise")
+
+
+def test_fan_out_async():
+  tooler = Tooler()
+  running = []
+
+  @tooler.command(fan_out=True)
+  async def ping(target):
+    running.append(target)
+    await asyncio.sleep(0.05)
+    assert len(running) <= 2
+    running.remove(target)
+    return target
+
+  rv = tooler.run(["--parallel=2", "ping", "a", "b", "c"], output=None)
+  assert rv == [{"target": "a", "result": "a"}, {"target": "b", "result": "b"}, {"target": "c", "result": "c"}]
@@ -0,0 +1,154 @@
+import io
+import mmap
+import subprocess
+import sys
+from pathlib import Path
+
+from tooler import MappedFile, StreamInput, Tooler
+from tooler.exceptions import CommandParseException
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_mapped_arguments(tmp_path):
+  tooler = Tooler()
+  seen = {}
+
+  @tooler.command
+  def mapped(data: MappedFile):
+    seen["data"] = data
+    return [data.mapped, len(data), bytes(data[2:5]), [bytes(c) for c in data.chunks(4)]]
+
+  @tooler.command
+  def raw(data: mmap.mmap, view: memoryview):
+    seen["raw"] = (data, view)
+    return [data[:3], view[-3:].tobytes(), view.readonly]
+
+  path = tmp_path / "data"
+  path.write_bytes(b"0123456789")
+
+  assert tooler.run(["mapped", str(path)], output=None) == [
+      True, 10, b"234", [b"0123", b"4567", b"89"],
+  ]
+  assert tooler.run(["raw", str(path), str(path)], output=None) == [b"012", b"789", True]
+
+  # Everything is closed once the command completes
+  assert seen["data"]._map is None
+  assert seen["raw"][0].closed
+  try:
+    seen["raw"][1].tobytes()
+  except ValueError:
+    pass
+  else:
+    raise AssertionError("Expected the memoryview to be released")
+
+
+TOOL = """
+import mmap
+from tooler import MappedFile, StreamInput, Tooler
+tooler = Tooler()
+
+@tooler.command
+def lines(data: MappedFile):
+  return [data.mapped, [line.decode() for line in data.lines()]]
+
+@tooler.command
+def size(data: mmap.mmap):
+  return len(data)
+
+tooler.main()
+"""
+
+
+def test_mapped_stdin(tmp_path):
+  tool = tmp_path / "tool.py"
+  tool.write_text(TOOL)
+
+  def run(*args, **kv):
+    return subprocess.run(
+        [sys.executable, str(tool), "--output-format=json", *args],
+        stdout=subprocess.PIPE,
+        env={"PYTHONPATH": str(ROOT)},
+        **kv,
+    ).stdout
+
+  assert run("lines", "-", input=b"a\nb\n") == b'[false,["a\\n","b\\n"]]\n'
+  assert run("size", "-", input=b"abc") == b"3\n"
+
+  path = tmp_path / "data"
+  path.write_bytes(b"x\ny")
+  with open(path, "rb") as f:
+    assert run("lines", "-", stdin=f) == b'[true,["x\\n","y"]]\n'
+
+
+def test_stream_input(tmp_path):
+  import bz2
+  import gzip
+  import lzma
+
+  tooler = Tooler()
+
+  @tooler.command
+  def lines(data: StreamInput):
+    return [line.decode() for line in data]
+
+  @tooler.command
+  def chunks(data: StreamInput, size: int = 4):
+    return [bytes(chunk) for chunk in data.chunks(size)]
+
+  contents = b"first\nsecond\nthird"
+  for (suffix, compress) in [
+      ("", bytes),
+      (".gz", gzip.compress),
+      (".bz2", bz2.compress),
+      (".xz", lzma.compress),
+  ]:
+    path = tmp_path / ("data" + suffix)
+    path.write_bytes(compress(contents))
+    assert tooler.run(["lines", str(path)], output=None) == ["first\n", "second\n", "third"]
+    assert tooler.run(["chunks", str(path), "--size=5"], output=None) == [
+        b"first", b"\nseco", b"nd\nth", b"ird",
+    ]
+
+  # Stopping early must not leave the reader stuck
+  big = tmp_path / "big"
+  big.write_bytes(b"line\n" * 200000)
+  with StreamInput.open(str(big)) as stream:
+    stream.chunk_size = 1024
+    assert next(iter(stream)) == b"line\n"
+
+
+class _Trickle(io.RawIOBase):
+  """A pipe that has a byte available at a time"""
+
+  def __init__(self, data):
+    self.data = data
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    if not self.data:
+      return 0
+    buffer[0] = self.data[0]
+    self.data = self.data[1:]
+    return 1
+
+
+def test_stream_input_detection(monkeypatch):
+  import gzip
+
+  contents = b"first\nsecond\n"
+  with StreamInput(io.BufferedReader(_Trickle(gzip.compress(contents)))) as stream:
+    assert stream.read() == contents
+  with StreamInput(io.BufferedReader(_Trickle(b"abc"))) as stream:
+    assert stream.read() == b"abc"
+
+  # Compressed input is not passed on as it is without a decompressor
+  monkeypatch.setitem(sys.modules, "zstandard", None)
+  try:
+    StreamInput(io.BufferedReader(io.BytesIO(b"\x28\xb5\x2f\xfd" + b"\0" * 8)))
+  except CommandParseException as e:
+    assert str(e) == "Reading zstd compressed input needs zstandard installed"
+  else:
+    raise AssertionError("Expected zstd input to be refused")
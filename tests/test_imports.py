@@ -0,0 +1,56 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Importing tooler, registering commands and answering usage or completion
+# should stay within this many newly imported modules
+MODULE_BUDGET = 60
+
+# Modules only some paths need, which must not be imported up front
+DEFERRED = [
+    "asyncio",
+    "concurrent.futures",
+    "dataclasses",
+    "hashlib",
+    "inspect",
+    "pathlib",
+    "socket",
+    "tempfile",
+    "threading",
+    "typing",
+]
+
+SCRIPT = """
+import json, sys
+before = set(sys.modules)
+
+from tooler import Tooler
+
+tooler = Tooler()
+
+@tooler.command(shorthands={"v": "verbose"})
+def deploy(host, port: int = 22, verbose=False):
+  pass
+
+tooler.lazy_command("lazy", "os:getcwd")
+tooler.usage(output=False)
+tooler.index.complete("de")
+tooler.parse_command(["deploy", "host"])
+
+print(json.dumps(sorted(set(sys.modules) - before)))
+"""
+
+
+def test_import_footprint():
+  env = dict(os.environ, PYTHONPATH=str(ROOT))
+  process = subprocess.run(
+      [sys.executable, "-c", SCRIPT], env=env, check=True, stdout=subprocess.PIPE
+  )
+  imported = json.loads(process.stdout)
+
+  assert [module for module in DEFERRED if module in imported] == []
+  assert len(imported) <= MODULE_BUDGET, imported
@@ -0,0 +1,210 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+from tooler import Tooler
+from tooler.clide import ansi
+from tooler.colorize import Colorizer, output_pretty
+from tooler import output as output_module
+from tooler.output import SERIALIZERS, dumps, output_default, output_json
+from tooler.writer import StatusChannel, Writer
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_formats(capsys):
+  rows = [{"name": "a", "tags": ["x"]}, {"name": "b,c", "extra": 1}]
+
+  output_default(rows, format="json")
+  assert capsys.readouterr().out == '[{"name":"a","tags":["x"]},{"name":"b,c","extra":1}]\n'
+
+  output_default(rows, format="ndjson")
+  assert capsys.readouterr().out == '{"name":"a","tags":["x"]}\n{"name":"b,c","extra":1}\n'
+
+  output_default(rows, format="csv")
+  assert capsys.readouterr().out == 'name,tags,extra\na,"[""x""]",\n"b,c",,1\n'
+
+  output_default(iter_rows(rows), format="tsv")
+  assert capsys.readouterr().out == 'name\ttags\na\t["x"]\nb,c\t\n'
+
+  output_default(iter_rows(rows), format="json")
+  assert json.loads(capsys.readouterr().out) == rows
+
+
+def iter_rows(rows):
+  yield from rows
+
+
+def test_serializers_agree():
+  body = {"b": [1, 2.5, None, True], "a": {"nested": "ünïcode"}, "c": 2 ** 70}
+  for serializer in SERIALIZERS.values():
+    try:
+      assert json.loads(serializer(body, False)) == body
+      assert serializer(body, True) == SERIALIZERS["json"](body, True)
+    except (ImportError, TypeError):
+      # Not installed, or needs the standard library fallback
+      pass
+  assert json.loads(dumps(body)) == body
+
+
+def test_unknown_serializer(capsys, monkeypatch):
+  monkeypatch.setenv("TOOLER_JSON_SERIALIZER", "simdjson")
+  monkeypatch.setattr(output_module, "_serializer", None)
+
+  assert dumps([1]) == b"[1]"
+  assert dumps([2]) == b"[2]"
+  # Warned about once, and a serializer that is installed is used instead
+  err = capsys.readouterr().err
+  assert err.count("Unknown $TOOLER_JSON_SERIALIZER 'simdjson', expected one of json,") == 1
+
+
+def test_output_format_argument(capsys):
+  tooler = Tooler()
+
+  @tooler.command
+  def hosts():
+    return [{"host": "a", "up": True}]
+
+  tooler.run(["--output-format=csv", "hosts"])
+  assert capsys.readouterr().out == "host,up\na,True\n"
+
+  assert tooler.run(["--output-format=xml", "hosts"]) is False
+  assert "Unknown output format 'xml'" in capsys.readouterr().err
+
+
+def test_writer():
+  (read_fd, write_fd) = os.pipe()
+  received = []
+
+  def read():
+    while True:
+      chunk = os.read(read_fd, 1 << 16)
+      if not chunk:
+        break
+      received.append(chunk)
+
+  reader = threading.Thread(target=read)
+  reader.start()
+  with open(write_fd, "wb", buffering=0) as stream:
+    writer = Writer(stream, chunk_size=1 << 18)
+    writer.write(b"small")
+    assert writer._parts == [b"small"]
+
+    # More than a pipe holds, so the kernel takes it in partial writes
+    parts = [b"x" * 100000, b"y" * 300000, b"\n"]
+    for part in parts:
+      writer.write(part)
+    assert writer._parts == [b"\n"]
+    writer.flush()
+    assert writer._parts == []
+
+  reader.join()
+  os.close(read_fd)
+  assert b"".join(received) == b"small" + b"".join(parts)
+
+
+def test_status_channel(capsys):
+  status = StatusChannel()
+  status.write("partial")
+  assert capsys.readouterr().err == ""
+  status.write(" line\nnext")
+  assert capsys.readouterr().err == "partial line\n"
+
+  with status.batch():
+    status.write(" line\n")
+    status.write("last\n")
+    assert capsys.readouterr().err == ""
+  assert capsys.readouterr().err == "next line\nlast\n"
+
+  status.warn("careful")
+  message = ansi.format_message(ansi.yellow(bold=True), "WARN", "careful")
+  assert capsys.readouterr().err == message + "\n"
+
+  # A partial line left at exit is still written
+  env = dict(os.environ, PYTHONPATH=str(ROOT))
+  process = subprocess.run(
+      [sys.executable, "-c", "from tooler.writer import status; status.write('partial')"],
+      env=env,
+      stderr=subprocess.PIPE,
+  )
+  assert process.stderr == b"partial"
+
+
+BROKEN_PIPE_SCRIPT = """
+from tooler import Tooler
+
+tooler = Tooler()
+
+@tooler.command
+def rows():
+  for idx in range(1000000):
+    yield {"row": idx}
+
+tooler.main()
+"""
+
+
+def test_broken_pipe():
+  env = dict(os.environ, PYTHONPATH=str(ROOT))
+  process = subprocess.Popen(
+      [sys.executable, "-c", BROKEN_PIPE_SCRIPT, "--output-format=ndjson", "rows"],
+      env=env,
+      stdout=subprocess.PIPE,
+      stderr=subprocess.PIPE,
+  )
+  # Like `| head -n 1`
+  assert json.loads(process.stdout.readline()) == {"row": 0}
+  process.stdout.close()
+
+  assert process.stderr.read() == b""
+  assert process.wait() == 141
+
+
+def uncolored(text):
+  return re.sub("\x1b\\[[0-9;]*m", "", text)
+
+
+def test_colorize():
+  body = {
+      "b": [1, 2.5, float("inf"), None, True, "t\u00ebxt \"q\"\n"],
+      "a": {"nested": {}, "empty": [], "c": (False,)},
+  }
+  text = "".join(Colorizer().tokens(body))
+  assert "\x1b[" in text
+  assert uncolored(text) == json.dumps(body, sort_keys=True, indent=2, ensure_ascii=False)
+
+  text = uncolored("".join(Colorizer(max_items=2).tokens({"rows": list(range(5))})))
+  assert text == '{\n  "rows": [\n    0,\n    1,\n    // 3 more\n  ]\n}'
+
+
+def test_output_pretty(capsys, monkeypatch, tmp_path):
+  rows = [{"row": idx} for idx in range(100)]
+  monkeypatch.setenv("TOOLER_PAGER", "")
+
+  output_pretty(rows)
+  assert json.loads(uncolored(capsys.readouterr().out)) == rows
+
+  # Over the threshold without a pager, the rest is summarized
+  output_pretty(rows, threshold=100)
+  captured = capsys.readouterr()
+  assert uncolored(captured.out).count('"row"') == 20
+  assert "// 80 more" in uncolored(captured.out)
+  assert "summarized" in captured.err
+
+  paged = tmp_path / "paged"
+  monkeypatch.setenv("TOOLER_PAGER", "sh -c 'cat > %s'" % paged)
+  output_pretty(rows, threshold=100)
+  assert capsys.readouterr().out == ""
+  assert json.loads(uncolored(paged.read_text())) == rows
+
+
+def test_output_json(capsys, monkeypatch):
+  monkeypatch.setattr(sys.stdout, "isatty", lambda: True)
+  # The body is colored as it is, without parsing the string back
+  monkeypatch.setattr(json, "loads", None)
+  output_json('{"a":[1]}', body={"a": [1]})
+  assert uncolored(capsys.readouterr().out) == '{\n  "a": [\n    1\n  ]\n}\n'
@@ -0,0 +1,95 @@
+import io
+
+from tooler import Progress, Tooler
+from tooler import progress as progress_module
+from tooler.writer import status
+
+
+def test_progress_argument():
+  tooler = Tooler()
+  seen = {}
+
+  @tooler.command
+  def crunch(count: int, progress: Progress, verbose=False):
+    seen["progress"] = progress
+    with progress.task("rows", total=count) as rows:
+      for _ in rows.track(range(count)):
+        pass
+      seen["line"] = rows.line()
+    return rows.count
+
+  assert tooler.run(["crunch", "3"], output=None) == 3
+  assert seen["line"].startswith("rows  [####################]  3/3  100%")
+  # Finished with the command
+  assert seen["progress"]._renderer is None
+  assert "progress" not in tooler.commands["crunch"].usage()
+
+  @tooler.command
+  def keyword(progress: Progress, *, name="x"):
+    return [isinstance(progress, Progress), name]
+
+  assert tooler.run(["keyword", "--name=y"], output=None) == [True, "y"]
+
+  # Annotations written as strings are resolved first
+  @tooler.command
+  def quoted(progress: "Progress | None", name):
+    return [isinstance(progress, Progress), name]
+
+  assert tooler.run(["quoted", "z"], output=None) == [True, "z"]
+
+
+def test_progress_rendering(monkeypatch):
+  # Drawn here rather than by the background thread
+  monkeypatch.setattr(progress_module, "REFRESH_INTERVAL", 3600)
+  stream = io.StringIO()
+  progress = Progress(stream, interactive=True)
+
+  outer = progress.task("outer", total=4)
+  inner = outer.task("inner")
+  for _ in range(1000):
+    inner.advance()
+  outer.count = 2
+  progress._renderer.draw()
+
+  drawn = stream.getvalue()
+  assert "outer  [##########..........]  2/4  50%" in drawn
+  assert "\n  inner  1,000  " in drawn
+
+  inner.done()
+  outer.done()
+  progress.close()
+  # The live lines are cleared, leaving a line for the finished task
+  last = stream.getvalue().split("\x1b[2K")[-1]
+  assert last.startswith("outer  [##########..........]  2/4  50%")
+  assert last.endswith(" in 0:00\n")
+
+
+def test_progress_log_lines(monkeypatch, capsys):
+  monkeypatch.setattr(progress_module, "LOG_INTERVAL", 3600)
+  progress = Progress(io.StringIO(), interactive=False)
+
+  task = progress.task("files")
+  task.advance(5)
+  progress._renderer.log()
+  progress.close()
+
+  lines = capsys.readouterr().err.splitlines()
+  assert len(lines) == 2
+  assert all("files  5  " in line for line in lines)
+  assert " in 0:00" in lines[-1]
+
+
+def test_progress_live_once(monkeypatch):
+  monkeypatch.setattr(progress_module, "REFRESH_INTERVAL", 3600)
+  first = Progress(io.StringIO(), interactive=True)
+  second = Progress(io.StringIO(), interactive=True)
+  first.task("one")
+  second.task("two")
+
+  # Only the first draws live lines, the second logs instead
+  assert status.live is first._renderer
+  assert not second._renderer.interactive
+  second.close()
+  assert status.live is first._renderer
+  first.close()
+  assert status.live is None
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+TOOL = """
+import io, sys
+from tooler import Tooler
+
+tooler = Tooler()
+
+@tooler.command
+def echo(data: io.BytesIO):
+  sys.stdout.write(data.read().decode("utf8").upper())
+
+@tooler.command
+def cwd():
+  print(__import__("os").getcwd())
+
+@tooler.command
+def fail(code=3):
+  sys.exit(code)
+
+tooler.main()
+"""
+
+
+def test_server(tmp_path):
+  tool = tmp_path / "tool.py"
+  tool.write_text(TOOL)
+  socket_path = str(tmp_path / "tool.sock")
+  env = dict(os.environ, PYTHONPATH=str(ROOT))
+
+  server = subprocess.Popen([sys.executable, str(tool), "--serve", socket_path], env=env)
+  try:
+    for _ in range(100):
+      if os.path.exists(socket_path):
+        break
+      time.sleep(0.05)
+
+    def client(*args, **kv):
+      return subprocess.run(
+          [sys.executable, str(ROOT / "tooler" / "client.py"), socket_path, *args],
+          stdout=subprocess.PIPE,
+          encoding="utf-8",
+          env=env,
+          **kv,
+      )
+
+    rv = client("echo", "-", input="streamed")
+    assert (rv.returncode, rv.stdout) == (0, "STREAMED")
+
+    rv = client("cwd", cwd=str(tmp_path))
+    assert (rv.returncode, rv.stdout) == (0, str(tmp_path) + "\n")
+
+    assert client("fail", "--code=5").returncode == 5
+    assert client("missing").returncode == 1
+  finally:
+    server.terminate()
+    server.wait()
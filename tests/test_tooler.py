@@ -0,0 +1,516 @@
+import asyncio
+import io
+import json
+from pathlib import Path
+import pstats
+import sys
+
+import pytest
+
+from tooler import Tooler
+from tooler.batch import read_command_lines
+from tooler.cache import ResultCache
+from tooler.exceptions import CommandParseException
+from tooler.metrics import MemorySink, PrometheusTextfileSink, StatsdSink
+
+
+def test_lazy_command(tmp_path, monkeypatch, capsys):
+  (tmp_path / "lazy_tooler_commands.py").write_text(
+      "def greet(name, excited=False):\n"
+      "  return 'hello ' + name + ('!' if excited else '')\n"
+  )
+  monkeypatch.syspath_prepend(str(tmp_path))
+
+  tooler = Tooler()
+  tooler.lazy_command("greet", "lazy_tooler_commands:greet")
+
+  tooler.usage()
+  assert "greet" in capsys.readouterr().err
+  assert "lazy_tooler_commands" not in sys.modules
+
+  assert tooler.run(["greet", "world", "--excited"], output=None) == "hello world!"
+  assert "lazy_tooler_commands" in sys.modules
+
+
+def test_manifest(tmp_path, monkeypatch, capsys):
+  module = tmp_path / "manifest_tooler_commands.py"
+  module.write_text(
+      "def deploy(host, dry_run=False):\n  pass\n"
+      "def rollout(version):\n  pass\n"
+  )
+  (tmp_path / "manifest_tooler_queue.py").write_text(
+      "from tooler import Tooler\n"
+      "tooler = Tooler()\n"
+      "@tooler.command\n"
+      "def purge(name, force=False):\n  pass\n"
+  )
+  monkeypatch.syspath_prepend(str(tmp_path))
+  manifest_path = str(tmp_path / "manifest.json")
+
+  def main(*args, reference="manifest_tooler_commands:deploy"):
+    # A tooler is only mounted once, so every run imports its own
+    sys.modules.pop("manifest_tooler_queue", None)
+    tooler = Tooler(manifest=manifest_path)
+    tooler.lazy_command("deploy", reference)
+    tooler.mount("queue", "manifest_tooler_queue:tooler")
+    try:
+      tooler.main(["t", *args])
+    except SystemExit:
+      pass
+    return capsys.readouterr().out
+
+  usage = "Usage:\n  --host       required\n  --dry-run    default no\n"
+  assert main("deploy", "--help") == usage
+  del sys.modules["manifest_tooler_commands"]
+
+  # Answered from the manifest without importing the command module
+  assert main("deploy", "--help") == usage
+  monkeypatch.setenv("COMP_WORDS", "t\ndeploy\n--d")
+  monkeypatch.setenv("COMP_CWORD", "2")
+  assert main("--bash-completion") == "--dry-run\n"
+  # Commands of mounts too
+  monkeypatch.setenv("COMP_WORDS", "t\nqueue\np")
+  assert main("--bash-completion") == "purge\n"
+  monkeypatch.setenv("COMP_WORDS", "t\nqueue\npurge\n--f")
+  monkeypatch.setenv("COMP_CWORD", "3")
+  assert main("--bash-completion") == "--force\n"
+  monkeypatch.setenv("COMP_WORDS", "t\n")
+  monkeypatch.setenv("COMP_CWORD", "1")
+  assert main("--bash-completion") == "deploy\nqueue\n"
+  assert "manifest_tooler_commands" not in sys.modules
+  assert "manifest_tooler_queue" not in sys.modules
+
+  # Registering the command to another function invalidates the manifest
+  assert (
+      main("deploy", "--help", reference="manifest_tooler_commands:rollout")
+      == "Usage:\n  --version    required\n"
+  )
+  del sys.modules["manifest_tooler_commands"]
+
+  # So does changing the source
+  module.write_text("def deploy(host, force=False):\n  pass\n")
+  assert main("deploy", "--help") == "Usage:\n  --host     required\n  --force    default no\n"
+
+
+def test_default_command():
+  tooler = Tooler()
+
+  @tooler.command(default=True)
+  def echo(*words, **kv):
+    return [list(words), kv]
+
+  status = Tooler()
+
+  @status.command(default=True)
+  def show(*names):
+    return list(names)
+
+  tooler.mount("status", status)
+
+  # The default command gets the whole command line, tooler arguments included
+  assert tooler.run(["a", "--no-cache=x"], output=None) == [["a"], {"no_cache": "x"}]
+  assert tooler.run([], output=None) == [[], {}]
+  # and a mounted one everything after the mount
+  assert tooler.run(["status", "a", "b"], output=None) == ["a", "b"]
+  assert tooler.run(["status"], output=None) == []
+
+
+def test_mount(tmp_path, monkeypatch, capsys):
+  (tmp_path / "mounted_tooler_commands.py").write_text(
+      "from tooler import Tooler\n"
+      "tooler = Tooler(help='Queue commands')\n"
+      "@tooler.command\n"
+      "def purge(name, force=False):\n"
+      "  return ['purged', name, force]\n"
+  )
+  monkeypatch.syspath_prepend(str(tmp_path))
+
+  replica = Tooler()
+
+  @replica.command
+  def promote(host):
+    return "promoted " + host
+
+  db = Tooler()
+  db.mount("replica", replica)
+
+  @db.command
+  def backup():
+    return "backup"
+
+  tooler = Tooler()
+  tooler.mount("db", db)
+  tooler.mount("queue", "mounted_tooler_commands:tooler")
+
+  assert tooler.run(["db", "replica", "promote", "a"], output=None) == "promoted a"
+  assert tooler.run(["db", "backup"], output=None) == "backup"
+  assert "mounted_tooler_commands" not in sys.modules
+
+  # Tooler arguments are accepted at any level
+  assert tooler.run(["queue", "--no-cache", "purge", "q", "--force"], output=None) == [
+      "purged", "q", True
+  ]
+  assert tooler.options["no-cache"]
+
+  assert tooler.run(["db", "replica", "promte"], output=None) is False
+  err = capsys.readouterr().err
+  assert 'Invalid command: promte (did you mean "promote"?)' in err
+  assert "t db replica <command>" in err
+
+  tooler.run(["db"], output=None)
+  err = capsys.readouterr().err
+  assert "t db <command>" in err
+  assert "  replica <command>\n" in err and "  backup\n" in err
+
+  def complete(*words):
+    monkeypatch.setenv("COMP_WORDS", "\n".join(["t", *words]))
+    monkeypatch.setenv("COMP_CWORD", str(len(words)))
+    with pytest.raises(SystemExit):
+      tooler.main(["t", "--bash-completion"])
+    return capsys.readouterr().out.split()
+
+  assert complete("d") == ["db"]
+  assert complete("db", "") == ["backup", "replica"]
+  assert complete("db", "replica", "pr") == ["promote"]
+  assert complete("db", "backup", "x") == []
+
+
+def test_command_index():
+  tooler = Tooler()
+  for name in ["deploy", "deploy-all", "destroy", "list-hosts", "ls"]:
+    tooler.add_command(name, None)
+
+  assert tooler.index.complete("de") == ["deploy", "deploy-all", "destroy"]
+  assert tooler.index.complete("l") == ["list-hosts", "ls"]
+  assert tooler.index.complete("x") == []
+
+  assert tooler.index.search("host") == {"list-hosts"}
+  assert tooler.index.suggest("deploy") == ["deploy", "deploy-all"]
+  assert tooler.index.suggest("deplyo") == ["deploy"]
+  assert tooler.index.suggest("destory") == ["destroy"]
+  # Everything contains the empty string
+  assert tooler.index.search("") == {"deploy", "deploy-all", "destroy", "list-hosts", "ls"}
+  assert tooler.index.suggest("") == ["deploy", "deploy-all", "destroy", "list-hosts", "ls"]
+
+  try:
+    tooler.parse_command(["deplyo"])
+  except CommandParseException as e:
+    assert str(e) == 'Invalid command: deplyo (did you mean "deploy"?)'
+  else:
+    raise AssertionError("Expected an invalid command")
+
+
+def test_run_batch(capsys):
+  tooler = Tooler()
+
+  @tooler.command
+  def add(a: int, b: int = 0):
+    return a + b
+
+  @tooler.command
+  def check(value):
+    return value == "ok"
+
+  @tooler.command
+  def fail():
+    raise ValueError("nope")
+
+  records = []
+  commands = read_command_lines(
+      io.BytesIO(b"add 1 --b=2\n# comment\n\nfail\nadd 'x'\nadd --c=1\n")
+  )
+  assert tooler.run_batch(commands, output=records.append) is False
+  assert records == [
+      {"index": 1, "args": ["add", "1", "--b=2"], "status": 1, "result": 3},
+      {"index": 2, "args": ["fail"], "status": 1, "error": "ValueError: nope"},
+      {"index": 3, "args": ["add", "x"], "status": 1,
+       "error": "ValueError: invalid literal for int() with base 10: 'x'"},
+      {"index": 4, "args": ["add", "--c=1"], "status": 1,
+       "error": "No value provided for required argument: a"},
+  ]
+  # Lines that fail to parse do not print their usage among the records
+  assert capsys.readouterr().err == ""
+
+  records = []
+  commands = read_command_lines(io.BytesIO(b"check ok\0check 'ok'\0"))
+  assert tooler.run_batch(commands, output=records.append)
+  assert [(record["args"], record["status"]) for record in records] == [
+      (["check", "ok"], 0),
+      (["check", "ok"], 0),
+  ]
+
+
+def test_result_cache(tmp_path):
+  tooler = Tooler()
+  cache = ResultCache(tmp_path / "cache", max_entries=2)
+  calls = []
+
+  @tooler.command(cache=cache)
+  def lookup(name, upper=False):
+    calls.append(name)
+    return {"name": name.upper() if upper else name}
+
+  @tooler.command(cache=cache, cache_key=lambda path: path.name)
+  def render(path: Path):
+    calls.append(path)
+    return [str(path)]
+
+  assert tooler.run(["lookup", "a"], output=None) == {"name": "a"}
+  assert tooler.run(["lookup", "a"], output=None) == {"name": "a"}
+  assert tooler.run(["lookup", "a", "--upper"], output=None) == {"name": "A"}
+  assert calls == ["a", "a"]
+  assert cache.stats == dict(hits=1, misses=2, stores=2, evictions=0)
+
+  assert tooler.run(["render", "one/x"], output=None) == ["one/x"]
+  assert tooler.run(["render", "two/x"], output=None) == ["one/x"]
+  assert len(calls) == 3
+  assert cache.stats["evictions"] == 1
+  assert len(list((tmp_path / "cache").iterdir())) == 2
+
+  assert tooler.run(["--no-cache", "render", "two/x"], output=None) == ["two/x"]
+  assert cache.stats["hits"] == 2
+
+  # Expired entries are misses
+  expired = ResultCache(tmp_path / "cache", ttl=-1)
+  key = expired.key(lookup, ["a"])
+  assert expired.put(key, [1]) and expired.get(key) == (False, None)
+
+  # Results that would not come back the same from JSON are not stored
+  assert not cache.put(key, (1, 2)) and not cache.put(key, {1: "a"})
+
+
+def test_result_cache_profile(tmp_path, monkeypatch, capsys):
+  monkeypatch.delenv("TOOLER_PROFILE", raising=False)
+  tooler = Tooler()
+
+  @tooler.command(cache=ResultCache(tmp_path / "cache"))
+  def lookup(name):
+    return name
+
+  tooler.run(["--profile", "lookup", "a"], output=None)
+  tooler.run(["--profile", "lookup", "a"], output=None)
+  err = capsys.readouterr().err.splitlines()
+  assert err[0].endswith(", cache misses 1, cache stores 1")
+  assert err[1].endswith(", cache hits 1")
+
+
+def test_profile(tmp_path, monkeypatch, capsys):
+  tooler = Tooler()
+
+  @tooler.command
+  def work(count: int):
+    return sum(range(count))
+
+  assert tooler.run(["--profile", "work", "10"], output=None) == 45
+  err = capsys.readouterr().err
+  assert "profile work:" in err
+  for name in ("parse_command", "parse", "command"):
+    assert " %s " % name in err
+
+  pstats_path = tmp_path / "work.pstats"
+  tooler = Tooler()
+  tooler.command(work)
+  tooler.run(["--profile-output", str(pstats_path), "work", "10"], output=None)
+  assert pstats.Stats(str(pstats_path)).total_calls > 0
+
+  monkeypatch.setenv("TOOLER_PROFILE", str(tmp_path / "{command}.speedscope.json"))
+  tooler = Tooler()
+  tooler.command(work)
+  tooler.run(["work", "300000"], output=None)
+  with open(tmp_path / "work.speedscope.json") as f:
+    profile = json.load(f)
+  assert profile["profiles"][0]["type"] == "sampled"
+  assert "written to" in capsys.readouterr().err
+
+
+def test_metrics(tmp_path):
+  tooler = Tooler()
+  memory = MemorySink()
+  tooler.add_metrics_sink(memory)
+  tooler.add_metrics_sink(PrometheusTextfileSink(tmp_path / "tooler.prom"))
+
+  @tooler.command
+  def check(value):
+    return value == "ok"
+
+  @tooler.command
+  def fail():
+    raise ValueError("nope")
+
+  assert tooler.run(["check", "ok"], output=None) is True
+  assert tooler.run(["check", "no"], output=None) is False
+  with pytest.raises(ValueError):
+    tooler.run(["fail"], output=None)
+
+  @tooler.command
+  async def wait(value):
+    await asyncio.sleep(0)
+    return value == "ok"
+
+  # Async runs are timed and reported the same way
+  assert asyncio.run(tooler.run_async(["wait", "no"], output=None)) is False
+  tooler.root.metrics.flush()
+
+  assert [(r.command, r.status, r.exception) for r in memory.records] == [
+      ("check", 0, None),
+      ("check", 1, None),
+      ("fail", 1, "ValueError"),
+      ("wait", 1, None),
+  ]
+  assert "command" in memory.records[3].timings
+  assert {"parse_command", "parse", "command"} <= set(memory.records[0].timings)
+
+  prom = (tmp_path / "tooler.prom").read_text()
+  assert 'tooler_command_runs_total{command="check",status="0"} 1' in prom
+  assert 'tooler_command_exceptions_total{command="fail",exception="ValueError"} 1' in prom
+  assert 'tooler_command_duration_seconds_count{command="check",phase="total"} 2' in prom
+
+  statsd = StatsdSink()
+  lines = statsd.lines(memory.records[2])
+  assert "tooler.fail.status.1:1|c" in lines
+  assert "tooler.fail.exception.ValueError:1|c" in lines
+
+
+def test_metrics_bad_url(tmp_path, monkeypatch, capsys):
+  prom = tmp_path / "tooler.prom"
+  monkeypatch.setenv("TOOLER_METRICS", "bogus://x,statsd://h:port,prometheus://%s" % prom)
+  tooler = Tooler()
+  err = capsys.readouterr().err
+  assert "Ignoring $TOOLER_METRICS sink 'bogus://x'" in err
+  assert "Ignoring $TOOLER_METRICS sink 'statsd://h:port'" in err
+
+  @tooler.command
+  def check(value):
+    return value == "ok"
+
+  # The valid sink is kept
+  assert tooler.run(["check", "ok"], output=None) is True
+  tooler.root.metrics.flush()
+  assert 'command="check"' in prom.read_text()
+
+
+def test_async_commands(tmp_path):
+  tooler = Tooler()
+  loops = []
+
+  @tooler.command
+  async def read(data: io.BytesIO):
+    loops.append(asyncio.get_running_loop())
+    await asyncio.sleep(0)
+    return data.read().decode("utf8")
+
+  path = tmp_path / "data"
+  path.write_text("contents")
+  assert tooler.run(["read", str(path)], output=None) == "contents"
+  assert tooler.run(["read", str(path)], output=None) == "contents"
+  assert loops[0] is loops[1]
+
+  async def concurrently():
+    return await asyncio.gather(
+        tooler.run_async(["read", str(path)], output=None),
+        tooler.run_async(["read", str(path)], output=None),
+    )
+
+  assert asyncio.run(concurrently()) == ["contents", "contents"]
+
+
+def test_streamed_output(tmp_path, capsys):
+  tooler = Tooler()
+  produced = []
+
+  @tooler.command
+  def count(data: io.BytesIO):
+    for line in data:
+      produced.append(line)
+      yield {"line": line.decode("utf8").strip()}
+
+  @tooler.command
+  async def count_async(n: int):
+    for idx in range(n):
+      await asyncio.sleep(0)
+      yield idx
+
+  path = tmp_path / "data"
+  path.write_text("a\nb\n")
+  assert tooler.run(["count", str(path)]) is None
+  assert capsys.readouterr().out == '{"line":"a"}\n{"line":"b"}\n'
+
+  assert tooler.run(["count-async", "3"]) is None
+  assert capsys.readouterr().out == "0\n1\n2\n"
+
+  async def run_async():
+    return await tooler.run_async(["count-async", "2"])
+
+  assert asyncio.run(run_async()) is None
+  assert capsys.readouterr().out == "0\n1\n"
+
+
+def test_pipe(capsys):
+  tooler = Tooler()
+  seen = []
+
+  @tooler.command
+  def hosts(count: int = 3):
+    for idx in range(count):
+      seen.append(idx)
+      yield {"host": "host-%d" % idx, "port": 22 + idx}
+
+  @tooler.command(fan_out=True)
+  def check(host, timeout: int = 1):
+    return {"host": host["host"], "ok": host["port"] % 2 == 0, "timeout": timeout}
+
+  @tooler.command
+  def passed(records):
+    return sum(1 for record in records if record["result"]["ok"])
+
+  @tooler.command
+  def total(rows, field="port"):
+    return sum(row[field] for row in rows)
+
+  @tooler.command
+  def ports(*ports: list[int]):
+    return list(ports)
+
+  @tooler.command
+  def echo(*words):
+    return list(words)
+
+  @tooler.command
+  def fail():
+    raise ValueError("nope")
+
+  stages = (["hosts"], ["check", "--timeout=5"], ["passed", "-"])
+  assert tooler.pipe(*stages, output=None) == 2
+
+  # Fan-out records are streamed through from the first stage, which has only
+  # produced the first target so far
+  records = tooler.pipe(["hosts", "--count=2"], ["check"], output=None)
+  assert seen == [0, 1, 2, 0]
+  assert [record["result"]["host"] for record in records] == ["host-0", "host-1"]
+  assert seen == [0, 1, 2, 0, 1]
+
+  assert tooler.run(["hosts", "++", "total", "--field=port"]) == 69
+  assert json.loads(capsys.readouterr().out) == 69
+
+  # Strings from an earlier stage are converted as arguments are
+  assert tooler.run(["ports", "1", "++", "ports", "2"], output=None) == [2, 1]
+
+  assert tooler.run(["hosts", "++"]) is False
+  assert tooler.run(["hosts", "++", "total", "rows", "field"]) is False
+  assert "Unused arguments: <piped input>" in capsys.readouterr().err
+
+  # "++" only starts a stage before a command name
+  assert tooler.run(["echo", "a", "++", "b"], output=None) == ["a", "++", "b"]
+
+  # Pipelines are reported as a run of their last stage, whichever stage fails
+  memory = MemorySink()
+  tooler.add_metrics_sink(memory)
+  assert tooler.run(["--profile", "hosts", "++", "total"], output=None) == 69
+  assert "profile total:" in capsys.readouterr().err
+  with pytest.raises(ValueError):
+    tooler.run(["fail", "++", "total"], output=None)
+  tooler.root.metrics.flush()
+  assert [(r.command, r.status, r.exception) for r in memory.records] == [
+      ("total", 1, None),
+      ("total", 1, "ValueError"),
+  ]
@@ -1,4 +1,7 @@
+from .converters import ByteSize, register_converter
+from .files import MappedFile, StreamInput
 from .parser import DefaultParser, RawParser
+from .progress import Progress
 from .tooler import Tooler
 from .version import (
     __author__,
@@ -0,0 +1,179 @@
+"""
+Response files: reading arguments from a file instead of the command line.
+
+A command taking lists of values accepts `@path` (or `@-` for stdin) in place
+of the values, to get past the kernel's ARG_MAX. Files hold one argument per
+line, or are NUL delimited (as from `find -print0`). Arguments are read as the
+parser consumes them rather than all at once.
+"""
+import collections
+import itertools
+import sys
+
+from .exceptions import CommandParseException
+
+CHUNK_SIZE = 1 << 16
+
+
+def split_records(stream):
+  """
+Split a binary stream into records as it is read. Records are NUL delimited
+if the first chunk has a NUL in it, and newline delimited otherwise.
+"""
+  delimiter = None
+  pending = b""
+  for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+    if delimiter is None:
+      delimiter = b"\0" if b"\0" in chunk else b"\n"
+    records = (pending + chunk).split(delimiter)
+    pending = records.pop()
+    yield from records
+  if pending:
+    yield pending
+
+
+class ArgsFile:
+  """
+Arguments read from `@path`. The file is opened straight away so a missing file
+is reported while parsing, but only read while iterating.
+"""
+
+  def __init__(self, value):
+    self.value = value
+    if value == "@-":
+      self._stream = sys.stdin.buffer
+    else:
+      try:
+        self._stream = open(value[1:], "rb")
+      except OSError as e:
+        raise CommandParseException("Could not read arguments from %s: %s" % (value, e))
+
+  def __iter__(self):
+    try:
+      for record in split_records(self._stream):
+        # Skip blank lines, such as a trailing one
+        if record:
+          yield record.decode("utf-8")
+    finally:
+      self.close()
+
+  def close(self):
+    if self._stream is not sys.stdin.buffer:
+      self._stream.close()
+
+
+class _Lazy:
+  """Arguments still to be read, such as from an argsfile"""
+
+  __slots__ = ("iterator", "source")
+
+  def __init__(self, iterator, source=None):
+    self.iterator = iterator
+    # The `ArgsFile` being read, if any
+    self.source = source
+
+
+def _converted(values, convert):
+  for value in values:
+    try:
+      yield convert(value)
+    except (ValueError, TypeError) as e:
+      raise CommandParseException("Argument not valid: %r (%s)" % (value, e))
+
+
+class TakenArguments:
+  """
+Iterator over arguments taken from `PositionalArguments`. Closing it closes any
+argsfiles among them, for when it is not iterated to the end.
+"""
+
+  def __init__(self, iterator, files):
+    self._iterator = iterator
+    self._files = files
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    return next(self._iterator)
+
+  def converted(self, convert):
+    """Arguments converted as they are taken, the ones that fail are reported"""
+    return TakenArguments(_converted(self._iterator, convert), self._files)
+
+  def close(self):
+    for argsfile in self._files:
+      argsfile.close()
+
+
+class PositionalArguments:
+  """
+Positional arguments waiting to be assigned to parameters. Arguments from
+argsfiles are only read as they are taken.
+
+Results of previous pipeline stages can be added as well, which are not
+strings. `piped` is set once there is one.
+"""
+
+  def __init__(self):
+    # Values and `_Lazy` iterators of values, in order
+    self._values = collections.deque()
+    self.piped = False
+
+  def extend(self, values, argsfiles=False):
+    if not argsfiles or not any(value.startswith("@") for value in values):
+      self._values.extend(values)
+      return
+
+    for value in values:
+      if value.startswith("@@"):
+        self._values.append(value[1:])
+      elif value.startswith("@"):
+        argsfile = ArgsFile(value)
+        self._values.append(_Lazy(iter(argsfile), argsfile))
+      else:
+        self._values.append(value)
+
+  def add_piped(self, piped, many=False):
+    """Add the result of a previous pipeline stage, as its items with `many`"""
+    self.piped = True
+    self._values.append(_Lazy(piped.items()) if many else piped.result)
+
+  def _ready(self):
+    # Make sure the next value, if any, is a plain value at the front
+    while self._values:
+      head = self._values[0]
+      if not isinstance(head, _Lazy):
+        return True
+      try:
+        value = next(head.iterator)
+      except StopIteration:
+        self._values.popleft()
+        continue
+      self._values.appendleft(value)
+      return True
+    return False
+
+  def __bool__(self):
+    return self._ready()
+
+  def pop(self):
+    if not self._ready():
+      raise IndexError("No positional arguments left")
+    return self._values.popleft()
+
+  def take(self):
+    """
+Take all the remaining arguments, returning an iterator over them. Any
+argsfiles among them are only read as it is iterated.
+"""
+    (values, self._values) = (self._values, collections.deque())
+    files = [
+        value.source for value in values if isinstance(value, _Lazy) and value.source
+    ]
+    return TakenArguments(
+        itertools.chain.from_iterable(
+            value.iterator if isinstance(value, _Lazy) else (value,) for value in values
+        ),
+        files,
+    )
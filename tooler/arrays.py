@@ -0,0 +1,34 @@
+"""
+Annotations for parameters that collect many positional arguments at once.
+
+A parameter annotated with `Array` or `NumpyArray` takes every remaining
+positional argument, converted in bulk into one compact array:
+
+  @tooler.command
+  def lookup(ids: IntArray):
+    ...
+"""
+
+
+class Array:
+  """Collect positional arguments into an `array.array` of `typecode`"""
+
+  def __init__(self, typecode: str):
+    self.typecode = typecode
+
+  def __repr__(self):
+    return "Array(%r)" % self.typecode
+
+
+class NumpyArray:
+  """Collect positional arguments into a numpy array of `dtype`"""
+
+  def __init__(self, dtype):
+    self.dtype = dtype
+
+  def __repr__(self):
+    return "NumpyArray(%r)" % (self.dtype,)
+
+
+IntArray = Array("q")
+FloatArray = Array("d")
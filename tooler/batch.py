@@ -0,0 +1,17 @@
+"""
+Reading command lines for `Tooler.run_batch`.
+"""
+import shlex
+
+from .argsfile import split_records
+
+
+def read_command_lines(stream):
+  """
+Yield the argv of each command line in a binary `stream`. Lines are split like
+a shell would, blank lines and `#` comments are skipped.
+"""
+  for record in split_records(stream):
+    args = shlex.split(record.decode("utf-8"), comments=True)
+    if args:
+      yield args
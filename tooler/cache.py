@@ -0,0 +1,186 @@
+"""
+On-disk cache of command results, for read-only commands that get called over
+and over with the same arguments.
+
+Each entry is a file holding the result serialized as JSON, named after a hash
+of the command and its parsed arguments. Only results that come back the same
+from JSON are stored, so a hit returns what the command would have (tuples or
+dicts with non-string keys, for one, are never cached). An entry's modification time is when
+it was stored (for the TTL) and its access time when it was last used (for
+evicting the least recently used entries).
+"""
+import collections
+import hashlib
+import json
+import os
+from pathlib import PurePath
+import time
+
+from .output import dumps
+from .profiling import count
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 64 << 20
+
+
+def default_cache_dir():
+  """`$TOOLER_CACHE_DIR`, otherwise a "tooler" directory in the user cache"""
+  path = os.environ.get("TOOLER_CACHE_DIR")
+  if path is None:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "tooler")
+  return path
+
+
+def _key_default(value):
+  # Paths are the only argument type besides plain values worth caching on,
+  # anything else (such as an open file) makes the call uncacheable
+  if isinstance(value, PurePath):
+    return str(value)
+  raise TypeError("Cannot use %s in a cache key" % type(value).__name__)
+
+
+class ResultCache:
+  """
+Results stored in `path`, holding at most `max_entries` results and
+`max_bytes` of them before the least recently used are evicted.
+
+`stats` counts hits, misses, stores and evictions in this process, which
+covers every command run by `--batch` or a `--serve` child. They are also
+counted in the `--profile` summary of the run.
+"""
+
+  def __init__(
+      self,
+      path=None,
+      ttl=DEFAULT_TTL,
+      max_entries=DEFAULT_MAX_ENTRIES,
+      max_bytes=DEFAULT_MAX_BYTES,
+  ):
+    self.path = default_cache_dir() if path is None else os.fspath(path)
+    self.ttl = ttl
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.stats = collections.Counter(hits=0, misses=0, stores=0, evictions=0)
+
+  def key(self, fn, value):
+    """
+Key for calling `fn` with the arguments summarized by `value`, or `None` if
+`value` cannot be serialized.
+"""
+    try:
+      data = json.dumps(value, sort_keys=True, default=_key_default)
+    except (TypeError, ValueError):
+      return None
+    code = getattr(fn, "__code__", None)
+    name = "%s:%s:%s" % (
+        getattr(code, "co_filename", ""),
+        fn.__module__,
+        fn.__qualname__,
+    )
+    return hashlib.sha256(("%s\0%s" % (name, data)).encode("utf-8")).hexdigest()
+
+  def _entry(self, key):
+    return os.path.join(self.path, key + ".json")
+
+  def get(self, key, ttl=None):
+    """
+Returns `(True, result)` for a fresh entry under `key`, and `(False, None)`
+otherwise.
+"""
+    ttl = self.ttl if ttl is None else ttl
+    entry = self._entry(key)
+    try:
+      with open(entry, "rb") as f:
+        stat = os.fstat(f.fileno())
+        now = time.time()
+        if ttl is not None and now - stat.st_mtime > ttl:
+          raise FileNotFoundError(entry)
+        result = json.loads(f.read())
+      # Mark it as recently used, keeping when it was stored
+      os.utime(entry, (now, stat.st_mtime))
+    except (OSError, ValueError):
+      self._count("misses")
+      return (False, None)
+
+    self._count("hits")
+    return (True, result)
+
+  def _count(self, event):
+    self.stats[event] += 1
+    count("cache " + event)
+
+  def put(self, key, result):
+    """
+Store `result` under `key`. Results that cannot be serialized, or would not
+come back the same, are skipped, and it returns whether it was stored.
+"""
+    try:
+      data = dumps(result)
+    except (TypeError, ValueError, OverflowError):
+      return False
+    if json.loads(data) != result:
+      return False
+
+    entry = self._entry(key)
+    tmp_path = "%s.%d.tmp" % (entry, os.getpid())
+    try:
+      os.makedirs(self.path, exist_ok=True)
+      with open(tmp_path, "wb") as f:
+        f.write(data)
+      # Use the same clock as `get`, file system timestamps can lag behind it
+      now = time.time()
+      os.utime(tmp_path, (now, now))
+      os.replace(tmp_path, entry)
+    except OSError:
+      # An unwritable cache just means every call is a miss
+      try:
+        os.unlink(tmp_path)
+      except OSError:
+        pass
+      return False
+
+    self._count("stores")
+    self._evict()
+    return True
+
+  def _evict(self):
+    entries = []
+    size = 0
+    try:
+      with os.scandir(self.path) as it:
+        for item in it:
+          if item.name.endswith(".json"):
+            stat = item.stat()
+            entries.append((stat.st_atime, stat.st_size, item.path))
+            size += stat.st_size
+    except OSError:
+      return
+
+    if len(entries) <= self.max_entries and size <= self.max_bytes:
+      return
+
+    # Least recently used first
+    entries.sort()
+    count = len(entries)
+    for (_, entry_size, entry) in entries:
+      if count <= self.max_entries and size <= self.max_bytes:
+        break
+      try:
+        os.unlink(entry)
+      except OSError:
+        continue
+      count -= 1
+      size -= entry_size
+      self._count("evictions")
+
+  def clear(self):
+    """Remove every entry"""
+    try:
+      with os.scandir(self.path) as it:
+        for item in it:
+          if item.name.endswith(".json"):
+            os.unlink(item.path)
+    except OSError:
+      pass
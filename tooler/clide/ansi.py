@@ -84,8 +84,8 @@ cyan = build_color(code_cyan)
 white = build_color(code_white)
 
 
-def ansi_message(color_escape, code, message):
-    print(
+def format_message(color_escape, code, message):
+    return (
         white(dim=True)
         + "["
         + color_escape
@@ -94,11 +94,14 @@ def ansi_message(color_escape, code, message):
         + "]"
         + reset
         + " "
-        + message,
-        file=sys.stderr,
+        + message
     )
 
 
+def ansi_message(color_escape, code, message):
+    print(format_message(color_escape, code, message), file=sys.stderr)
+
+
 def info(message: str):
     ansi_message(white(bold=True), "INFO", message)
 
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Thin client for a tool running in server mode (see `tooler.server`).
+
+This file only depends on the standard library so it can be run directly
+without importing tooler or the tool's commands:
+
+  python path/to/tooler/client.py SOCKET [args...]
+"""
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+_HEADER = struct.Struct("!I")
+_REPLY = struct.Struct("!i")
+
+
+def _recv_exactly(conn, size):
+  data = b""
+  while len(data) < size:
+    chunk = conn.recv(size - len(data))
+    if not chunk:
+      raise ConnectionError("Tooler server closed the connection")
+    data += chunk
+  return data
+
+
+def run(socket_path, args, stdio=(0, 1, 2)):
+  """
+Run `args` on the server listening at `socket_path`, passing it our stdio,
+environment and working directory. Returns the command's exit code.
+"""
+  request = json.dumps({"args": list(args), "env": dict(os.environ), "cwd": os.getcwd()})
+  payload = request.encode("utf-8")
+
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+    conn.connect(socket_path)
+    socket.send_fds(conn, [_HEADER.pack(len(payload)) + payload], list(stdio))
+
+    # The server replies with the pid running our command so signals can be
+    # forwarded, and then with the exit code once it completes
+    (pid,) = _REPLY.unpack(_recv_exactly(conn, _REPLY.size))
+
+    def forward(signum, frame):
+      os.kill(pid, signum)
+
+    previous = {
+        signum: signal.signal(signum, forward) for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    try:
+      (code,) = _REPLY.unpack(_recv_exactly(conn, _REPLY.size))
+    finally:
+      for signum, handler in previous.items():
+        signal.signal(signum, handler)
+
+  return code
+
+
+def main(argv=None):
+  if argv is None:
+    argv = sys.argv
+  if len(argv) < 2:
+    sys.stderr.write("Usage: %s <socket> [args...]\n" % argv[0])
+    sys.exit(2)
+  sys.exit(run(argv[1], argv[2:]))
+
+
+if __name__ == "__main__":
+  main()
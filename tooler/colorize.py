@@ -0,0 +1,198 @@
+"""
+Colored JSON for the terminal, produced token by token from the result.
+
+`Colorizer` walks the result itself rather than serializing it and running a
+lexer over the text, so output starts straight away and the full document is
+never held in memory. Keys are sorted and indented as in `dumps(pretty=True)`.
+
+Results larger than `PAGE_THRESHOLD` characters are sent to a pager (`less`,
+or `$TOOLER_PAGER` / `$PAGER`). With no pager, the rest of the result is
+summarized instead, showing the first `SUMMARY_ITEMS` entries of each list
+and object.
+"""
+import json
+import math
+import os
+from json.encoder import encode_basestring
+
+from .clide import ansi
+from .writer import status, stdout_writer
+
+# Results with more characters than this are paged, or summarized
+PAGE_THRESHOLD = 1 << 18
+
+# Entries shown of each list and object in a summarized result
+SUMMARY_ITEMS = 20
+
+# Characters colored before they are written out
+BATCH_SIZE = 1 << 14
+
+_CONSTANTS = {None: "null", True: "true", False: "false"}
+
+
+def _sorted_keys(value):
+  try:
+    return sorted(value)
+  except TypeError:
+    # Keys of mixed types, such as `None` alongside strings
+    return sorted(value, key=str)
+
+
+def _plain(value):
+  """`value` as JSON compatible types, for values only the serializer knows how to convert"""
+  from .output import dumps
+
+  try:
+    return json.loads(dumps(value))
+  except TypeError:
+    return str(value)
+
+
+class Colorizer:
+  """
+Colored JSON tokens for a result. Setting `max_items` limits how many entries
+of each list and object are shown, including those already being walked.
+"""
+
+  def __init__(self, indent=2, max_items=None):
+    self.indent = indent
+    self.max_items = max_items
+    self.key_color = ansi.blue(bold=True)
+    self.string_color = ansi.green()
+    self.number_color = ansi.cyan()
+    self.constant_color = ansi.magenta()
+    self.comment_color = ansi.white(dim=True)
+
+  def key(self, key):
+    if isinstance(key, str):
+      text = encode_basestring(key)
+    elif key is None or isinstance(key, bool):
+      text = '"%s"' % json.dumps(key)
+    else:
+      text = '"%s"' % key
+    return self.key_color + text + ansi.reset
+
+  def scalar(self, value):
+    """The token for `value`, or `None` if it is not a JSON scalar"""
+    if isinstance(value, str):
+      return self.string_color + encode_basestring(value) + ansi.reset
+    elif value is None or value is True or value is False:
+      return self.constant_color + _CONSTANTS[value] + ansi.reset
+    elif isinstance(value, int):
+      return self.number_color + int.__repr__(value) + ansi.reset
+    elif isinstance(value, float):
+      # `json.dumps` knows the names for infinity and NaN
+      text = float.__repr__(value) if math.isfinite(value) else json.dumps(value)
+      return self.number_color + text + ansi.reset
+    return None
+
+  def tokens(self, value, level=0):
+    token = self.scalar(value)
+    if token is not None:
+      yield token
+      return
+
+    if isinstance(value, dict):
+      (start, end, entries) = ("{", "}", ((key, value[key]) for key in _sorted_keys(value)))
+    elif isinstance(value, (list, tuple)):
+      (start, end, entries) = ("[", "]", ((None, entry) for entry in value))
+    else:
+      yield from self.tokens(_plain(value), level)
+      return
+
+    if not value:
+      yield start + end
+      return
+
+    inner = "\n" + " " * (self.indent * (level + 1))
+    separator = start + inner
+    for (count, (key, entry)) in enumerate(entries):
+      if self.max_items is not None and count >= self.max_items:
+        yield "%s%s// %d more%s" % (separator, self.comment_color, len(value) - count, ansi.reset)
+        break
+      yield separator if key is None else separator + self.key(key) + ": "
+      token = self.scalar(entry)
+      if token is None:
+        yield from self.tokens(entry, level + 1)
+      else:
+        yield token
+      separator = "," + inner
+    yield "\n" + " " * (self.indent * level) + end
+
+
+def _pager():
+  """The pager to send large results to, started, or `None` if there is none"""
+  import shlex
+  import shutil
+  import subprocess
+
+  command = os.environ.get("TOOLER_PAGER", os.environ.get("PAGER", "less"))
+  argv = shlex.split(command)
+  if not argv or argv == ["cat"] or shutil.which(argv[0]) is None:
+    return None
+  # Like git: keep colors, and quit straight away if it fits on one screen
+  env = dict(os.environ)
+  env.setdefault("LESS", "FRX")
+  try:
+    return subprocess.Popen(argv, stdin=subprocess.PIPE, env=env)
+  except OSError:
+    return None
+
+
+def _write_batches(tokens, write, flush):
+  pending = []
+  size = 0
+  for token in tokens:
+    pending.append(token)
+    size += len(token)
+    if size >= BATCH_SIZE:
+      write("".join(pending).encode("utf-8"))
+      flush()
+      pending = []
+      size = 0
+  pending.append("\n")
+  write("".join(pending).encode("utf-8"))
+  flush()
+
+
+def output_pretty(body, threshold=PAGE_THRESHOLD):
+  """Write `body` as colored JSON, paging or summarizing it beyond `threshold` characters"""
+  colorizer = Colorizer()
+  tokens = colorizer.tokens(body)
+  writer = stdout_writer()
+
+  head = []
+  size = 0
+  for token in tokens:
+    head.append(token)
+    size += len(token)
+    if size > threshold:
+      break
+  else:
+    _write_batches(head, writer.write, writer.flush)
+    return
+
+  import itertools
+
+  tokens = itertools.chain(head, tokens)
+  pager = _pager()
+  if pager is None:
+    colorizer.max_items = SUMMARY_ITEMS
+    _write_batches(tokens, writer.write, writer.flush)
+    status.warn(
+        "Output over %d characters was summarized, use --output-format=json for all of it"
+        % threshold
+    )
+    return
+
+  writer.flush()
+  try:
+    _write_batches(tokens, pager.stdin.write, pager.stdin.flush)
+  except BrokenPipeError:
+    # The pager was quit before the end of the result
+    pass
+  try:
+    pager.stdin.close()
+  except BrokenPipeError:
+    pass
+  pager.wait()
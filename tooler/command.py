@@ -1,8 +1,47 @@
-import io
-from typing import Dict, Optional
+from __future__ import annotations
 
-from .exceptions import CommandHelpException
+import importlib
+import itertools
+from types import AsyncGeneratorType, CoroutineType, GeneratorType
+
+from .argsfile import TakenArguments
+from .exceptions import CommandHelpException, CommandParseException
+from .files import close_argument
 from .parser import DefaultParser
+from .profiling import phase
+from .progress import Progress
+
+def _close_arguments(args, kv):
+  # Close any files that were opened (or mapped) as arguments, including
+  # argsfiles of targets that were never taken, and finish any progress the
+  # command was reporting
+  for value in [*args, *kv.values()]:
+    if isinstance(value, (Progress, TakenArguments)):
+      value.close()
+    else:
+      close_argument(value)
+
+
+async def _close_after(awaitable, args, kv):
+  try:
+    return await awaitable
+  finally:
+    _close_arguments(args, kv)
+
+
+def _close_after_iterating(iterator, args, kv):
+  try:
+    return (yield from iterator)
+  finally:
+    _close_arguments(args, kv)
+
+
+async def _close_after_async_iterating(iterator, args, kv):
+  try:
+    async for item in iterator:
+      yield item
+  finally:
+    _close_arguments(args, kv)
 
 
 class Command:
@@ -14,7 +53,7 @@ class Command:
 
 
 class DecoratorCommand(Command):
-  def __init__(self, fn, doc=None, parser=None, shorthands: Optional[Dict[str, str]] = None):
+  def __init__(self, fn, doc=None, parser=None, shorthands: dict[str, str] | None = None):
     # @todo: Should just take an actual `parser` object, but need to do a large
     # refactor to fix that.
     if parser:
@@ -26,23 +65,215 @@ class DecoratorCommand(Command):
     self.fn = fn
     self.doc = doc
 
+  def usage(self):
+    """Usage string for the command, or `None` if its parser cannot render one"""
+    usage = getattr(self.parser, "usage", None)
+    return None if usage is None else usage(self.fn)
+
   def run(self, selector, argv):
     try:
-      (args, vargs) = self.parser.parse(
-          self.fn,
-          self.doc,
-          selector,
-          argv
-        )
+      with phase("parse"):
+        (args, vargs) = self.parser.parse(
+            self.fn,
+            self.doc,
+            selector,
+            argv
+          )
     except CommandHelpException as e:
-      print(e.usage)
+      print(e.help_string)
       return
 
     try:
-      return self.fn(*args, **vargs)
-    finally:
-      # Close any files that were opened as arguments
-      for value in [*args, *vargs.values()]:
-        # Skip as linter is not aware of `file` type
-        if isinstance(value, io.IOBase):
-          value.close()
+      with phase("command"):
+        result = self.call(selector, args, vargs)
+    except BaseException:
+      _close_arguments(args, vargs)
+      raise
+
+    # Coroutines and generators still need their arguments, so close them once
+    # they complete
+    if isinstance(result, CoroutineType):
+      return _close_after(result, args, vargs)
+    elif isinstance(result, GeneratorType):
+      return _close_after_iterating(result, args, vargs)
+    elif isinstance(result, AsyncGeneratorType):
+      return _close_after_async_iterating(result, args, vargs)
+    _close_arguments(args, vargs)
+    return result
+
+  def call(self, selector, args, kv):
+    return self.fn(*args, **kv)
+
+
+class CachedCommand(DecoratorCommand):
+  """
+Command whose results are memoized in a `ResultCache`, keyed on the parsed
+arguments or on what `key(*args, **kv)` returns for them. Only plain results
+are cached, not coroutines or generators, and the tooler's `--no-cache`
+argument skips the cache.
+"""
+
+  def __init__(
+      self,
+      fn,
+      tooler,
+      cache,
+      ttl=None,
+      key=None,
+      doc=None,
+      parser=None,
+      shorthands: dict[str, str] | None = None,
+  ):
+    super().__init__(fn, doc=doc, parser=parser, shorthands=shorthands)
+    self.tooler = tooler
+    self.cache = cache
+    self.ttl = ttl
+    self.key = key
+
+  def call(self, selector, args, kv):
+    if self.tooler.root.options["no-cache"]:
+      return super().call(selector, args, kv)
+
+    value = [list(args), kv] if self.key is None else self.key(*args, **kv)
+    key = self.cache.key(self.fn, [selector, value])
+    if key is None:
+      return super().call(selector, args, kv)
+
+    (hit, result) = self.cache.get(key, ttl=self.ttl)
+    if hit:
+      return result
+
+    result = super().call(selector, args, kv)
+    if not isinstance(result, (GeneratorType, AsyncGeneratorType, CoroutineType)):
+      self.cache.put(key, result)
+    return result
+
+
+_NO_TARGET = object()
+
+
+class FanOutCommand(DecoratorCommand):
+  """
+Command run once per target, with the targets coming from the positional
+arguments or a comma separated `command:selector`. How they are run is set by
+the tooler's `--parallel`, `--executor`, `--fail-fast`, `--target-timeout` and
+`--as-completed` arguments. A target that times out on a thread or process
+worker is reported as failed but keeps running, and the process only exits
+once it finishes.
+"""
+
+  def __init__(self, fn, tooler, doc=None, shorthands: dict[str, str] | None = None):
+    super().__init__(fn, doc=doc)
+    self.parser = DefaultParser(shorthands=shorthands, fan_out=True)
+    self.tooler = tooler
+
+  def run(self, selector, argv):
+    # Targets from the selector go ahead of any positional targets, as the
+    # parser itself has no use for a selector
+    if selector is not None:
+      argv = [target for target in selector.split(",") if target] + list(argv)
+    return super().run(None, argv)
+
+  def call(self, selector, args, kv):
+    (targets, *args) = args
+    # Targets can be read lazily from an argsfile, so peek at the first
+    targets = iter(targets)
+    first = next(targets, _NO_TARGET)
+    if first is _NO_TARGET:
+      raise CommandParseException("No targets provided")
+    targets = itertools.chain((first,), targets)
+
+    from .fanout import fan_out
+
+    options = self.tooler.root.options
+    timeout = options["target-timeout"]
+    # Records are streamed to the output as they come in
+    return fan_out(
+        self.fn,
+        targets,
+        args,
+        kv,
+        parallel=max(1, int(options["parallel"])),
+        executor=options["executor"],
+        ordered=not options["as-completed"],
+        fail_fast=options["fail-fast"],
+        timeout=None if timeout is None else float(timeout),
+        stream=True,
+    )
+
+
+class LazyCommand(Command):
+  """
+Command declared by a "module:function" reference. The module is only imported
+once the command is actually run, so listing commands never pays for it.
+"""
+
+  def __init__(self, reference, doc=None, parser=None, shorthands: dict[str, str] | None = None):
+    assert ":" in reference, "Lazy command references must look like 'module:function'"
+    self.reference = reference
+    self.doc = doc
+    self.parser = parser
+    self.shorthands = shorthands
+    self._command = None
+
+  def resolve(self):
+    if self._command is None:
+      (module_name, attr) = self.reference.split(":", 1)
+      target = importlib.import_module(module_name)
+      for part in attr.split("."):
+        target = getattr(target, part)
+
+      if isinstance(target, Command):
+        self._command = target
+      else:
+        self._command = DecoratorCommand(
+            target,
+            doc=target.__doc__ if self.doc is None else self.doc,
+            parser=self.parser,
+            shorthands=self.shorthands,
+        )
+    return self._command
+
+  def run(self, selector, argv):
+    return self.resolve().run(selector, argv)
+
+
+class MountCommand(Command):
+  """
+A tooler mounted under a command name, so its commands are run as
+`<name> <command>`. It is either given directly or as a "module:attribute"
+reference, which is only imported once a command line goes through the mount.
+"""
+
+  def __init__(self, tooler, parent, doc=None):
+    self.parent = parent
+    self.doc = doc
+    if isinstance(tooler, str):
+      assert ":" in tooler, "Mount references must look like 'module:attribute'"
+      self.reference = tooler
+      self._tooler = None
+    else:
+      self.reference = None
+      self._tooler = tooler
+      tooler._set_parent(parent)
+      if doc is None:
+        self.doc = tooler.help
+
+  @property
+  def resolved(self):
+    return self._tooler is not None
+
+  def resolve(self):
+    if self._tooler is None:
+      (module_name, attr) = self.reference.split(":", 1)
+      target = importlib.import_module(module_name)
+      for part in attr.split("."):
+        target = getattr(target, part)
+      target._set_parent(self.parent)
+      self._tooler = target
+    return self._tooler
+
+  def run(self, selector, argv):
+    # `Tooler.parse_command` goes through mounts itself, this is only reached
+    # by running the mount as a command of its own
+    return self.resolve().run(list(argv), output=None)
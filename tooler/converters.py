@@ -0,0 +1,366 @@
+"""
+Converters from command line strings to the types of annotated parameters.
+
+`converter_for(annotation)` resolves an annotation to a function once, when a
+command's parse plan is compiled, so parsing an argument is a single call
+however many types are known. It looks in order at:
+
+- converters added with `register_converter`, keyed by the annotation itself
+- `Optional[X]`, `Union[X, Y]`, `X | Y` and `Literal[...]`
+- the built in converters, keyed by "module:name" so that modules such as
+  `datetime` and `ipaddress` are only imported by tools that use them
+- `enum.Enum` subclasses and dataclasses
+
+Built in are `int`, `float`, `bool` (as true/false/yes/no/1/0), `Decimal`,
+`pathlib.Path`, the file argument types, `datetime`, `date`, `time`,
+`timedelta` (durations such as "1h30m" or seconds), the `ipaddress`
+address, network and interface types, `UUID` and `ByteSize` ("512", "10MB",
+"1.5GiB").
+
+Dataclass parameters are set field by field with `--name.field=value` (or as
+a JSON object), see `DataclassConverter`.
+"""
+import re
+
+from .exceptions import CommandParseException
+
+# Converters added with `register_converter`, by annotation
+CONVERTERS = {}
+
+_MISSING = object()
+
+
+def register_converter(annotation, convert):
+  """
+Convert arguments of parameters annotated with `annotation` with
+`convert(value)`, which raises `ValueError` (or `CommandParseException`) for
+invalid values. This takes precedence over the built in converters, and
+applies to commands first parsed after it is registered.
+"""
+  CONVERTERS[annotation] = convert
+
+
+class ByteSize(int):
+  """
+A number of bytes, given as a plain number or with a unit: "k", "M", "G", "T"
+and "KiB", "MiB", ... are powers of 1024, while "kB", "MB", ... are powers of
+1000.
+"""
+
+
+_BYTE_SIZE = re.compile(r"^\s*(\d+(?:\.\d*)?|\.\d+)\s*([kmgtp]?)(i?)(b?)\s*$", re.IGNORECASE)
+
+
+def parse_byte_size(value):
+  match = _BYTE_SIZE.match(value)
+  if match is None:
+    raise ValueError("not a byte size: %r" % value)
+  (number, prefix, binary, suffix) = match.groups()
+  power = " KMGTP".index(prefix.upper() or " ")
+  # A bare prefix ("10M") is binary, as it is for most tools taking sizes
+  scale = (1000 if suffix and not binary else 1024) ** power
+  if "." in number:
+    return ByteSize(int(float(number) * scale))
+  return ByteSize(int(number) * scale)
+
+
+_DURATION = re.compile(r"(\d+(?:\.\d*)?|\.\d+)\s*(ms|us|w|d|h|m|s)", re.IGNORECASE)
+_DURATION_UNITS = {
+    "w": 604800.0, "d": 86400.0, "h": 3600.0, "m": 60.0, "s": 1.0, "ms": 1e-3, "us": 1e-6,
+}
+
+
+def parse_duration(value):
+  """A `timedelta` from seconds ("90"), units ("1h30m", "2.5d") or "[H:]MM:SS" """
+  from datetime import timedelta
+
+  text = value.strip()
+  if ":" in text:
+    seconds = 0.0
+    for part in text.split(":"):
+      seconds = seconds * 60 + float(part)
+    return timedelta(seconds=seconds)
+  try:
+    return timedelta(seconds=float(text))
+  except ValueError:
+    pass
+
+  seconds = 0.0
+  end = 0
+  for match in _DURATION.finditer(text):
+    if text[end:match.start()].strip():
+      break
+    seconds += float(match.group(1)) * _DURATION_UNITS[match.group(2).lower()]
+    end = match.end()
+  if not end or text[end:].strip():
+    raise ValueError("not a duration: %r" % value)
+  return timedelta(seconds=seconds)
+
+
+_BOOLEANS = {
+    "true": True, "yes": True, "on": True, "1": True,
+    "false": False, "no": False, "off": False, "0": False,
+}
+
+
+def parse_bool(value):
+  try:
+    return _BOOLEANS[value.lower()]
+  except KeyError:
+    raise ValueError("not a boolean: %r" % value)
+
+
+def _datetime(value):
+  from datetime import datetime
+
+  return datetime.fromisoformat(value)
+
+
+def _date(value):
+  from datetime import date
+
+  return date.fromisoformat(value)
+
+
+def _time(value):
+  from datetime import time
+
+  return time.fromisoformat(value)
+
+
+def _import(path):
+  (module, name) = path.split(":")
+  return getattr(__import__(module, fromlist=[name]), name)
+
+
+def _imported(path):
+  return lambda: _import(path)
+
+
+# Built in converters by "module:qualname" of the annotation, each a factory
+# returning the converter and the description used in errors
+_BUILTIN = {
+    # Invalid numbers raise `ValueError` as they always have
+    "builtins:int": (lambda: int, None),
+    "builtins:float": (lambda: float, None),
+    "builtins:bool": (lambda: parse_bool, "true or false"),
+    "decimal:Decimal": (_imported("decimal:Decimal"), "a number"),
+    "pathlib:Path": (_imported("pathlib:Path"), None),
+    "_io:BytesIO": (_imported("tooler.parser:_open_file"), None),
+    "tooler.files:MappedFile": (lambda: _import("tooler.files:MappedFile").open, None),
+    "tooler.files:StreamInput": (lambda: _import("tooler.files:StreamInput").open, None),
+    "mmap:mmap": (_imported("tooler.files:map_file"), None),
+    "builtins:memoryview": (_imported("tooler.files:map_view"), None),
+    "datetime:datetime": (lambda: _datetime, "an ISO 8601 date and time"),
+    "datetime:date": (lambda: _date, "an ISO 8601 date"),
+    "datetime:time": (lambda: _time, "an ISO 8601 time"),
+    "datetime:timedelta": (lambda: parse_duration, "a duration such as 90s or 1h30m"),
+    "ipaddress:IPv4Address": (_imported("ipaddress:IPv4Address"), "an IPv4 address"),
+    "ipaddress:IPv6Address": (_imported("ipaddress:IPv6Address"), "an IPv6 address"),
+    "ipaddress:IPv4Network": (_imported("ipaddress:IPv4Network"), "an IPv4 network"),
+    "ipaddress:IPv6Network": (_imported("ipaddress:IPv6Network"), "an IPv6 network"),
+    "ipaddress:IPv4Interface": (_imported("ipaddress:IPv4Interface"), "an IPv4 interface"),
+    "ipaddress:IPv6Interface": (_imported("ipaddress:IPv6Interface"), "an IPv6 interface"),
+    "uuid:UUID": (_imported("uuid:UUID"), "a UUID"),
+    "tooler.converters:ByteSize": (lambda: parse_byte_size, "a size such as 512, 10MB or 1.5GiB"),
+}
+
+
+def _checked(convert, expected):
+  """`convert` reporting invalid values as a parse error, saying what was `expected`"""
+
+  def checked(value):
+    try:
+      return convert(value)
+    except (ValueError, TypeError, ArithmeticError):
+      raise CommandParseException("Argument not valid: %r (expected %s)" % (value, expected))
+
+  return checked
+
+
+def _check_choice(choices, allowed, value):
+  try:
+    return choices[value]
+  except KeyError:
+    raise CommandParseException("Argument not valid: %r (allowed are %s)" % (value, allowed))
+
+
+def _choice_converter(choices, allowed):
+  return lambda value: _check_choice(choices, allowed, value)
+
+
+def _enum_converter(annotation):
+  """Members by name, also lower case with dashes, or by value"""
+  choices = {}
+  for (name, member) in annotation.__members__.items():
+    choices[str(member.value)] = member
+    choices[name.lower().replace("_", "-")] = member
+    choices[name] = member
+  allowed = ", ".join(name.lower().replace("_", "-") for name in annotation.__members__)
+  return _choice_converter(choices, allowed)
+
+
+def _type_name(annotation):
+  if isinstance(annotation, type):
+    return annotation.__name__
+  return str(annotation).replace("typing.", "")
+
+
+def _union_converter(members):
+  converters = [converter_for(member) for member in members]
+  # Members without a converter (such as `str`) take any value as it is
+  passthrough = None in converters
+  converters = [convert for convert in converters if convert is not None]
+
+  def convert_union(value):
+    # The first member that takes the value wins
+    for convert in converters:
+      try:
+        return convert(value)
+      except (ValueError, TypeError, CommandParseException):
+        pass
+    if passthrough:
+      return value
+    raise CommandParseException(
+        "Argument not valid: %r (expected one of %s)"
+        % (value, ", ".join(_type_name(member) for member in members))
+    )
+
+  return convert_union
+
+
+def _typing_converter(annotation):
+  """Converter for `Optional`, `Union` and `Literal` annotations, `_MISSING` for anything else"""
+  origin = getattr(annotation, "__origin__", None)
+  union = False
+  if origin is None:
+    # `X | Y` unions, which have no `__origin__`
+    import types
+
+    union = isinstance(annotation, getattr(types, "UnionType", ()))
+  else:
+    import typing
+
+    if origin is typing.Literal:
+      choices = {str(choice): choice for choice in annotation.__args__}
+      allowed = ", ".join(repr(choice) for choice in annotation.__args__)
+      return _choice_converter(choices, allowed)
+    union = origin is typing.Union
+  if not union:
+    return _MISSING
+
+  members = [member for member in annotation.__args__ if member is not type(None)]
+  if len(members) == 1:
+    # `Optional[X]`, the default is what makes it optional
+    return converter_for(members[0])
+  return _union_converter(members)
+
+
+def converter_for(annotation):
+  """
+The function converting argument strings for a parameter annotated with
+`annotation`, or `None` if they are passed on as they are.
+"""
+  try:
+    return CONVERTERS[annotation]
+  except (KeyError, TypeError):
+    pass
+
+  convert = _typing_converter(annotation)
+  if convert is not _MISSING:
+    return convert
+
+  if not isinstance(annotation, type):
+    return None
+
+  builtin = _BUILTIN.get("%s:%s" % (annotation.__module__, annotation.__qualname__))
+  if builtin is not None:
+    (factory, expected) = builtin
+    convert = factory()
+    return convert if expected is None else _checked(convert, expected)
+
+  if hasattr(annotation, "__members__") and hasattr(annotation, "_value2member_map_"):
+    return _enum_converter(annotation)
+  elif hasattr(annotation, "__dataclass_fields__"):
+    return DataclassConverter(annotation)
+  return None
+
+
+class DataclassConverter:
+  """
+Builds a dataclass from a JSON object, or from the values of its fields
+given with `--name.field=value` and `--name.nested.field=value`.
+"""
+
+  def __init__(self, cls):
+    import dataclasses
+    import typing
+
+    self.cls = cls
+    try:
+      # Resolves annotations written as strings
+      hints = typing.get_type_hints(cls)
+    except Exception:
+      hints = {}
+    # Field name to (converter, required, nested `DataclassConverter` or None)
+    self.fields = {}
+    self.types = {}
+    for field in dataclasses.fields(cls):
+      if not field.init:
+        continue
+      required = (
+          field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING
+      )
+      annotation = hints.get(field.name, field.type)
+      convert = None if isinstance(annotation, str) else converter_for(annotation)
+      nested = convert if isinstance(convert, DataclassConverter) else None
+      self.fields[field.name] = (convert, required, nested)
+      self.types[field.name] = annotation
+
+  def field(self, path, prefix=""):
+    """The converter and type of the field at `path` (a list of names), raising for unknown fields"""
+    converter = self
+    for (index, name) in enumerate(path):
+      if converter is None or name not in converter.fields:
+        raise CommandParseException("Unknown field: %s%s" % (prefix, ".".join(path[: index + 1])))
+      (convert, _, nested) = converter.fields[name]
+      annotation = converter.types[name]
+      converter = nested
+    return (convert, annotation)
+
+  def __call__(self, value):
+    if isinstance(value, str):
+      import json
+
+      try:
+        value = json.loads(value)
+      except ValueError:
+        raise CommandParseException("Argument not valid: %r (expected a JSON object)" % value)
+    if isinstance(value, self.cls):
+      return value
+    if not isinstance(value, dict):
+      raise CommandParseException("Argument not valid: %r (expected an object)" % (value,))
+    return self.build(value)
+
+  def build(self, values, prefix=""):
+    """The dataclass from `values`, a dict by field name of strings, values or dicts for nested dataclasses"""
+    kv = {}
+    for (name, value) in values.items():
+      if name not in self.fields:
+        raise CommandParseException("Unknown field: %s%s" % (prefix, name))
+      (convert, _, nested) = self.fields[name]
+      if nested is not None and isinstance(value, dict):
+        kv[name] = nested.build(value, prefix + name + ".")
+      elif convert is not None and (isinstance(value, str) or nested is not None):
+        kv[name] = convert(value)
+      else:
+        kv[name] = value
+    for (name, (_, required, nested)) in self.fields.items():
+      if name in kv or not required:
+        continue
+      if nested is not None:
+        # A nested dataclass whose fields all have defaults needs no values
+        kv[name] = nested.build({}, prefix + name + ".")
+      else:
+        raise CommandParseException("No value provided for required argument: %s%s" % (prefix, name))
+    return self.cls(**kv)
@@ -1,8 +1,3 @@
-import sys
-
-from .clide.ansi import error
-
-
 class ExceptionWithHelp(Exception):
   def __init__(self, message, help_string=None):
     super().__init__(message)
@@ -12,12 +7,15 @@ class ExceptionWithHelp(Exception):
     self.help_string = help_string
 
   def print_help(self):
-    error(str(self))
-    if self.help_string:
-      # Since exception information can get very long, write the error both
-      # at the top and at the bottom.
-      sys.stderr.write("\n" + self.help_string + "\n")
-      error(str(self))
+    from .writer import status
+
+    with status.batch():
+      status.error(str(self))
+      if self.help_string:
+        # Since exception information can get very long, write the error both
+        # at the top and at the bottom.
+        status.write("\n" + self.help_string + "\n")
+        status.error(str(self))
 
 class CommandParseException(ExceptionWithHelp):
   def __init__(self, message, usage=None):
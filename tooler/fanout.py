@@ -0,0 +1,223 @@
+"""
+Running a command against many targets with a bounded pool of workers.
+
+Each target produces a record: `{"target": ..., "result": ...}` on success or
+`{"target": ..., "error": "..."}` if it raised or timed out. With `fail_fast`
+the first failure is raised instead, and targets not yet started are dropped.
+
+Only async targets are cancelled when they time out. A thread or process
+worker cannot be interrupted, so it keeps running its target, and the
+interpreter waits for it to finish before exiting.
+"""
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import functools
+import importlib
+import itertools
+import time
+
+from .exceptions import CommandParseException
+
+EXECUTORS = ("thread", "process", "async")
+
+
+def _error_record(target, error):
+  return {"target": target, "error": "%s: %s" % (type(error).__name__, error)}
+
+
+def _call_reference(reference, target, args, kv):
+  # Process workers look the function up by name, as the function the command
+  # was built from is not what pickle finds under that name once decorated
+  (module_name, qualname) = reference
+  fn = importlib.import_module(module_name)
+  for part in qualname.split("."):
+    fn = getattr(fn, part)
+  return fn(target, *args, **kv)
+
+
+def _reference(fn):
+  reference = (fn.__module__, fn.__qualname__)
+  if "<locals>" in fn.__qualname__:
+    raise CommandParseException(
+        "The process executor needs a module level function, not %s" % fn.__qualname__
+    )
+  return reference
+
+
+def _ordered(records, ordered):
+  # `records` yields (index, record) as targets complete
+  if not ordered:
+    for (_index, record) in records:
+      yield record
+    return
+
+  buffered = {}
+  next_index = 0
+  for (index, record) in records:
+    buffered[index] = record
+    while next_index in buffered:
+      yield buffered.pop(next_index)
+      next_index += 1
+
+
+def _iter_pool(pool, call, targets, parallel, fail_fast, timeout):
+  targets = enumerate(targets)
+  # future -> (index, target, deadline)
+  pending = {}
+
+  def submit():
+    for (index, target) in itertools.islice(targets, parallel - len(pending)):
+      deadline = None if timeout is None else time.monotonic() + timeout
+      pending[pool.submit(call, target)] = (index, target, deadline)
+
+  try:
+    submit()
+    while pending:
+      deadlines = [deadline for (_, _, deadline) in pending.values() if deadline is not None]
+      wait_for = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+      (done, _) = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+      for future in done:
+        (index, target, _deadline) = pending.pop(future)
+        try:
+          yield (index, {"target": target, "result": future.result()})
+        except Exception as e:
+          if fail_fast:
+            raise
+          yield (index, _error_record(target, e))
+
+      now = time.monotonic()
+      for (future, (index, target, deadline)) in list(pending.items()):
+        if deadline is not None and deadline <= now:
+          # A worker that already started cannot be interrupted, but we stop
+          # waiting for it
+          future.cancel()
+          del pending[future]
+          error = TimeoutError("Timed out after %ss" % timeout)
+          if fail_fast:
+            raise error
+          yield (index, _error_record(target, error))
+
+      submit()
+  finally:
+    for future in pending:
+      future.cancel()
+
+
+def iter_fan_out(
+    fn,
+    targets,
+    args=(),
+    kv=None,
+    *,
+    parallel=1,
+    executor="thread",
+    ordered=True,
+    fail_fast=False,
+    timeout=None,
+):
+  """
+Call `fn(target, *args, **kv)` for each target on a thread or process pool,
+yielding a record per target. Records come in target order, or as they
+complete when `ordered` is False. Only `parallel` targets are in flight at a
+time, so `targets` can be a lazy iterable.
+
+The generator returns False if any target failed, which `Tooler.run` takes
+as the result of a streamed command.
+"""
+  kv = kv or {}
+  if executor == "thread":
+    pool_class = ThreadPoolExecutor
+    call = functools.partial(_call_target, fn, args, kv)
+  elif executor == "process":
+    pool_class = ProcessPoolExecutor
+    call = functools.partial(_call_reference, _reference(fn), args=args, kv=kv)
+  else:
+    raise CommandParseException(
+        "Executor %r can not be iterated, expected one of thread or process" % executor
+    )
+
+  pool = pool_class(max_workers=parallel)
+  failed = False
+  try:
+    for record in _ordered(_iter_pool(pool, call, targets, parallel, fail_fast, timeout), ordered):
+      failed = failed or "error" in record
+      yield record
+  finally:
+    # Drop the targets not yet started without waiting on the running ones.
+    # Their workers are still joined when the interpreter exits.
+    pool.shutdown(wait=False, cancel_futures=True)
+  return False if failed else None
+
+
+def _call_target(fn, args, kv, target):
+  return fn(target, *args, **kv)
+
+
+async def fan_out_async(
+    fn, targets, args=(), kv=None, *, parallel=1, ordered=True, fail_fast=False, timeout=None
+):
+  """
+Await `fn(target, *args, **kv)` for each target with at most `parallel` running
+at once, returning the records. Functions that are not coroutine functions are
+run in the default thread executor. Timed out targets are cancelled.
+"""
+  kv = kv or {}
+
+  if asyncio.iscoroutinefunction(fn):
+    call = fn
+  else:
+    call = functools.partial(asyncio.to_thread, fn)
+
+  async def run_target(target):
+    try:
+      return await asyncio.wait_for(call(target, *args, **kv), timeout)
+    except asyncio.TimeoutError:
+      raise TimeoutError("Timed out after %ss" % timeout) from None
+
+  targets = enumerate(targets)
+  # task -> (index, target)
+  pending = {}
+  records = []
+  try:
+    while True:
+      for (index, target) in itertools.islice(targets, parallel - len(pending)):
+        pending[asyncio.ensure_future(run_target(target))] = (index, target)
+      if not pending:
+        break
+
+      (done, _) = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+      for task in done:
+        (index, target) = pending.pop(task)
+        try:
+          records.append((index, {"target": target, "result": task.result()}))
+        except Exception as e:
+          if fail_fast:
+            raise
+          records.append((index, _error_record(target, e)))
+  finally:
+    for task in pending:
+      task.cancel()
+
+  if ordered:
+    records.sort(key=lambda record: record[0])
+  return [record for (_index, record) in records]
+
+
+def fan_out(fn, targets, args=(), kv=None, *, executor="thread", stream=False, **options):
+  """
+Run `fn` across `targets`, see `iter_fan_out`. With the async executor this
+returns a coroutine resolving to the records, otherwise the list of records
+(or a generator of them with `stream`).
+"""
+  if executor not in EXECUTORS:
+    raise CommandParseException(
+        "Unknown executor %r, expected one of %s" % (executor, ", ".join(EXECUTORS))
+    )
+  if executor == "async" or asyncio.iscoroutinefunction(fn):
+    return fan_out_async(fn, targets, args, kv, **options)
+  if executor == "process":
+    # Fail before any output is written rather than when first iterated
+    _reference(fn)
+  records = iter_fan_out(fn, targets, args, kv, executor=executor, **options)
+  return records if stream else list(records)
@@ -0,0 +1,394 @@
+"""
+File argument types that avoid copying large inputs into memory.
+
+`MappedFile`, `mmap.mmap` and `memoryview` annotated arguments map regular
+files read-only. Pipes (and stdin when it is not a regular file) cannot be
+mapped: `MappedFile` reads them in chunks instead, while `mmap.mmap` and
+`memoryview` spool them to an unlinked temporary file first so the data is
+still backed by the page cache rather than the heap.
+
+`StreamInput` arguments are read by a background thread ahead of the command,
+decompressing gzip, bzip2, xz and zstd (which needs `zstandard` installed)
+inputs detected by their magic bytes.
+"""
+import io
+import mmap
+import os
+import stat
+import sys
+
+from .exceptions import CommandParseException
+
+CHUNK_SIZE = 1 << 20
+
+# Chunks `StreamInput` reads ahead of the command
+READAHEAD = 4
+
+
+def _open(value):
+  if value == "-":
+    # Duplicate the descriptor so closing the argument leaves stdin usable
+    return os.fdopen(os.dup(sys.stdin.buffer.fileno()), "rb")
+  return open(value, "rb")
+
+
+def _is_regular(f):
+  return stat.S_ISREG(os.fstat(f.fileno()).st_mode)
+
+
+def _map(f):
+  mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  if hasattr(mapped, "madvise"):
+    # Most commands scan their input front to back
+    mapped.madvise(mmap.MADV_SEQUENTIAL)
+  return mapped
+
+
+def _spool(f):
+  import shutil
+  import tempfile
+
+  spooled = tempfile.TemporaryFile()
+  shutil.copyfileobj(f, spooled, CHUNK_SIZE)
+  spooled.flush()
+  return spooled
+
+
+def map_file(value):
+  """Map the file at `value` (or stdin for `-`) as a read-only `mmap.mmap`"""
+  with _open(value) as f:
+    if not _is_regular(f):
+      f = _spool(f)
+    with f:
+      if os.fstat(f.fileno()).st_size == 0:
+        raise CommandParseException("Cannot map an empty file: %s" % value)
+      return _map(f)
+
+
+def map_view(value):
+  """A read-only `memoryview` of the file at `value` (or stdin for `-`)"""
+  with _open(value) as f:
+    if not _is_regular(f):
+      f = _spool(f)
+    with f:
+      if os.fstat(f.fileno()).st_size == 0:
+        return memoryview(b"")
+      return memoryview(_map(f))
+
+
+class MappedFile:
+  """
+Read-only view of a file argument. Regular files are memory mapped and sliced
+without copying; pipes and stdin are read in chunks as they are consumed.
+"""
+
+  def __init__(self, f, name=None):
+    self.name = name
+    self._file = f
+    self._map = None
+    # Size of regular files, `None` for streams
+    self._size = None
+    if _is_regular(f):
+      self._size = os.fstat(f.fileno()).st_size
+      if self._size > 0:
+        self._map = _map(f)
+      # The mapping stays valid without the file
+      f.close()
+      self._file = None
+
+  @classmethod
+  def open(cls, value):
+    return cls(_open(value), name=value)
+
+  @property
+  def mapped(self):
+    """Whether the file is memory mapped, rather than read as a stream"""
+    return self._size is not None
+
+  def __len__(self):
+    if self._size is None:
+      raise TypeError("Length is not known for a streamed file")
+    return self._size
+
+  def __getitem__(self, key):
+    if self._size is None:
+      raise TypeError("Streamed files cannot be indexed, use chunks() or lines()")
+    return b""[key] if self._map is None else self._map[key]
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def chunks(self, size=CHUNK_SIZE):
+    """Iterate over the contents in chunks, as memoryviews for mapped files"""
+    if self._map is not None:
+      view = memoryview(self._map)
+      try:
+        for offset in range(0, len(view), size):
+          yield view[offset:offset + size]
+      finally:
+        view.release()
+    elif self._file is not None:
+      yield from iter(lambda: self._file.read(size), b"")
+
+  def lines(self):
+    """Iterate over the lines of the file, including line endings"""
+    if self._map is not None:
+      self._map.seek(0)
+      yield from iter(self._map.readline, b"")
+    elif self._file is not None:
+      yield from self._file
+
+  def read(self):
+    """Copy the whole contents into a bytes object"""
+    if self._map is not None:
+      return self._map[:]
+    elif self._file is not None:
+      return self._file.read()
+    return b""
+
+  def close(self):
+    if self._map is not None:
+      _close_map(self._map)
+      self._map = None
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+
+class _Prefixed:
+  """A binary file with `head`, already read from it, put back in front"""
+
+  def __init__(self, head, f):
+    self._head = head
+    self._file = f
+
+  def readable(self):
+    return True
+
+  def read(self, size=-1):
+    head = self._head
+    if not head:
+      return self._file.read(size)
+    elif size is not None and 0 <= size <= len(head):
+      self._head = head[size:]
+      return head[:size]
+    self._head = b""
+    rest = self._file.read(-1 if size is None or size < 0 else size - len(head))
+    return head + rest
+
+  def close(self):
+    self._file.close()
+
+
+# Longest magic `_decompressed` looks for
+MAGIC_SIZE = 6
+
+
+def _decompressed(f):
+  """Wrap a buffered binary file in a decompressor if it starts with a known magic"""
+  head = f.peek(MAGIC_SIZE)[:MAGIC_SIZE]
+  if len(head) < MAGIC_SIZE:
+    # A pipe can have less than that available, so wait for the rest (or the
+    # end of the input) and put it back in front
+    head = f.read(MAGIC_SIZE)
+    f = _Prefixed(head, f)
+
+  if head.startswith(b"\x1f\x8b"):
+    import gzip
+
+    return gzip.GzipFile(fileobj=f, mode="rb")
+  elif head.startswith(b"BZh"):
+    import bz2
+
+    return bz2.BZ2File(f, mode="rb")
+  elif head.startswith(b"\xfd7zXZ\x00"):
+    import lzma
+
+    return lzma.LZMAFile(f, mode="rb")
+  elif head.startswith(b"\x28\xb5\x2f\xfd"):
+    try:
+      import zstandard
+    except ImportError:
+      raise CommandParseException("Reading zstd compressed input needs zstandard installed")
+    return zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+  return f
+
+
+class _EndOfStream:
+  pass
+
+
+class StreamInput:
+  """
+Input read sequentially by a background thread, iterate it for lines or use
+`chunks()`. Compressed input is decompressed transparently.
+"""
+
+  def __init__(self, f, name=None, chunk_size=CHUNK_SIZE, readahead=READAHEAD):
+    import queue
+    import threading
+
+    self.name = name
+    self.chunk_size = chunk_size
+    self._file = f
+    try:
+      self._stream = _decompressed(f)
+    except BaseException:
+      f.close()
+      raise
+    self._queue = queue.Queue(maxsize=readahead)
+    self._stop = threading.Event()
+    self._thread = None
+    self._done = False
+    # The files are closed by whichever of `close()` and the reader thread
+    # finishes last, so they are never closed while being read
+    self._lock = threading.Lock()
+    self._reading = False
+    self._closed = False
+
+  @classmethod
+  def open(cls, value):
+    return cls(_open(value), name=value)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def _read_ahead(self):
+    import queue
+
+    try:
+      for chunk in iter(lambda: self._stream.read(self.chunk_size), b""):
+        while not self._stop.is_set():
+          try:
+            self._queue.put(chunk, timeout=0.1)
+            break
+          except queue.Full:
+            pass
+        if self._stop.is_set():
+          return
+      self._queue.put(_EndOfStream)
+    except BaseException as e:
+      self._queue.put(e)
+    finally:
+      with self._lock:
+        self._reading = False
+        if self._closed:
+          self._close_files()
+
+  def _chunks(self):
+    if self._done:
+      return
+    if self._thread is None:
+      import threading
+
+      self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+      self._reading = True
+      self._thread.start()
+
+    while True:
+      chunk = self._queue.get()
+      if chunk is _EndOfStream:
+        self._done = True
+        return
+      elif isinstance(chunk, BaseException):
+        self._done = True
+        raise chunk
+      yield chunk
+
+  def chunks(self, size=None):
+    """
+Iterate over the (decompressed) contents as they are read. With `size` every
+chunk but the last is exactly `size` bytes.
+"""
+    if size is None:
+      yield from self._chunks()
+      return
+
+    pending = b""
+    for chunk in self._chunks():
+      pending += chunk
+      if len(pending) >= size:
+        view = memoryview(pending)
+        end = len(pending) - len(pending) % size
+        for offset in range(0, end, size):
+          yield bytes(view[offset:offset + size])
+        view.release()
+        pending = pending[end:]
+    if pending:
+      yield pending
+
+  def __iter__(self):
+    """Iterate over the lines of the input, including line endings"""
+    pending = b""
+    for chunk in self._chunks():
+      data = pending + chunk if pending else chunk
+      start = 0
+      while True:
+        end = data.find(b"\n", start)
+        if end < 0:
+          break
+        yield data[start:end + 1]
+        start = end + 1
+      pending = data[start:]
+    if pending:
+      yield pending
+
+  def read(self):
+    """Read everything that is left into one bytes object"""
+    return b"".join(self._chunks())
+
+  def close(self):
+    import queue
+
+    self._stop.set()
+    if self._thread is not None:
+      # Make room in case the reader is waiting on a full queue
+      try:
+        self._queue.get_nowait()
+      except queue.Empty:
+        pass
+      self._thread.join(timeout=1)
+      self._thread = None
+    with self._lock:
+      self._closed = True
+      if self._reading:
+        # Still blocked reading a pipe, the daemon thread closes the files
+        # once that read returns
+        return
+      self._close_files()
+
+  def _close_files(self):
+    if self._stream is not self._file:
+      self._stream.close()
+    self._file.close()
+
+
+def _close_map(mapped):
+  try:
+    mapped.close()
+  except BufferError:
+    # The command kept slices of the map around, which keep it alive until
+    # they are garbage collected
+    pass
+
+
+def close_argument(value):
+  """Close a file opened for an argument, returns False for other values"""
+  if isinstance(value, (io.IOBase, MappedFile, StreamInput)):
+    value.close()
+  elif isinstance(value, mmap.mmap):
+    _close_map(value)
+  elif isinstance(value, memoryview):
+    mapped = value.obj
+    value.release()
+    if isinstance(mapped, mmap.mmap):
+      _close_map(mapped)
+  else:
+    return False
+  return True
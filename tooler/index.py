@@ -0,0 +1,138 @@
+"""
+Index over command names for completion and "did you mean" suggestions.
+
+Names are kept in a prefix trie for completion and in an n-gram index for
+substring search and finding near misses, both updated as commands are added.
+"""
+from __future__ import annotations
+
+from collections import Counter
+
+# Longest n-gram indexed; shorter ones are indexed too so short queries can be
+# answered straight from the index
+GRAM_SIZE = 3
+
+# Number of candidates sharing the most n-grams that get an edit distance check
+SUGGEST_CANDIDATES = 20
+
+# n-grams found in more than this share of all names say little about
+# similarity, and are skipped when looking for near misses
+COMMON_GRAM_RATIO = 0.1
+
+
+class _TrieNode:
+  __slots__ = ("children", "terminal")
+
+  def __init__(self):
+    self.children: dict[str, _TrieNode] = {}
+    self.terminal = False
+
+
+def _grams(text, size):
+  return {text[idx:idx + size] for idx in range(len(text) - size + 1)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+  """Levenshtein distance between `a` and `b`, or `limit + 1` if above `limit`"""
+  if abs(len(a) - len(b)) > limit:
+    return limit + 1
+
+  # Only cells within `limit` of the diagonal can stay under the limit
+  over = limit + 1
+  previous = [j if j <= limit else over for j in range(len(b) + 1)]
+  for i in range(1, len(a) + 1):
+    char_a = a[i - 1]
+    low = max(1, i - limit)
+    high = min(len(b), i + limit)
+    current = [over] * (len(b) + 1)
+    current[0] = i if i <= limit else over
+    for j in range(low, high + 1):
+      current[j] = min(
+          previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != b[j - 1])
+      )
+    if min(current[low - 1:high + 1]) > limit:
+      return over
+    previous = current
+  return min(previous[-1], over)
+
+
+class CommandIndex:
+  def __init__(self):
+    self._root = _TrieNode()
+    self._grams: dict[str, set[str]] = {}
+    self._count = 0
+
+  def add(self, name: str):
+    node = self._root
+    for char in name:
+      node = node.children.setdefault(char, _TrieNode())
+    if node.terminal:
+      return
+    node.terminal = True
+    self._count += 1
+
+    for size in range(1, GRAM_SIZE + 1):
+      for gram in _grams(name, size):
+        self._grams.setdefault(gram, set()).add(name)
+
+  def complete(self, prefix: str) -> list[str]:
+    """All names starting with `prefix`, in sorted order"""
+    node = self._root
+    for char in prefix:
+      node = node.children.get(char)
+      if node is None:
+        return []
+
+    names = []
+    stack = [(prefix, node)]
+    while stack:
+      (name, node) = stack.pop()
+      if node.terminal:
+        names.append(name)
+      for char in sorted(node.children, reverse=True):
+        stack.append((name + char, node.children[char]))
+    return names
+
+  def search(self, text: str) -> set[str]:
+    """All names containing `text`"""
+    if not text:
+      # Every name contains the empty string, and it has no n-grams
+      return set(self.complete(""))
+    if len(text) <= GRAM_SIZE:
+      return set(self._grams.get(text, ()))
+
+    postings = sorted(
+        (self._grams.get(gram, set()) for gram in _grams(text, GRAM_SIZE)), key=len
+    )
+    candidates = set(postings[0]).intersection(*postings[1:])
+    return {name for name in candidates if text in name}
+
+  def suggest(self, text: str) -> list[str]:
+    """
+Names similar to `text`: everything containing it plus near misses by edit
+distance, closest first.
+"""
+    if not text:
+      return self.complete("")
+    limit = max(2, len(text) // 3)
+
+    postings = sorted(
+        (self._grams.get(gram, set()) for gram in _grams(text, min(GRAM_SIZE, len(text)))),
+        key=len,
+    )
+    common = max(SUGGEST_CANDIDATES, self._count * COMMON_GRAM_RATIO)
+    shared = Counter()
+    for (idx, names) in enumerate(postings):
+      if idx > 0 and len(names) > common:
+        break
+      shared.update(names)
+
+    # Names containing `text` are exactly their extra length away from it
+    matches = {name: len(name) - len(text) for name in self.search(text)}
+    for (name, _count) in shared.most_common(SUGGEST_CANDIDATES):
+      if name not in matches:
+        distance = edit_distance(text, name, limit)
+        if distance <= limit:
+          matches[name] = distance
+
+    return sorted(matches, key=lambda name: (matches[name], name))
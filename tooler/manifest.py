@@ -0,0 +1,225 @@
+"""
+On-disk manifest of a tool's commands.
+
+The manifest holds everything needed to answer `--bash-completion` and
+`<command> --help` without importing the modules that implement the commands,
+or the toolers mounted by reference. Mounted toolers are nested under their
+command as manifests of their own.
+It records the source files it was built from, and what each command is
+registered as, and is thrown away as soon as any of them change.
+"""
+import hashlib
+import json
+import os
+
+from .command import DecoratorCommand, LazyCommand, MountCommand
+from .parser import DefaultParser
+
+MANIFEST_VERSION = 3
+
+
+def _file_hash(path):
+  digest = hashlib.sha256()
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(1 << 16), b""):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def _fingerprint(path):
+  stat = os.stat(path)
+  return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": _file_hash(path)}
+
+
+def _source_file(fn):
+  while hasattr(fn, "__wrapped__"):
+    fn = fn.__wrapped__
+  code = getattr(fn, "__code__", None)
+  return code.co_filename if code is not None else None
+
+
+def _reference(command):
+  """What `command` is registered as, a "module:name" reference"""
+  reference = getattr(command, "reference", None)
+  if reference is not None:
+    return reference
+  target = getattr(command, "fn", None) or type(command)
+  return "%s:%s" % (target.__module__, target.__qualname__)
+
+
+def _describe_command(command, reference):
+  entry = {
+      "reference": reference,
+      "doc": command.doc,
+      "usage": None,
+      "shorthands": {},
+      "options": [],
+  }
+  if not isinstance(command, DecoratorCommand):
+    return entry
+
+  entry["usage"] = command.usage()
+  if isinstance(command.parser, DefaultParser):
+    plan = command.parser.plan(command.fn)
+    entry["shorthands"] = dict(plan.shorthands)
+    keys = set(plan.flags)
+    for param in plan.params:
+      if param.inject is not None:
+        continue
+      if param.kind not in (param.kind.VAR_POSITIONAL, param.kind.VAR_KEYWORD):
+        keys.add(param.name)
+    entry["options"] = sorted("--" + key.replace("_", "-") for key in keys)
+  return entry
+
+
+def _describe_tooler(tooler, sources):
+  commands = {}
+  default = None
+
+  for name, command in tooler.commands.items():
+    if command is tooler.default_command:
+      default = name
+    reference = _reference(command)
+    if isinstance(command, LazyCommand):
+      command = command.resolve()
+
+    commands[name] = _describe_command(command, reference)
+    if isinstance(command, MountCommand):
+      commands[name]["mount"] = _describe_tooler(command.resolve(), sources)
+    source = _source_file(getattr(command, "fn", None))
+    if source is not None and os.path.exists(source):
+      sources.add(source)
+
+  return {"default": default, "commands": commands}
+
+
+def build_manifest(tooler):
+  """
+Build the manifest for a tooler. This resolves (and so imports) every lazy
+command and mount, so it should only be done when the stored manifest is stale.
+"""
+  sources = set()
+  manifest = {"version": MANIFEST_VERSION, **_describe_tooler(tooler, sources)}
+  manifest["sources"] = {source: _fingerprint(source) for source in sorted(sources)}
+  return manifest
+
+
+def _source_unchanged(path, fingerprint):
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return False
+
+  if stat.st_mtime_ns == fingerprint["mtime_ns"] and stat.st_size == fingerprint["size"]:
+    return True
+  # The file was touched, only a content change invalidates the manifest
+  return stat.st_size == fingerprint["size"] and _file_hash(path) == fingerprint["sha256"]
+
+
+def load_manifest(path, tooler):
+  """Load the manifest at `path`, returns `None` if it is missing or stale"""
+  try:
+    with open(path, "r", encoding="utf-8") as f:
+      manifest = json.load(f)
+  except (OSError, ValueError):
+    return None
+
+  if manifest.get("version") != MANIFEST_VERSION:
+    return None
+
+  # Commands registered on the tooler itself are always known, so check those
+  # match before looking at any source files
+  if not _matches(manifest, tooler):
+    return None
+
+  for source, fingerprint in manifest["sources"].items():
+    if not _source_unchanged(source, fingerprint):
+      return None
+
+  return manifest
+
+
+def _matches(described, tooler):
+  default = None
+  for name, command in tooler.commands.items():
+    if command is tooler.default_command:
+      default = name
+  if described["default"] != default or set(described["commands"]) != set(tooler.commands):
+    return False
+
+  for name, command in tooler.commands.items():
+    entry = described["commands"][name]
+    # A command can keep its name but be registered to another function
+    if entry["reference"] != _reference(command):
+      return False
+    # Mounts by reference are covered by their sources, those given directly
+    # are checked like the tooler itself
+    if isinstance(command, MountCommand) and command.resolved:
+      if "mount" not in entry or not _matches(entry["mount"], command.resolve()):
+        return False
+  return True
+
+
+def save_manifest(path, manifest):
+  # Write to a temporary file first so a concurrent reader never sees a
+  # partial manifest
+  tmp_path = "%s.%d.tmp" % (path, os.getpid())
+  try:
+    with open(tmp_path, "w", encoding="utf-8") as f:
+      json.dump(manifest, f)
+    os.replace(tmp_path, path)
+  except OSError:
+    # A read-only location just means we rebuild the manifest next time
+    try:
+      os.unlink(tmp_path)
+    except OSError:
+      pass
+
+
+def _entry(manifest, words):
+  # The entry of the command named by `words`, following mounts
+  described = manifest
+  entry = None
+  for name in words:
+    if described is None:
+      return None
+    entry = described["commands"].get(name)
+    if entry is None:
+      return None
+    described = entry.get("mount")
+  return entry
+
+
+def complete_commands(manifest, words, word):
+  """
+Commands completing `words[word]` of bash's COMP_WORDS, following mounts for
+the words before it. Returns `None` when it is not a command position.
+"""
+  if word < 1:
+    return None
+  described = manifest
+  if word > 1:
+    entry = _entry(manifest, words[1:word])
+    if entry is None or "mount" not in entry:
+      return None
+    described = entry["mount"]
+  current = words[word] if word < len(words) else ""
+  return sorted(name for name in described["commands"] if name.startswith(current))
+
+
+def complete_options(manifest, words, word):
+  """
+Options of the command in `words` before `words[word]` that complete it,
+following bash's COMP_WORDS.
+"""
+  current = words[word] if word < len(words) else ""
+  if not current.startswith("-"):
+    return []
+  # The command is the first word that is not a mount
+  for end in range(2, word + 1):
+    entry = _entry(manifest, words[1:end])
+    if entry is None:
+      return []
+    elif "mount" not in entry:
+      return [option for option in entry["options"] if option.startswith(current)]
+  return []
@@ -0,0 +1,246 @@
+"""
+Metrics for command runs, sent to pluggable sinks.
+
+Each run produces a `MetricsRecord` holding the command's phase timings (see
+`tooler.profiling`), its exit status and the type of any exception it raised.
+Records are handed to the sinks from a background thread, so a slow sink never
+holds up the command, and anything pending is flushed when the process exits.
+"""
+from __future__ import annotations
+
+import atexit
+import fcntl
+import json
+import os
+import queue
+import socket
+import threading
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# How long to wait for pending records when exiting
+EXIT_TIMEOUT = 1.0
+
+
+class MetricsRecord(NamedTuple):
+  command: str
+  status: int
+  exception: str | None
+  timings: dict[str, float]
+
+  @property
+  def duration(self):
+    return sum(self.timings.values())
+
+
+class MetricsSink:
+  def emit(self, record: MetricsRecord):
+    raise Exception("not implemented")
+
+
+class MemorySink(MetricsSink):
+  """Keeps records in `records`, for tests"""
+
+  def __init__(self):
+    self.records = []
+
+  def emit(self, record):
+    self.records.append(record)
+
+
+def _statsd_name(value):
+  return "".join(c if c.isalnum() or c in "-_" else "_" for c in value)
+
+
+class StatsdSink(MetricsSink):
+  """
+Sends a timer per phase and counters for the status and exception of each run
+to a StatsD server, in one UDP datagram per run.
+"""
+
+  def __init__(self, host="127.0.0.1", port=8125, prefix="tooler"):
+    self.address = (host, port)
+    self.prefix = prefix
+    self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+  def lines(self, record):
+    name = "%s.%s" % (self.prefix, _statsd_name(record.command))
+    lines = ["%s.%s:%.3f|ms" % (name, phase, seconds * 1000)
+             for (phase, seconds) in record.timings.items()]
+    lines.append("%s.duration:%.3f|ms" % (name, record.duration * 1000))
+    lines.append("%s.status.%d:1|c" % (name, record.status))
+    if record.exception is not None:
+      lines.append("%s.exception.%s:1|c" % (name, _statsd_name(record.exception)))
+    return lines
+
+  def emit(self, record):
+    try:
+      self.socket.sendto("\n".join(self.lines(record)).encode("utf-8"), self.address)
+    except OSError:
+      # Metrics are best effort
+      pass
+
+
+def _labels(**labels):
+  return ",".join(
+      '%s="%s"' % (key, value.replace("\\", "\\\\").replace('"', '\\"'))
+      for (key, value) in labels.items()
+  )
+
+
+class PrometheusTextfileSink(MetricsSink):
+  """
+Writes run counts and latency histograms to `path` for the node exporter's
+textfile collector.
+
+Every run is a process of its own, so the totals are kept in a JSON state
+file next to `path` that runs update under a lock, before rewriting `path`
+from it.
+"""
+
+  def __init__(self, path):
+    self.path = os.fspath(path)
+    self.state_path = self.path + ".state"
+
+  def emit(self, record):
+    with open(self.state_path + ".lock", "w") as lock:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      try:
+        with open(self.state_path, "r", encoding="utf-8") as f:
+          state = json.load(f)
+      except (OSError, ValueError):
+        state = {"runs": {}, "exceptions": {}, "durations": {}}
+
+      self._update(state, record)
+      self._write(self.state_path, json.dumps(state))
+      self._write(self.path, self.render(state))
+
+  def _update(self, state, record):
+    key = json.dumps([record.command, str(record.status)])
+    state["runs"][key] = state["runs"].get(key, 0) + 1
+    if record.exception is not None:
+      key = json.dumps([record.command, record.exception])
+      state["exceptions"][key] = state["exceptions"].get(key, 0) + 1
+
+    timings = dict(record.timings, total=record.duration)
+    for (phase, seconds) in timings.items():
+      key = json.dumps([record.command, phase])
+      histogram = state["durations"].setdefault(
+          key, {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0}
+      )
+      for (index, bound) in enumerate(BUCKETS):
+        if seconds <= bound:
+          histogram["buckets"][index] += 1
+      histogram["count"] += 1
+      histogram["sum"] += seconds
+
+  def render(self, state):
+    lines = [
+        "# HELP tooler_command_runs_total Command runs by exit status",
+        "# TYPE tooler_command_runs_total counter",
+    ]
+    for (key, count) in sorted(state["runs"].items()):
+      (command, status) = json.loads(key)
+      labels = _labels(command=command, status=status)
+      lines.append("tooler_command_runs_total{%s} %d" % (labels, count))
+
+    lines += [
+        "# HELP tooler_command_exceptions_total Exceptions raised by commands",
+        "# TYPE tooler_command_exceptions_total counter",
+    ]
+    for (key, count) in sorted(state["exceptions"].items()):
+      (command, exception) = json.loads(key)
+      labels = _labels(command=command, exception=exception)
+      lines.append("tooler_command_exceptions_total{%s} %d" % (labels, count))
+
+    lines += [
+        "# HELP tooler_command_duration_seconds Time taken by each phase of a command run",
+        "# TYPE tooler_command_duration_seconds histogram",
+    ]
+    for (key, histogram) in sorted(state["durations"].items()):
+      (command, phase) = json.loads(key)
+      labels = _labels(command=command, phase=phase)
+      for (bound, count) in zip(BUCKETS, histogram["buckets"]):
+        lines.append(
+            'tooler_command_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, count)
+        )
+      lines.append(
+          'tooler_command_duration_seconds_bucket{%s,le="+Inf"} %d' % (labels, histogram["count"])
+      )
+      lines.append("tooler_command_duration_seconds_sum{%s} %f" % (labels, histogram["sum"]))
+      lines.append("tooler_command_duration_seconds_count{%s} %d" % (labels, histogram["count"]))
+    return "\n".join(lines) + "\n"
+
+  def _write(self, path, data):
+    # The collector must never see a partial file
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w", encoding="utf-8") as f:
+      f.write(data)
+    os.replace(tmp_path, path)
+
+
+def sink_from_url(url):
+  """
+Sink for a `$TOOLER_METRICS` style URL: "statsd://host:port" or
+"prometheus:///path/to/file.prom".
+"""
+  parts = urlsplit(url)
+  if parts.scheme == "statsd":
+    return StatsdSink(parts.hostname or "127.0.0.1", parts.port or 8125)
+  elif parts.scheme == "prometheus":
+    return PrometheusTextfileSink(parts.path)
+  raise ValueError("Unknown metrics sink: %s" % url)
+
+
+class Metrics:
+  """
+Hands records to `sinks` from a background thread, started with the first
+record.
+"""
+
+  def __init__(self):
+    self.sinks = []
+    self._queue = queue.Queue()
+    self._thread = None
+
+  def __bool__(self):
+    return bool(self.sinks)
+
+  def add_sink(self, sink):
+    self.sinks.append(sink)
+
+  def emit(self, record):
+    if self._thread is None:
+      self._thread = threading.Thread(target=self._worker, name="tooler-metrics", daemon=True)
+      self._thread.start()
+      atexit.register(self.flush, EXIT_TIMEOUT)
+    self._queue.put(record)
+
+  def _worker(self):
+    while True:
+      record = self._queue.get()
+      try:
+        for sink in self.sinks:
+          try:
+            sink.emit(record)
+          except Exception:
+            # A broken sink must not take down the command, or other sinks
+            pass
+      finally:
+        self._queue.task_done()
+
+  def flush(self, timeout=None):
+    """Wait for pending records to reach the sinks, for up to `timeout` seconds"""
+    if self._thread is None:
+      return
+    if timeout is None:
+      self._queue.join()
+      return
+
+    # `Queue.join` has no timeout, so wait on it from another thread
+    waiter = threading.Thread(target=self._queue.join, daemon=True)
+    waiter.start()
+    waiter.join(timeout)
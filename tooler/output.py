@@ -1,27 +1,416 @@
 import json
+import os
 import sys
+from types import GeneratorType
 
+from .exceptions import CommandParseException
+from .writer import stdout_writer
+
+
+# JSON serializers by name, each `dumps(body, pretty)` returns UTF-8 bytes and
+# raises `TypeError` for values it cannot serialize. `pretty` output is
+# indented and has sorted keys.
+SERIALIZERS = {}
+
+# Preferred order when picking a serializer automatically
+SERIALIZER_PREFERENCE = ["orjson", "msgspec", "ujson", "json"]
+
+_serializer = None
+
+
+def register_serializer(name, dumps):
+  SERIALIZERS[name] = dumps
+
+
+def _json_dumps(body, pretty=False):
+  if pretty:
+    return json.dumps(body, sort_keys=True, indent=2, ensure_ascii=False).encode("utf-8")
+  return json.dumps(body, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _orjson_dumps(body, pretty=False):
+  import orjson
+
+  option = orjson.OPT_NON_STR_KEYS
+  if pretty:
+    option |= orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+  return orjson.dumps(body, option=option)
 
-def output_json(json_string):
-  if not sys.stdout.isatty():
-    print(json_string)
-    return
+
+def _msgspec_dumps(body, pretty=False):
+  import msgspec
 
   try:
-    # If we have pygments installed, we can pretty print with color
-    from pygments import highlight
-    from pygments.formatters import TerminalFormatter
-    from pygments.lexers import JsonLexer
+    data = msgspec.json.encode(body, order="sorted" if pretty else None)
+  except msgspec.EncodeError as e:
+    raise TypeError(str(e))
+  return msgspec.json.format(data, indent=2) if pretty else data
+
+
+def _ujson_dumps(body, pretty=False):
+  import ujson
+
+  return ujson.dumps(
+      body,
+      ensure_ascii=False,
+      escape_forward_slashes=False,
+      sort_keys=pretty,
+      indent=2 if pretty else 0,
+  ).encode("utf-8")
+
+
+register_serializer("json", _json_dumps)
+register_serializer("orjson", _orjson_dumps)
+register_serializer("msgspec", _msgspec_dumps)
+register_serializer("ujson", _ujson_dumps)
 
-    print(highlight(json_string, JsonLexer(), TerminalFormatter()), end="")
-  except ImportError:
-    print(json_string)
+
+def get_serializer():
+  """
+The JSON serializer in use: `$TOOLER_JSON_SERIALIZER` if set, otherwise the
+fastest one installed.
+"""
+  global _serializer
+  if _serializer is None:
+    name = os.environ.get("TOOLER_JSON_SERIALIZER")
+    if name is not None and name not in SERIALIZERS:
+      from .writer import status
+
+      status.warn(
+          "Unknown $TOOLER_JSON_SERIALIZER %r, expected one of %s; picking one instead"
+          % (name, ", ".join(sorted(SERIALIZERS)))
+      )
+      name = None
+    if name is None:
+      import importlib.util
+
+      name = next(
+          name
+          for name in SERIALIZER_PREFERENCE
+          if name == "json" or importlib.util.find_spec(name) is not None
+      )
+    _serializer = SERIALIZERS[name]
+  return _serializer
+
+
+def dumps(body, pretty=False):
+  """Serialize `body` to JSON bytes with the preferred serializer"""
+  serializer = get_serializer()
+  try:
+    return serializer(body, pretty)
+  except TypeError:
+    # Serializers differ in what they support (such as big integers), so give
+    # the standard library a chance before giving up
+    if serializer is _json_dumps:
+      raise
+    return _json_dumps(body, pretty)
 
 
-def output_default(body):
+def _dumps_line(body):
   try:
-    json_string = json.dumps(body, sort_keys=True, indent=2, ensure_ascii=False)
-    output_json(json_string)
+    return dumps(body)
   except TypeError:
-    # If we couldn't convert to json, just output the python str version
-    print(str(body))
+    return json.dumps(body, separators=(",", ":"), ensure_ascii=False, default=str).encode(
+        "utf-8"
+    )
+
+
+def _write(data: bytes):
+  stdout_writer().write(data)
+
+
+def _flush():
+  stdout_writer().flush()
+
+
+class _TextOutput:
+  """
+Text for the stdout writer, such as rows from `csv.writer`. Lines are encoded
+a batch at a time, which is much cheaper than one at a time.
+"""
+
+  def __init__(self, batch=512):
+    self.batch = batch
+    self._pending = []
+
+  def write(self, text):
+    self._pending.append(text)
+    if len(self._pending) >= self.batch:
+      self._send()
+
+  def flush(self):
+    self._send()
+    _flush()
+
+  def _send(self):
+    if self._pending:
+      _write("".join(self._pending).encode("utf-8"))
+      self._pending = []
+
+
+def output_json(json_string, body=None):
+  """
+Write a JSON document, colored on a terminal. Pass the `body` it was
+serialized from, if at hand, so it is colored without parsing it back.
+"""
+  if not sys.stdout.isatty():
+    _write(json_string.encode("utf-8"))
+    _write(b"\n")
+    _flush()
+    return
+
+  from .colorize import output_pretty
+
+  output_pretty(json.loads(json_string) if body is None else body)
+
+
+class OutputFormat:
+  def write(self, body):
+    raise NotImplementedError()
+
+  def stream(self, items):
+    """Write items as they are produced, flushing after each"""
+    raise NotImplementedError()
+
+
+class PrettyFormat(OutputFormat):
+  """Indented JSON with sorted keys, colored on a terminal"""
+
+  def write(self, body):
+    if sys.stdout.isatty():
+      # Colored as the result is walked, without serializing it first
+      from .colorize import output_pretty
+
+      output_pretty(body)
+      return
+
+    try:
+      data = dumps(body, pretty=True)
+    except TypeError:
+      # If we couldn't convert to json, just output the python str version
+      print(str(body))
+      return
+    _write(data)
+    _write(b"\n")
+    _flush()
+
+  def stream(self, items):
+    NdjsonFormat().stream(items)
+
+
+class JsonFormat(OutputFormat):
+  """Compact JSON, streamed results are written as one JSON array"""
+
+  def write(self, body):
+    try:
+      data = dumps(body)
+    except TypeError:
+      print(str(body))
+      return
+    # Written as two parts, a large document is not copied to add the newline
+    _write(data)
+    _write(b"\n")
+    _flush()
+
+  def stream(self, items):
+    separator = b"[\n"
+    for item in items:
+      _write(separator + _dumps_line(item))
+      _flush()
+      separator = b",\n"
+    _write(b"[]\n" if separator == b"[\n" else b"\n]\n")
+    _flush()
+
+
+class NdjsonFormat(OutputFormat):
+  """One compact JSON document per line, lists are written an entry per line"""
+
+  def write(self, body):
+    items = body if isinstance(body, (list, tuple)) else [body]
+    if items:
+      _write(b"\n".join(map(_dumps_line, items)))
+      _write(b"\n")
+    _flush()
+
+  def stream(self, items):
+    writer = stdout_writer()
+    for item in items:
+      writer.write(_dumps_line(item) + b"\n")
+      writer.flush()
+
+
+class MsgpackFormat(OutputFormat):
+  """MessagePack, streamed results are written as consecutive objects"""
+
+  def _packer(self):
+    try:
+      import msgpack
+
+      return msgpack.Packer().pack
+    except ImportError:
+      pass
+    try:
+      import msgspec
+
+      return msgspec.msgpack.Encoder().encode
+    except ImportError:
+      pass
+    raise CommandParseException("MessagePack output needs msgpack or msgspec installed")
+
+  def write(self, body):
+    _write(self._packer()(body))
+    _flush()
+
+  def stream(self, items):
+    pack = self._packer()
+    for item in items:
+      _write(pack(item))
+      _flush()
+
+
+def _cell(value):
+  if value is None:
+    return ""
+  elif isinstance(value, str):
+    return value
+  elif isinstance(value, (dict, list, tuple)):
+    return _dumps_line(value).decode("utf-8")
+  return str(value)
+
+
+class DelimitedFormat(OutputFormat):
+  """
+Rows of delimited values. Dicts become rows under a header of their keys,
+lists become rows as they are, anything else a single cell.
+"""
+
+  def __init__(self, delimiter):
+    self.delimiter = delimiter
+
+  def write(self, body):
+    rows = body if isinstance(body, (list, tuple)) else [body]
+    header = None
+    if rows and all(isinstance(row, dict) for row in rows):
+      # The full result is available, so include every key seen
+      header = {}
+      for row in rows:
+        header.update(dict.fromkeys(row))
+    self._write_rows(rows, header and list(header), flush=False)
+
+  def stream(self, items):
+    self._write_rows(items, None, flush=True)
+
+  def _writer(self, out):
+    import csv
+
+    return csv.writer(out, delimiter=self.delimiter, lineterminator="\n")
+
+  def _write_rows(self, rows, header, flush):
+    out = _TextOutput()
+    writer = self._writer(out)
+    if header is not None:
+      writer.writerow(header)
+    for row in rows:
+      if isinstance(row, dict):
+        if header is None:
+          # Streamed rows use the keys of the first row for the header
+          header = list(row)
+          writer.writerow(header)
+        writer.writerow([_cell(row.get(key)) for key in header])
+      elif isinstance(row, (list, tuple)):
+        writer.writerow([_cell(value) for value in row])
+      else:
+        writer.writerow([_cell(row)])
+      if flush:
+        out.flush()
+    out.flush()
+
+
+class _TsvWriter:
+  def __init__(self, out):
+    self.write = out.write
+
+  def writerow(self, cells):
+    self.write(
+        "\t".join(
+            cell.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+            for cell in cells
+        )
+        + "\n"
+    )
+
+
+class TsvFormat(DelimitedFormat):
+  """
+Tab separated values without quoting, backslashes, tabs and newlines inside
+values are escaped instead.
+"""
+
+  def __init__(self):
+    super().__init__("\t")
+
+  def _writer(self, out):
+    return _TsvWriter(out)
+
+
+class DefaultFormat(OutputFormat):
+  """
+Pretty JSON on a terminal and compact JSON otherwise, streamed results are
+written as JSON Lines.
+"""
+
+  def write(self, body):
+    if sys.stdout.isatty():
+      PrettyFormat().write(body)
+    else:
+      JsonFormat().write(body)
+
+  def stream(self, items):
+    NdjsonFormat().stream(items)
+
+
+FORMATS = {
+    "pretty": PrettyFormat(),
+    "json": JsonFormat(),
+    "ndjson": NdjsonFormat(),
+    "msgpack": MsgpackFormat(),
+    "csv": DelimitedFormat(","),
+    "tsv": TsvFormat(),
+}
+
+
+def register_format(name, output_format: OutputFormat):
+  FORMATS[name] = output_format
+
+
+def get_format(name=None) -> OutputFormat:
+  if name is None:
+    return DefaultFormat()
+  try:
+    return FORMATS[name]
+  except KeyError:
+    raise CommandParseException(
+        "Unknown output format %r, expected one of %s" % (name, ", ".join(sorted(FORMATS)))
+    )
+
+
+def output_stream(items, array=False):
+  """
+Write each item as it is produced, flushing after every item. Items are
+written as JSON Lines, or as the elements of one JSON array with `array`.
+"""
+  (JsonFormat() if array else NdjsonFormat()).stream(items)
+
+
+def output_default(body, format=None):
+  output_format = get_format(format)
+  # Generators are streamed instead of being collected into one document
+  if isinstance(body, GeneratorType):
+    output_format.stream(body)
+  else:
+    output_format.write(body)
+
+
+def output_json_line(body):
+  """Write `body` as a single line of JSON, for JSON Lines output"""
+  NdjsonFormat().stream([body])
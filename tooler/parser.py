@@ -1,98 +1,340 @@
-import inspect
-import io
-from pathlib import Path
+# `inspect`, `typing` and the file argument types are only needed to compile a
+# parse plan, so they are imported there rather than when tooler is imported
+import array
+import functools
+import itertools
 import re
 from string import ascii_letters
 import sys
-from typing import List, Optional, Union
 
 from .exceptions import CommandHelpException, CommandParseException
-
-
-# Try import from `typing_extensions` if this command has it
-try:
-    from typing_extensions import Literal
-except ModuleNotFoundError:
-    pass
+from .argsfile import PositionalArguments, _converted
+from .pipeline import Piped
+from .arrays import Array, NumpyArray
 
 
 ARG_REGEX = re.compile(r"^--([a-z0-9]+(?:[-_][a-z0-9]+)*)(?:=(.*))?$")
 
+# Fields of dataclass parameters, as in `--config.db.port=5432`
+FIELD_ARG_REGEX = re.compile(
+    r"^--([a-z0-9]+(?:[-_][a-z0-9]+)*(?:\.[a-z0-9_]+)+)(?:=(.*))?$", re.IGNORECASE
+)
 
-def _is_literal(annotation):
+
+def _annotation_coercer(fn, annotation):
     """
-    Since `Literal` is in an extension for now, best effort compare or return false"""
-    try:
-        origin = getattr(annotation, "__origin__", None)
-        return origin == Literal
-    except NameError:
-        return False
+    Resolve the conversion for an annotation once, returns `None` when the value
+    should be passed through untouched. See `tooler.converters`."""
+    from .converters import converter_for
 
+    return converter_for(annotation)
 
-def _match_annotation_type(fn, annotation, value):
-    if annotation in (Path, Optional[Path]):
-        return Path(value)
-    elif annotation in (io.BytesIO, Optional[io.BytesIO]):
-        # BytesIO will automatically open a file stream
-        if value == "-":
-            return sys.stdin.buffer
-        else:
-            # lint is upset that this file isn't used in a contextmanager, but it is
-            # closed as part of the run
-            return open(value, "rb")  # noqa
-    elif _is_literal(annotation):
-        if value not in annotation.__args__:
-            options_str = ", ".join(repr(arg) for arg in annotation.__args__)
+
+def _open_file(value):
+    # BytesIO will automatically open a file stream
+    if value == "-":
+        return sys.stdin.buffer
+    else:
+        # lint is upset that this file isn't used in a contextmanager, but it is
+        # closed as part of the run
+        return open(value, "rb")  # noqa
+
+
+def _param_coercer(fn, param):
+    import inspect
+
+    if param.annotation is not inspect.Parameter.empty:
+        coerce = _annotation_coercer(fn, param.annotation)
+        if coerce is not None:
+            return coerce
+    # Without a conversion for the annotation (such as a string one that could
+    # not be resolved), convert to the type of the default if there is one
+    if isinstance(param.default, float):
+        return float
+    elif isinstance(param.default, int):
+        return int
+    elif param.default is not None and param.default is not inspect.Parameter.empty:
+        # Such as an enum member or a `timedelta`
+        return _annotation_coercer(fn, type(param.default))
+    else:
+        return None
+
+
+def _element_coercer(fn, annotation):
+    if annotation in (int, float):
+        return annotation
+    return _annotation_coercer(fn, annotation)
+
+
+def _bulk_coercer(coerce):
+    """Convert a whole list of values at once, naming the first that is not valid"""
+    if coerce is None:
+        return None
+    return lambda values: list(_converted(values, coerce))
+
+
+def _array_coercer(annotation):
+    if isinstance(annotation, Array):
+        typecode = annotation.typecode
+        convert = float if typecode in ("f", "d") else int
+        return lambda values: array.array(typecode, _converted(values, convert))
+
+    def to_numpy(values):
+        import numpy
+
+        dtype = numpy.dtype(annotation.dtype)
+        convert = {"i": int, "u": int, "f": float, "b": bool}.get(dtype.kind, str)
+        return numpy.fromiter(_converted(values, convert), dtype=dtype)
+
+    return to_numpy
+
+
+def _positional_end(args, start):
+    """Index just past the run of positional arguments starting at `start`"""
+    for idx in range(start, len(args)):
+        arg = args[idx]
+        if isinstance(arg, Piped):
+            # Piped input from a pipeline stage, which is added on its own
+            return idx
+        elif arg.startswith("-") and arg != "-" and arg != "--":
+            return idx
+    return len(args)
+
+
+def _field_argument(plan, fields, args, idx):
+    """Read a `--key.field=value` argument into `fields`, returning the index after it"""
+    (path, value) = FIELD_ARG_REGEX.match(args[idx]).groups()
+    (key, *path) = path.split(".")
+    key = key.replace("-", "_")
+    converter = plan.dataclasses.get(key)
+    if converter is None:
+        raise CommandParseException("Could not identify argument: %s" % args[idx])
+    (_, annotation) = converter.field(path, key + ".")
+    idx += 1
+
+    if value is None:
+        if annotation is bool:
+            # Boolean fields are flags, as boolean parameters are
+            value = "true"
+        elif idx >= len(args):
             raise CommandParseException(
-                "Argument not valid: %s (allowed are %s)" % (repr(value), options_str)
+                "No value provided for argument: %s.%s" % (key, ".".join(path))
             )
-        return value
-    else:
-        return value
+        else:
+            value = args[idx]
+            idx += 1
+
+    values = fields.setdefault(key, {})
+    for name in path[:-1]:
+        values = values.setdefault(name, {})
+    if path[-1] in values:
+        raise CommandParseException(
+            "Saw multiple values for an argument: %s.%s" % (key, ".".join(path))
+        )
+    values[path[-1]] = value
+    return idx
 
 
-def _match_param_type(fn, param, value):
-    # If they've set a default do some automatic type conversion
-    if isinstance(param.default, float) or param.annotation == float:
-        return float(value)
-    elif isinstance(param.default, int) or param.annotation == int:
-        return int(value)
-    elif param.annotation:
-        return _match_annotation_type(fn, param.annotation, value)
-    else:
-        return value
+def _coerce_text(coerce, value):
+    # Values piped from a previous stage are passed on as they are
+    return coerce(value) if isinstance(value, str) else value
 
 
-class Parser:
-    def parse(self, fn, doc, selector, args):
-        raise NotImplementedError()
+def _match_annotation_type(fn, annotation, value):
+    coerce = _annotation_coercer(fn, annotation)
+    return value if coerce is None else coerce(value)
 
 
-class RawParser(Parser):
-    def parse(self, fn, doc, selector, args):
-        return ([args], {})
+def _match_param_type(fn, param, value):
+    coerce = _param_coercer(fn, param)
+    return value if coerce is None else coerce(value)
 
 
-class DefaultParser(Parser):
-    def __init__(self, shorthands=None):
-        self.shorthands = shorthands or {}
+def _type_hints(fn):
+    """
+    Annotations of `fn` with those written as strings resolved, as they all are
+    with `from __future__ import annotations`. Any that cannot be resolved (such
+    as a type only imported under `TYPE_CHECKING`) are left out."""
+    import inspect
+    import typing
 
-        for key in self.shorthands.keys():
-            assert (
-                len(key) == 1 and key in ascii_letters
-            ), "Shorthand keys must be single letters"
+    try:
+        return typing.get_type_hints(fn)
+    except Exception:
+        pass
+
+    # Resolve them one at a time, so one failure does not lose the others
+    namespace = getattr(inspect.unwrap(fn), "__globals__", {})
+    hints = {}
+    for key, annotation in getattr(fn, "__annotations__", {}).items():
+        if isinstance(annotation, str):
+            try:
+                annotation = eval(annotation, namespace)
+            except Exception:
+                continue
+        hints[key] = annotation
+    return hints
+
+
+def _is_progress(annotation):
+    # Given a `Progress` rather than taking an argument
+    import typing
+
+    from .progress import Progress
+
+    return annotation is Progress or set(typing.get_args(annotation)) == {
+        Progress,
+        type(None),
+    }
+
+
+class ParamPlan:
+    __slots__ = ("name", "kind", "default", "required", "coerce", "collect", "inject")
+
+    def __init__(self, name, kind, default, required, coerce, collect=False, inject=None):
+        self.name = name
+        self.kind = kind
+        self.default = default
+        self.required = required
+        self.coerce = coerce
+        # Takes every remaining positional argument, with `coerce` converting
+        # the whole list at once
+        self.collect = collect
+        # Not a command line argument, the value is made by calling this
+        self.inject = inject
+
+
+class ParsePlan:
+    """
+    Everything `DefaultParser` needs to know about a function signature.
 
-    def usage(self, fn):
-        signature = inspect.signature(fn)
+    Building this requires `inspect.signature`, which is by far the slowest part
+    of parsing, so a plan is compiled once per function and reused for every
+    parse and usage call."""
 
-        key_strings = {}
+    def __init__(self, fn, shorthands, fan_out=False):
+        import inspect
+        from typing import Union
+
+        from .converters import DataclassConverter
+        from .progress import Progress
+
+        signature = inspect.signature(fn)
+        hints = _type_hints(fn)
+
+        self.params = []
+        # Initial values for boolean parameters
+        self.boolean = {}
+        # Maps `--flag` and `--no-flag` style keys to (parameter, value)
+        self.flags = {}
+        # Maps shorthand letters to the parameter they stand for
+        self.shorthands = dict(shorthands)
+        # Dataclass parameters, whose fields are set with `--key.field=value`
+        self.dataclasses = {}
+
+        # Whether any parameter reads its values from "@file"
+        argsfiles = fan_out
         for key, param in signature.parameters.items():
-            string = "--" + key.replace("_", "-")
+            param = param.replace(annotation=hints.get(key, param.annotation))
+            if _is_progress(param.annotation):
+                self.params.append(
+                    ParamPlan(key, param.kind, None, False, None, inject=Progress)
+                )
+                continue
+
+            if isinstance(param.default, bool):
+                self.boolean[key] = param.default
+            elif param.annotation == bool:
+                self.boolean[key] = False
+            elif param.annotation == Union[bool, None]:
+                self.boolean[key] = None
+
+            required = param.default == inspect._empty
+            collect = isinstance(param.annotation, (Array, NumpyArray))
+            if key in self.boolean:
+                coerce = None
+            elif param.kind == inspect.Parameter.VAR_POSITIONAL:
+                coerce = self._var_positional_coercer(fn, param)
+            elif param.kind == inspect.Parameter.VAR_KEYWORD:
+                coerce = None
+            elif collect:
+                coerce = _array_coercer(param.annotation)
+            else:
+                coerce = _param_coercer(fn, param)
+                if isinstance(coerce, DataclassConverter):
+                    self.dataclasses[key] = coerce
+
+            self.params.append(
+                ParamPlan(key, param.kind, param.default, required, coerce, collect)
+            )
+            # Only annotated lists of values read them from "@file", a plain
+            # `*args` takes "@" arguments as they are (such as `mention @alice`)
+            argsfiles = argsfiles or collect or (
+                param.kind == inspect.Parameter.VAR_POSITIONAL
+                and param.annotation is not inspect.Parameter.empty
+            )
+
+        # Parameters taking many values get the items of a piped result
+        self.many = fan_out or any(
+            param.collect or param.kind == inspect.Parameter.VAR_POSITIONAL
+            for param in self.params
+        )
+        self.argsfiles = argsfiles
+
+        # An explicit `no_<key>` parameter takes precedence over negating `<key>`
+        for key in self.boolean:
+            self.flags["no_" + key] = (key, False)
+        for key in self.boolean:
+            self.flags[key] = (key, True)
+
+        # Fan-out commands take a list of every positional argument in their
+        # first parameter, which is run once per entry
+        self.fan_out = fan_out
+        if fan_out:
+            assert self.params and self.params[0].kind in (
+                inspect.Parameter.POSITIONAL_ONLY,
+                inspect.Parameter.POSITIONAL_OR_KEYWORD,
+            ), "Fan-out commands need a positional first parameter for the target"
+
+        self._usage = None
 
-            for shorthand, shorthand_key in self.shorthands.items():
-                if shorthand_key == key:
-                    string = f"-{shorthand}, {string}"
+    def _var_positional_coercer(self, fn, param):
+        import inspect
+        from typing import List
 
+        if not param.annotation or param.annotation == inspect.Parameter.empty:
+            return None
+
+        # Make sure the annotation is valid if there is one
+        try:
+            origin = param.annotation.__origin__
+        except AttributeError:
+            origin = None
+        assert origin in (
+            List,
+            list,
+        ), f"Expected `List[]` annotation for positional arguments"
+
+        return _bulk_coercer(_element_coercer(fn, param.annotation.__args__[0]))
+
+    @property
+    def usage(self):
+        if self._usage is None:
+            self._usage = self._render_usage()
+        return self._usage
+
+    def _render_usage(self):
+        shorthand_for = {}
+        for shorthand, shorthand_key in self.shorthands.items():
+            shorthand_for[shorthand_key] = shorthand
+
+        key_strings = {}
+        for param in self.params:
+            if param.inject is not None:
+                continue
+            string = "--" + param.name.replace("_", "-")
+            if param.name in shorthand_for:
+                string = f"-{shorthand_for[param.name]}, {string}"
             key_strings[string] = param
 
         parameter_lengths = [len(key) for key in key_strings.keys()]
@@ -101,7 +343,7 @@ class DefaultParser(Parser):
         def _key_usage(key_string, param):
             props = []
 
-            if param.default == inspect._empty:
+            if param.required:
                 props.append("required")
             elif isinstance(param.default, bool):
                 props.append("default %s" % ("yes" if param.default else "no"))
@@ -119,6 +361,39 @@ class DefaultParser(Parser):
             _key_usage(key_string, param) for key_string, param in key_strings.items()
         )
 
+
+class Parser:
+    def parse(self, fn, doc, selector, args):
+        raise NotImplementedError()
+
+
+class RawParser(Parser):
+    def parse(self, fn, doc, selector, args):
+        return ([args], {})
+
+
+class DefaultParser(Parser):
+    def __init__(self, shorthands=None, fan_out=False):
+        self.shorthands = shorthands or {}
+        self.fan_out = fan_out
+
+        for key in self.shorthands.keys():
+            assert (
+                len(key) == 1 and key in ascii_letters
+            ), "Shorthand keys must be single letters"
+
+        self._plans = {}
+
+    def plan(self, fn):
+        try:
+            return self._plans[fn]
+        except KeyError:
+            plan = self._plans[fn] = ParsePlan(fn, self.shorthands, self.fan_out)
+            return plan
+
+    def usage(self, fn):
+        return self.plan(fn).usage
+
     def parse(self, fn, doc, selector, args):
         try:
             return self._parse(fn, doc, selector, args)
@@ -127,40 +402,49 @@ class DefaultParser(Parser):
             raise e
 
     def _parse(self, fn, doc, selector, args):
+        # Compiling the plan has imported it already
+        import inspect
+
         if selector is not None:
             raise Exception("Command selector has not been enabled")
 
-        signature = inspect.signature(fn)
+        plan = self.plan(fn)
         idx = 0
 
-        positional = []
+        positional = PositionalArguments()
         keyword = {}
-        boolean = {}
-
-        for key, param in signature.parameters.items():
-            if isinstance(param.default, bool):
-                boolean[key] = param.default
-            elif param.annotation == bool:
-                boolean[key] = False
-            elif param.annotation == Union[bool, None]:
-                boolean[key] = None
+        boolean = dict(plan.boolean)
+        # Values of dataclass fields by parameter, nested as the dataclasses are
+        fields = {}
 
         while idx < len(args):
-            if args[idx] in ("-", "--") or not args[idx].startswith("-"):
+            piped = isinstance(args[idx], Piped)
+            if piped or args[idx] in ("-", "--") or not args[idx].startswith("-"):
                 if len(keyword):
                     raise CommandParseException(
                         "Positional arguments not valid after a keyword"
                     )
-                positional.append(args[idx])
-                idx += 1
+                if piped:
+                    # Parameters taking many values take the items of a result
+                    positional.add_piped(args[idx], many=plan.many)
+                    idx += 1
+                    continue
+                # Take the whole run of positional arguments at once, commands
+                # can be given many thousands of them
+                end = _positional_end(args, idx)
+                positional.extend(args[idx:end], argsfiles=plan.argsfiles)
+                idx = end
             else:
-                match = re.match(ARG_REGEX, args[idx])
+                match = ARG_REGEX.match(args[idx])
 
                 if match:
                     (key, value) = match.groups()
-                elif args[idx].startswith("-") and args[idx][1] in self.shorthands:
-                    key = self.shorthands[args[idx][1]]
+                elif args[idx].startswith("-") and args[idx][1] in plan.shorthands:
+                    key = plan.shorthands[args[idx][1]]
                     value = args[idx][2:] if len(args[idx]) > 2 else None
+                elif plan.dataclasses and FIELD_ARG_REGEX.match(args[idx]):
+                    idx = _field_argument(plan, fields, args, idx)
+                    continue
                 else:
                     raise CommandParseException(
                         "Could not identify argument: %s" % args[idx]
@@ -177,19 +461,13 @@ class DefaultParser(Parser):
                     )
 
                 # Add support for --flag, and --no-flag
-                if key in boolean:
+                flag = plan.flags.get(key)
+                if flag is not None:
                     if value is not None:
                         raise CommandParseException(
                             "Value provided to boolean key: %s" % key
                         )
-                    boolean[key] = True
-                    continue
-                elif key.startswith("no_") and key[3:] in boolean:
-                    if value is not None:
-                        raise CommandParseException(
-                            "Value provided to boolean key: %s" % key
-                        )
-                    boolean[key[3:]] = False
+                    boolean[flag[0]] = flag[1]
                     continue
 
                 # "--arg <value>" style; read value out of next argument
@@ -209,35 +487,47 @@ class DefaultParser(Parser):
         args = []
         kv = {}
 
-        for key, param in signature.parameters.items():
-            if key in boolean:
+        for param in plan.params:
+            key = param.name
+            coerce = param.coerce
+            if param.inject is not None:
+                # Passed positionally only while every earlier parameter was,
+                # so it cannot take the place of a later positional argument
+                if kv or param.kind == inspect.Parameter.KEYWORD_ONLY:
+                    kv[key] = param.inject()
+                else:
+                    args.append(param.inject())
+            elif plan.fan_out and param is plan.params[0]:
+                # Targets are converted as they are taken, so a fan-out over
+                # an argsfile never holds all of them at once
+                targets = positional.take()
+                if coerce is not None and positional.piped:
+                    coerce = functools.partial(_coerce_text, coerce)
+                args.append(targets if coerce is None else targets.converted(coerce))
+            elif key in boolean:
                 kv[key] = boolean[key]
+            elif key in fields:
+                if key in keyword:
+                    raise CommandParseException(
+                        "Saw multiple values for an argument: " + key
+                    )
+                value = plan.dataclasses[key].build(fields.pop(key), key + ".")
+                # As for injected values, positional only while nothing is in kv
+                if kv or param.kind == inspect.Parameter.KEYWORD_ONLY:
+                    kv[key] = value
+                else:
+                    args.append(value)
             elif param.kind == inspect.Parameter.VAR_POSITIONAL:
                 # *args, take reset of positional arguments
-                if (
-                    param.annotation and param.annotation != inspect.Parameter.empty
-                ):  # noqa: W503
-                    # Make sure the annotation is valid if there is one
-                    try:
-                        origin = param.annotation.__origin__
-                    except AttributeError:
-                        origin = None
-                    assert origin in (
-                        List,
-                        list,
-                    ), f"Expected `List[]` annotation for positional arguments"
-
-                    single_annotation = param.annotation.__args__[0]
-                    positional = [
-                        _match_annotation_type(fn, single_annotation, value)
-                        for value in positional
-                    ]
-                args.extend(positional)
-                positional = []
+                values = positional.take()
+                args.extend(values if coerce is None else coerce(values))
+            elif param.collect and positional:
+                args.append(coerce(positional.take()))
             elif positional:
                 # If there is anything left in positional; send it as a normal
                 # argument
-                args.append(_match_param_type(fn, param, positional.pop(0)))
+                value = positional.pop()
+                args.append(value if coerce is None else _coerce_text(coerce, value))
             elif param.kind == inspect.Parameter.VAR_KEYWORD:
                 # **kv, take rest of keyword arguments
                 for key, value in keyword.items():
@@ -245,8 +535,11 @@ class DefaultParser(Parser):
                 keyword = {}
             else:
                 if key in keyword:
-                    kv[key] = _match_param_type(fn, param, keyword.pop(key))
-                elif param.default != inspect._empty:
+                    value = keyword.pop(key)
+                    if param.collect:
+                        value = [value]
+                    kv[key] = value if coerce is None else coerce(value)
+                elif not param.required:
                     kv[key] = param.default
                 else:
                     raise CommandParseException(
@@ -254,8 +547,14 @@ class DefaultParser(Parser):
                     )
 
         if positional or keyword:
+            remaining = positional.take()
+            unused = [
+                value if isinstance(value, str) else "<piped input>"
+                for value in itertools.islice(remaining, 10)
+            ]
+            remaining.close()
             raise CommandParseException(
-                "Unused arguments: %s" % " ".join(positional + list(keyword.keys()))
+                "Unused arguments: %s" % " ".join(unused + list(keyword.keys()))
             )
 
         return (tuple(args), kv)
@@ -0,0 +1,81 @@
+"""
+In-process pipelines of commands, run with `Tooler.pipe` or `a ++ b` on the
+command line.
+
+A `++` only separates stages when the word after it is a command name, so it
+can still be given to a command as an argument of its own. One at the very end
+is taken as a missing last stage.
+
+Each stage after the first is given the result of the one before it as it is,
+without serializing it. The result takes the place of a "-" among the stage's
+positional arguments, or comes after them. Parameters taking many values
+(fan-out targets, `*args` and arrays) get the result's items, so a generator
+is streamed through, and any other parameter gets the result itself. Only
+the result of the last stage is output.
+"""
+from types import AsyncGeneratorType, CoroutineType
+
+from .exceptions import CommandParseException
+
+PIPE_OPERATOR = "++"
+
+
+class Piped:
+  """The result of the previous stage, standing in for an argument"""
+
+  __slots__ = ("result",)
+
+  def __init__(self, result):
+    self.result = result
+
+  def items(self):
+    result = self.result
+    if result is None:
+      return iter(())
+    elif isinstance(result, (list, tuple)) or hasattr(result, "__next__"):
+      return iter(result)
+    return iter((result,))
+
+
+def split_stages(args, commands):
+  """
+Split argv on `PIPE_OPERATOR` into the argv of each stage, where the word after
+it is one of `commands` (or there is none).
+"""
+  stages = [[]]
+  for (idx, arg) in enumerate(args):
+    if arg == PIPE_OPERATOR and (idx + 1 == len(args) or args[idx + 1] in commands):
+      stages.append([])
+    else:
+      stages[-1].append(arg)
+  if not all(stages):
+    raise CommandParseException("Pipeline stages need a command on both sides of %s" % PIPE_OPERATOR)
+  return stages
+
+
+def with_input(args, result):
+  """`args` with `result` in place of a positional "-", or after the positional arguments"""
+  args = list(args)
+  for (idx, arg) in enumerate(args):
+    if arg == "-":
+      args[idx] = Piped(result)
+      return args
+    elif arg.startswith("-") and arg != "--":
+      break
+  else:
+    idx = len(args)
+  args.insert(idx, Piped(result))
+  return args
+
+
+def settle(result):
+  """Run a coroutine result to completion, and make async generators plain ones"""
+  if isinstance(result, CoroutineType):
+    from .runtime import run_until_complete
+
+    return run_until_complete(result)
+  elif isinstance(result, AsyncGeneratorType):
+    from .runtime import iterate
+
+    return iterate(result)
+  return result
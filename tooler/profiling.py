@@ -0,0 +1,237 @@
+"""
+Timing and profiling of a command run, for `--profile`.
+
+Every run records how long each phase took: `setup` (from importing tooler to
+running the command, so mostly importing and registering the tool's
+commands), `parse_command`, `parse`, `command` and `output`. Streamed results
+are produced while they are output, so that time counts towards `output`.
+Events such as cache hits are counted along with them.
+
+With `--profile-output PATH` the command and its output are also profiled,
+writing a speedscope file from a sampling profiler if `PATH` ends in
+".speedscope.json" and pstats from cProfile otherwise. `$TOOLER_PROFILE` turns
+profiling on for every run, set to "1" for timings or to an output path, in
+which "{command}" and "{pid}" are filled in.
+"""
+import os
+import sys
+import time
+
+IMPORTED_AT = time.perf_counter()
+
+SPEEDSCOPE_SUFFIX = ".speedscope.json"
+SAMPLE_INTERVAL = 0.001
+
+# The timings of the running command, if any
+_active = None
+_setup_recorded = False
+
+
+class _Phase:
+  __slots__ = ("timings", "name", "started")
+
+  def __init__(self, timings, name):
+    self.timings = timings
+    self.name = name
+
+  def __enter__(self):
+    self.started = time.perf_counter()
+
+  def __exit__(self, *exc_info):
+    self.timings.record(self.name, self.started)
+
+
+class _NoPhase:
+  def __enter__(self):
+    pass
+
+  def __exit__(self, *exc_info):
+    pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name):
+  """Count the time spent in a `with` block towards phase `name` of the active timings"""
+  timings = _active
+  return _NO_PHASE if timings is None else _Phase(timings, name)
+
+
+def count(name):
+  """Count an event, such as a cache hit, in the active timings"""
+  timings = _active
+  if timings is not None:
+    timings.counts[name] = timings.counts.get(name, 0) + 1
+
+
+class Sampler:
+  """
+Sampling profiler, recording the stack of one thread every `interval` seconds
+from a background thread.
+"""
+
+  def __init__(self, interval=SAMPLE_INTERVAL):
+    import threading
+
+    self.interval = interval
+    self.frames = {}
+    self.samples = []
+    self.weights = []
+    self._thread_id = None
+    self._stop = threading.Event()
+    self._thread = None
+
+  def _stack(self, frame):
+    stack = []
+    while frame is not None:
+      code = frame.f_code
+      key = (code.co_name, code.co_filename, code.co_firstlineno)
+      index = self.frames.get(key)
+      if index is None:
+        index = self.frames[key] = len(self.frames)
+      stack.append(index)
+      frame = frame.f_back
+    # Speedscope wants the outermost frame first
+    stack.reverse()
+    return stack
+
+  def _sample(self):
+    last = time.perf_counter()
+    while not self._stop.wait(self.interval):
+      frame = sys._current_frames().get(self._thread_id)
+      now = time.perf_counter()
+      if frame is not None:
+        self.samples.append(self._stack(frame))
+        self.weights.append(now - last)
+      last = now
+
+  def enable(self):
+    import threading
+
+    self._thread_id = threading.get_ident()
+    self._thread = threading.Thread(target=self._sample, name="tooler-sampler", daemon=True)
+    self._thread.start()
+
+  def disable(self):
+    self._stop.set()
+    self._thread.join()
+
+  def dump_speedscope(self, path, name):
+    frames = [None] * len(self.frames)
+    for ((function, filename, line), index) in self.frames.items():
+      frames[index] = {"name": function, "file": filename, "line": line}
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "exporter": "tooler",
+        "name": name,
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(self.weights),
+                "samples": self.samples,
+                "weights": self.weights,
+            }
+        ],
+    }
+    import json
+
+    with open(path, "w", encoding="utf-8") as f:
+      json.dump(document, f)
+
+
+class Timings:
+  """
+How long each phase of a command run took. Entering makes these the timings
+the `phase` blocks record into.
+"""
+
+  def __init__(self, name):
+    self.name = name
+    self.timings = {}
+    # Events counted during the run, by name
+    self.counts = {}
+
+  def record_setup(self, started):
+    """Record the setup phase as ending at `started`, for the first run in this process only"""
+    global _setup_recorded
+    if not _setup_recorded:
+      _setup_recorded = True
+      self.timings["setup"] = started - IMPORTED_AT
+
+  def record(self, name, started):
+    """Count the time since `started` towards phase `name`"""
+    self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+  def __enter__(self):
+    global _active
+    _active = self
+    return self
+
+  def __exit__(self, *exc_info):
+    global _active
+    _active = None
+
+
+class Profile(Timings):
+  """
+Timings of one command run, along with a profiler if `path` is set. Exiting
+writes the profile and a summary to stderr.
+"""
+
+  def __init__(self, name, path=None):
+    super().__init__(name)
+    self.path = path
+    self.profiler = None
+
+  @classmethod
+  def from_options(cls, name, options):
+    """The profile `--profile`, `--profile-output` or `$TOOLER_PROFILE` ask for, if any"""
+    path = options.get("profile-output")
+    if path is None and not options.get("profile"):
+      setting = os.environ.get("TOOLER_PROFILE")
+      if not setting or setting == "0":
+        return None
+      if setting != "1":
+        path = setting.replace("{command}", name).replace("{pid}", str(os.getpid()))
+    return cls(name, path)
+
+  def __enter__(self):
+    super().__enter__()
+    if self.path is not None:
+      if self.path.endswith(SPEEDSCOPE_SUFFIX):
+        self.profiler = Sampler()
+      else:
+        import cProfile
+
+        self.profiler = cProfile.Profile()
+      self.profiler.enable()
+    return self
+
+  def __exit__(self, *exc_info):
+    super().__exit__(*exc_info)
+    if self.profiler is not None:
+      self.profiler.disable()
+      if isinstance(self.profiler, Sampler):
+        self.profiler.dump_speedscope(self.path, self.name)
+      else:
+        self.profiler.dump_stats(self.path)
+    from .writer import status
+
+    status.info(self.summary())
+
+  def summary(self):
+    total = sum(self.timings.values())
+    phases = ", ".join(
+        "%s %.1fms" % (name, seconds * 1000) for (name, seconds) in self.timings.items()
+    )
+    summary = "profile %s: %s (total %.1fms)" % (self.name, phases, total * 1000)
+    if self.counts:
+      summary += ", " + ", ".join("%s %d" % item for item in self.counts.items())
+    if self.path is not None:
+      summary += ", written to %s" % self.path
+    return summary
@@ -0,0 +1,289 @@
+"""
+Progress of long running commands, with counters, rates, ETAs and nested tasks.
+
+Commands are given a `Progress` for any parameter annotated with it, which is
+not a command line argument:
+
+  @tooler.command
+  def sync(source, progress: Progress):
+    with progress.task("files", total=len(files)) as task:
+      for path in task.track(files):
+        ...
+
+Updating a task only increments its counter, so it costs next to nothing in a
+hot loop. The counters are read by a background thread, started with the first
+task, which redraws them in place on a terminal every `REFRESH_INTERVAL`
+seconds. When stderr is not a terminal it logs a line per task every
+`LOG_INTERVAL` seconds instead, as does a `Progress` started while another is
+drawing.
+"""
+import os
+import sys
+import time
+
+# Seconds between redraws on a terminal
+REFRESH_INTERVAL = 0.1
+
+# Seconds between log lines when stderr is not a terminal
+LOG_INTERVAL = 10.0
+
+BAR_WIDTH = 20
+
+
+def _short(value):
+  for (suffix, scale) in (("G", 1e9), ("M", 1e6), ("k", 1e3)):
+    if value >= scale:
+      return "%.1f%s" % (value / scale, suffix)
+  return "%.1f" % value
+
+
+def _duration(seconds):
+  (minutes, seconds) = divmod(int(seconds), 60)
+  (hours, minutes) = divmod(minutes, 60)
+  if hours:
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+  return "%d:%02d" % (minutes, seconds)
+
+
+class Task:
+  """
+A counter towards an optional `total`. Increment `count` directly, or with
+`advance()` or `track()`, and finish it with `done()` or by leaving a `with`
+block.
+"""
+
+  __slots__ = ("progress", "name", "total", "count", "parent", "children", "started", "finished")
+
+  def __init__(self, progress, name, total=None, parent=None):
+    self.progress = progress
+    self.name = name
+    self.total = total
+    self.count = 0
+    self.parent = parent
+    self.children = []
+    self.started = time.monotonic()
+    self.finished = None
+
+  def advance(self, n=1):
+    self.count += n
+
+  def track(self, iterable):
+    """Iterate over `iterable`, counting each item once it has been handled"""
+    if self.total is None:
+      try:
+        self.total = len(iterable)
+      except TypeError:
+        pass
+    for item in iterable:
+      yield item
+      self.count += 1
+
+  def task(self, name, total=None):
+    """A task nested under this one"""
+    return self.progress._add(name, total, self)
+
+  def done(self):
+    if self.finished is None:
+      self.finished = time.monotonic()
+      self.progress._finish(self)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.done()
+
+  @property
+  def elapsed(self):
+    return (self.finished or time.monotonic()) - self.started
+
+  @property
+  def rate(self):
+    """Items per second"""
+    elapsed = self.elapsed
+    return self.count / elapsed if elapsed > 0 else 0.0
+
+  @property
+  def eta(self):
+    """Seconds until `total` is reached at the current rate, if known"""
+    rate = self.rate
+    if self.total is None or not rate:
+      return None
+    return max(0.0, (self.total - self.count) / rate)
+
+  def line(self):
+    parts = [self.name]
+    if self.total:
+      filled = min(BAR_WIDTH, BAR_WIDTH * self.count // self.total)
+      parts.append("[%s%s]" % ("#" * filled, "." * (BAR_WIDTH - filled)))
+      parts.append("{:,}/{:,}".format(self.count, self.total))
+      parts.append("%d%%" % (100 * self.count // self.total))
+    else:
+      parts.append("{:,}".format(self.count))
+    parts.append("%s/s" % _short(self.rate))
+    eta = self.eta
+    if self.finished is not None:
+      parts.append("in %s" % _duration(self.elapsed))
+    elif eta is not None:
+      parts.append("ETA %s" % _duration(eta))
+    return "  ".join(parts)
+
+
+class _Renderer:
+  """
+Draws the tasks of a `Progress` from a background thread, in place on a
+terminal and as periodic log lines otherwise.
+"""
+
+  def __init__(self, progress, stream, interactive):
+    import threading
+
+    self.progress = progress
+    self.stream = stream
+    self.interactive = interactive
+    self.interval = REFRESH_INTERVAL if interactive else LOG_INTERVAL
+    self.lock = threading.RLock()
+    # Lines currently drawn below the cursor's line, on a terminal
+    self.drawn = 0
+    self.logged = False
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="tooler-progress", daemon=True)
+
+  def start(self):
+    if self.interactive:
+      from .writer import status
+
+      # Status messages are written above the live lines
+      status.live = self
+    self._thread.start()
+
+  def stop(self):
+    self._stop.set()
+    self._thread.join()
+    if self.interactive:
+      from .writer import status
+
+      if status.live is self:
+        status.live = None
+      with self.lock:
+        self.clear()
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      with self.lock:
+        if self.interactive:
+          self.clear()
+          self.draw()
+        else:
+          self.log()
+
+  def _lines(self, tasks, depth=0):
+    for task in list(tasks):
+      yield "  " * depth + task.line()
+      yield from self._lines(task.children, depth + 1)
+
+  def log(self):
+    from .writer import status
+
+    for line in self._lines(self.progress.tasks):
+      status.info(line)
+      self.logged = True
+
+  def clear(self):
+    if self.drawn:
+      self.stream.write("\x1b[1A\x1b[2K" * self.drawn)
+      self.stream.flush()
+      self.drawn = 0
+
+  def draw(self):
+    try:
+      width = os.get_terminal_size(self.stream.fileno()).columns
+    except (AttributeError, OSError, ValueError):
+      width = 80
+    # Lines must not wrap, or clearing them misses some
+    lines = [line[:width - 1] for line in self._lines(self.progress.tasks)]
+    if lines:
+      self.stream.write("\n".join(lines) + "\n")
+      self.stream.flush()
+    self.drawn = len(lines)
+
+  def suspended(self):
+    """Take the live lines down for the duration of a `with` block"""
+    return _Suspended(self)
+
+  def finished(self, task):
+    """Leave a line for a finished top level task"""
+    if self.interactive:
+      self.clear()
+      self.stream.write(task.line() + "\n")
+      self.draw()
+    elif self.logged:
+      from .writer import status
+
+      status.info(task.line())
+
+
+class _Suspended:
+  def __init__(self, renderer):
+    self.renderer = renderer
+
+  def __enter__(self):
+    self.renderer.lock.acquire()
+    self.renderer.clear()
+
+  def __exit__(self, *exc_info):
+    try:
+      self.renderer.draw()
+    finally:
+      self.renderer.lock.release()
+
+
+class Progress:
+  """
+The tasks of a command run, drawn to `stream` (stderr by default) once the
+first task is added. `close()` finishes any tasks still running.
+"""
+
+  def __init__(self, stream=None, interactive=None):
+    self.stream = sys.stderr if stream is None else stream
+    if interactive is None:
+      isatty = getattr(self.stream, "isatty", None)
+      interactive = isatty is not None and isatty()
+    self.interactive = interactive
+    self.tasks = []
+    self._renderer = None
+
+  def task(self, name, total=None):
+    return self._add(name, total, None)
+
+  def _add(self, name, total, parent):
+    task = Task(self, name, total, parent)
+    if self._renderer is None:
+      from .writer import status
+
+      # Only one progress at a time can draw live lines below the status
+      # messages, any other logs its tasks instead
+      interactive = self.interactive and status.live is None
+      self._renderer = _Renderer(self, self.stream, interactive)
+      self._renderer.start()
+    with self._renderer.lock:
+      (self.tasks if parent is None else parent.children).append(task)
+    return task
+
+  def _finish(self, task):
+    if self._renderer is None:
+      return
+    with self._renderer.lock:
+      siblings = self.tasks if task.parent is None else task.parent.children
+      if task in siblings:
+        siblings.remove(task)
+      if task.parent is None:
+        self._renderer.finished(task)
+
+  def close(self):
+    if self._renderer is None:
+      return
+    for task in list(self.tasks):
+      task.done()
+    self._renderer.stop()
+    self._renderer = None
@@ -0,0 +1,89 @@
+"""
+Shared asyncio runtime for coroutine commands.
+
+Every coroutine run from synchronous code goes through one event loop (built
+with uvloop when it is installed), so state such as connection pools can be
+kept between commands in a batch. Interrupting with SIGINT cancels the running
+command so its cleanup code runs before `KeyboardInterrupt` is raised.
+"""
+import asyncio
+import signal
+import threading
+
+_loop = None
+
+
+def _new_loop():
+  try:
+    import uvloop
+  except ImportError:
+    return asyncio.new_event_loop()
+  return uvloop.new_event_loop()
+
+
+def get_loop():
+  """The loop used to run coroutine commands, created on first use"""
+  global _loop
+  if _loop is None or _loop.is_closed():
+    _loop = _new_loop()
+    asyncio.set_event_loop(_loop)
+  return _loop
+
+
+def run_until_complete(awaitable):
+  """
+Run `awaitable` to completion on the shared loop. From code already running in
+an event loop, await the command (or use `Tooler.run_async`) instead.
+"""
+  try:
+    asyncio.get_running_loop()
+  except RuntimeError:
+    pass
+  else:
+    raise RuntimeError("Cannot block on a command inside a running event loop, await it instead")
+
+  loop = get_loop()
+  task = asyncio.ensure_future(awaitable, loop=loop)
+
+  interrupted = False
+
+  def interrupt():
+    nonlocal interrupted
+    interrupted = True
+    task.cancel()
+
+  # Signal handlers can only be installed from the main thread
+  handle_sigint = threading.current_thread() is threading.main_thread()
+  if handle_sigint:
+    loop.add_signal_handler(signal.SIGINT, interrupt)
+  try:
+    return loop.run_until_complete(task)
+  except asyncio.CancelledError:
+    if interrupted:
+      raise KeyboardInterrupt() from None
+    raise
+  finally:
+    if handle_sigint:
+      loop.remove_signal_handler(signal.SIGINT)
+
+
+def iterate(async_iterator):
+  """Iterate an async iterator from synchronous code on the shared loop"""
+  while True:
+    try:
+      yield run_until_complete(async_iterator.__anext__())
+    except StopAsyncIteration:
+      return
+
+
+def iterate_threadsafe(async_iterator, loop):
+  """
+Iterate an async iterator from a worker thread while `loop` keeps running in
+its own thread.
+"""
+  while True:
+    future = asyncio.run_coroutine_threadsafe(async_iterator.__anext__(), loop)
+    try:
+      yield future.result()
+    except StopAsyncIteration:
+      return
@@ -0,0 +1,122 @@
+"""
+Fork-server mode for tools that are invoked many times in a row.
+
+`serve` keeps a tooler (and every command module it has imported) warm in a
+long-lived process listening on a unix socket. Each request forks a child
+which takes over the client's stdin, stdout and stderr, environment and
+working directory and then runs `Tooler.main`, so output, stdin streaming
+and exit codes match running the tool directly.
+"""
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+
+from .client import _HEADER, _REPLY, _recv_exactly
+from .metrics import EXIT_TIMEOUT
+from .tooler import _system_exit_code
+
+# Requests carry the whole environment, but should never get close to this
+_MAX_REQUEST = 1 << 24
+
+
+def _receive_request(conn):
+  (data, fds, _flags, _address) = socket.recv_fds(conn, 1 << 16, 3)
+  if len(fds) != 3 or len(data) < _HEADER.size:
+    raise ConnectionError("Invalid tooler client request")
+
+  (size,) = _HEADER.unpack(data[:_HEADER.size])
+  if size > _MAX_REQUEST:
+    raise ConnectionError("Tooler client request is too large")
+  payload = data[_HEADER.size:]
+  payload += _recv_exactly(conn, size - len(payload))
+  return (json.loads(payload.decode("utf-8")), fds)
+
+
+def _handle(tooler, conn, script_name):
+  (request, fds) = _receive_request(conn)
+  for target, fd in enumerate(fds):
+    os.dup2(fd, target)
+    os.close(fd)
+
+  os.chdir(request["cwd"])
+  os.environ.clear()
+  os.environ.update(request["env"])
+  sys.argv = [script_name, *request["args"]]
+
+  conn.sendall(_REPLY.pack(os.getpid()))
+  try:
+    tooler.main(sys.argv)
+    code = 0
+  except SystemExit as e:
+    code = _system_exit_code(e)
+    if not isinstance(e.code, (int, type(None))):
+      # Matches the interpreter, which prints any other exit value
+      sys.stderr.write(str(e.code) + "\n")
+  except BaseException:
+    traceback.print_exc()
+    code = 1
+
+  sys.stdout.flush()
+  sys.stderr.flush()
+  conn.sendall(_REPLY.pack(code))
+  # The child leaves with `os._exit`, so send any metrics now the client has
+  # its reply
+  if tooler.root.metrics is not None:
+    tooler.root.metrics.flush(EXIT_TIMEOUT)
+
+
+def _reap():
+  try:
+    while os.waitpid(-1, os.WNOHANG)[0]:
+      pass
+  except ChildProcessError:
+    pass
+
+
+def serve(tooler, socket_path, script_name=None):
+  """
+Serve `tooler` on a unix socket until interrupted. Use `tooler.client` to run
+commands against it.
+"""
+  if script_name is None:
+    script_name = sys.argv[0]
+
+  if os.path.exists(socket_path):
+    os.unlink(socket_path)
+
+  listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  listener.bind(socket_path)
+  listener.listen(128)
+
+  # Exit through the `finally` below so the socket is removed
+  previous_sigterm = signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  try:
+    while True:
+      (conn, _address) = listener.accept()
+      _reap()
+
+      # Anything still buffered would be written again by the child
+      sys.stdout.flush()
+      sys.stderr.flush()
+
+      pid = os.fork()
+      if pid == 0:
+        code = 0
+        try:
+          signal.signal(signal.SIGTERM, previous_sigterm)
+          listener.close()
+          _handle(tooler, conn, script_name)
+        except BaseException:
+          traceback.print_exc()
+          code = 1
+        finally:
+          os._exit(code)
+
+      conn.close()
+  finally:
+    signal.signal(signal.SIGTERM, previous_sigterm)
+    listener.close()
+    os.unlink(socket_path)
@@ -1,47 +1,164 @@
-import asyncio
-from dataclasses import dataclass
+# Only what registering commands, completion and usage need is imported up
+# front, anything else (such as asyncio, inspect and typing) is imported where
+# it is used. See `tests/test_imports.py`.
+from __future__ import annotations
+
 import functools
 import os
 import sys
-from typing import Any, Dict, List, Optional, Union
+import time
+from types import AsyncGeneratorType, CoroutineType, GeneratorType
 
-from .clide.english import and_join
-from .command import Command, DecoratorCommand
+from .command import Command, DecoratorCommand, FanOutCommand, LazyCommand, MountCommand
 from .exceptions import CommandParseException, ExceptionWithHelp
-from .output import output_default
+from .index import CommandIndex
+from .output import output_default, output_json_line
 from .parser import ARG_REGEX
+from .pipeline import PIPE_OPERATOR
+from .profiling import Profile, Timings, phase
+from .writer import silence_stdout, status
 
-
-@dataclass
 class ToolerOptionConfig:
-  description: str
-  default: Any
+  __slots__ = ("description", "default")
+
+  def __init__(self, description: str, default: object):
+    self.description = description
+    self.default = default
+
+  def __repr__(self):
+    return "ToolerOptionConfig(description=%r, default=%r)" % (self.description, self.default)
+
+
+def exit_code(result):
+  """The process exit code `Tooler.main` uses for a result from `Tooler.run`"""
+  return 0 if result in (True, None) else 1
+
+
+def _system_exit_code(e: SystemExit):
+  """The process exit code for `e`, as the interpreter would exit with"""
+  return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+
+
+def _output_streamed(output, result):
+  """
+Output the generator `result` and return what it returned, so a streamed
+command can still fail (as a fan-out with failed targets does)
+"""
+  returned = []
+
+  def items():
+    returned.append((yield from result))
+
+  output(items())
+  return returned[0] if returned else None
+
+
+def _collect(result):
+  """The items of the generator `result`, and what it returned"""
+  items = []
+  while True:
+    try:
+      items.append(next(result))
+    except StopIteration as stop:
+      return (items, stop.value)
+
+
+def _command_name(command):
+  fn = getattr(command, "fn", None)
+  return type(command).__name__ if fn is None else fn.__name__
+
+
+class _Measure:
+  """
+Times a command run for `--profile` and reports it to the tooler's metrics,
+doing nothing when neither is on. `done(result)` records the exit status of a
+run that returned.
+"""
+
+  def __init__(self, name, profile, metrics, started):
+    self.metrics = metrics
+    self.timings = None
+    if profile is not None or metrics is not None:
+      self.timings = Timings(name) if profile is None else profile
+      self.timings.record_setup(started)
+      self.timings.record("parse_command", started)
+    self.status = 1
+
+  def done(self, result):
+    self.status = exit_code(result)
+    return result
+
+  def __enter__(self):
+    if self.timings is not None:
+      self.timings.__enter__()
+    return self
+
+  def __exit__(self, exc_type, e, traceback):
+    if self.timings is None:
+      return
+    self.timings.__exit__(exc_type, e, traceback)
+    if self.metrics is None:
+      return
+
+    exception = None
+    if isinstance(e, SystemExit):
+      self.status = _system_exit_code(e)
+    elif e is not None and not isinstance(e, ExceptionWithHelp):
+      # Command lines that could not be run fail without an exception
+      exception = exc_type.__name__
+
+    from .metrics import MetricsRecord
+
+    self.metrics.emit(
+        MetricsRecord(self.timings.name, self.status, exception, dict(self.timings.timings))
+    )
+
+
+def _usage_prefix(script_name, path):
+  # Usage of a mounted tooler is shown for the commands leading to it
+  if not path:
+    return script_name
+  return " ".join([script_name or "t", *path])
 
 
 class UsageCommand(Command):
-  def __init__(self, tooler):
+  def __init__(self, tooler, script_name=None):
     self.tooler = tooler
+    self.script_name = script_name
 
   def run(self, selector, argv):
-    self.tooler.usage()
-
-
-def _is_similar(command, search_command):
-  return search_command in command
+    if self.script_name is None:
+      self.tooler.usage()
+    else:
+      self.tooler.usage(self.script_name)
 
 
 class Tooler:
-  def __init__(self, help: Optional[str] = None):
+  def __init__(self, help: str | None = None, manifest: str | None = None):
     self.root = self
     self.parent = None
 
     self.default_command = None
     self.commands = {}
     self.namespace = set()
+    self.index = CommandIndex()
 
     self.help = help
+    self.manifest = manifest
     self.options = {}
     self.arguments = {}
+    self.cache = None
+    self.metrics = None
+    for url in filter(None, os.environ.get("TOOLER_METRICS", "").split(",")):
+      from .metrics import sink_from_url
+
+      try:
+        sink = sink_from_url(url)
+      except ValueError as e:
+        # A bad URL should not stop the tool itself from working
+        status.warn("Ignoring $TOOLER_METRICS sink %r: %s" % (url, e))
+        continue
+      self.add_metrics_sink(sink)
 
     self.add_argument(
         "assume-defaults",
@@ -51,25 +168,111 @@ class Tooler:
     self.add_argument(
         "help", description="Display usage information for the tool", default=False
     )
+    self.add_argument(
+        "output-format",
+        description="Format for command results: pretty, json, ndjson, msgpack, csv or tsv",
+        default=None,
+    )
+    self.add_argument(
+        "parallel",
+        description="Number of targets a fan-out command runs at once",
+        default=1,
+    )
+    self.add_argument(
+        "executor",
+        description="How fan-out commands run targets: thread, process or async",
+        default="thread",
+    )
+    self.add_argument(
+        "fail-fast",
+        description="Stop a fan-out command at the first failing target",
+        default=False,
+    )
+    self.add_argument(
+        "target-timeout",
+        description="Seconds a fan-out command waits for each target",
+        default=None,
+    )
+    self.add_argument(
+        "as-completed",
+        description="Output fan-out results as they complete instead of in order",
+        default=False,
+    )
+    self.add_argument(
+        "no-cache",
+        description="Run cached commands without looking up or storing results",
+        default=False,
+    )
+    self.add_argument(
+        "profile",
+        description="Print how long each phase of running the command took",
+        default=False,
+    )
+    self.add_argument(
+        "profile-output",
+        description="Profile the command into a pstats or .speedscope.json file",
+        default=None,
+    )
 
   def _set_parent(self, parent):
+    assert self.parent is None, "A tooler can only be mounted once"
     self.parent = parent
-    self.root = parent.root
+    self._set_root(parent.root)
+
+  def _set_root(self, root):
+    # Arguments are parsed at every level but kept by the root
+    for (arg, config) in self.arguments.items():
+      root.arguments.setdefault(arg, config)
+      root.options.setdefault(arg, self.options.get(arg, config.default))
+    if root.metrics is None:
+      root.metrics = self.metrics
+    self.root = root
+    for command in self.commands.values():
+      if isinstance(command, MountCommand) and command.resolved:
+        command.resolve()._set_root(root)
+
+  def mount(self, name, tooler, *, help=None):
+    """
+Mount another `Tooler` (or a "module:attribute" reference to one) under
+`name`, so `<name> <command>` runs its commands. A reference is only imported
+once a command line, its usage or completion go through the mount.
+"""
+    self.add_command(name, MountCommand(tooler, self, doc=help))
 
   def add_argument(self, arg, description=None, default=None):
     self.root.arguments[arg] = ToolerOptionConfig(description=description, default=default)
     if arg not in self.root.options:
       self.root.options[arg] = default
 
+  def add_metrics_sink(self, sink):
+    """Send a `MetricsRecord` for every command run to `sink`"""
+    if self.root.metrics is None:
+      from .metrics import Metrics
+
+      self.root.metrics = Metrics()
+    self.root.metrics.add_sink(sink)
+
   def command(
       self,
       fn=None,
       *,
       name=None,
       default: bool = False,
-      shorthands: Optional[Dict[str, str]] = None,
+      shorthands: dict[str, str] | None = None,
       parser=None,
+      fan_out: bool = False,
+      cache=None,
+      cache_key=None,
   ):
+    """
+Register a function as a command. With `fan_out` the function is called once
+per target given on the command line, with the target as its first argument.
+
+With `cache` results are memoized on disk by their arguments, for read-only
+commands. It is either True, a TTL in seconds, or a `ResultCache` to use
+instead of the tooler's. `cache_key` is called with the arguments and returns
+what to key them on instead.
+"""
     # This function creates a decorator. If we were passed a function here then
     # we need to first create the decorator and then pass the function to
     # it.
@@ -79,6 +282,9 @@ class Tooler:
           default=default,
           shorthands=shorthands,
           parser=parser,
+          fan_out=fan_out,
+          cache=cache,
+          cache_key=cache_key,
       )(fn)
 
     def decorator(fn):
@@ -86,9 +292,35 @@ class Tooler:
       def decorated(*args, **kv):
         return fn(*args, **kv)
 
+      if fan_out:
+        assert not parser, "Fan-out commands always use the default parser"
+        assert not cache, "Fan-out commands cannot be cached"
+        command = FanOutCommand(fn, self, doc=fn.__doc__, shorthands=shorthands)
+      elif cache is not None and cache is not False:
+        from .cache import ResultCache
+        from .command import CachedCommand
+
+        if isinstance(cache, ResultCache):
+          (result_cache, ttl) = (cache, None)
+        else:
+          result_cache = self.result_cache()
+          ttl = None if cache is True else cache
+        command = CachedCommand(
+            fn,
+            self,
+            result_cache,
+            ttl=ttl,
+            key=cache_key,
+            doc=fn.__doc__,
+            parser=parser,
+            shorthands=shorthands,
+        )
+      else:
+        command = DecoratorCommand(fn, doc=fn.__doc__, parser=parser, shorthands=shorthands)
+
       self.add_command(
           fn.__name__.replace("_", "-") if name is None else name,
-          DecoratorCommand(fn, doc=fn.__doc__, parser=parser, shorthands=shorthands),
+          command,
           default=default,
       )
 
@@ -96,7 +328,38 @@ class Tooler:
 
     return decorator
 
-  def conflicts(self, *groups: List[Union[str, List[str]]]):
+  def result_cache(self):
+    """The `ResultCache` shared by this tooler's cached commands"""
+    if self.root.cache is None:
+      from .cache import ResultCache
+
+      self.root.cache = ResultCache()
+    return self.root.cache
+
+  def lazy_command(
+      self,
+      name: str,
+      reference: str,
+      *,
+      default: bool = False,
+      doc: str | None = None,
+      shorthands: dict[str, str] | None = None,
+      parser=None,
+  ):
+    """
+Register a command by "module:function" reference without importing it.
+
+The function is looked up (and its module imported) only when the command is
+dispatched to. It should be a plain function rather than one already decorated
+with `command` on this tooler.
+"""
+    self.add_command(
+        name,
+        LazyCommand(reference, doc=doc, parser=parser, shorthands=shorthands),
+        default=default,
+    )
+
+  def conflicts(self, *groups: list[str | list[str]]):
     """
 Refuse to run the command if conflicting parameters are provided.
 """
@@ -114,6 +377,8 @@ Refuse to run the command if conflicting parameters are provided.
               break
 
         if len(seen) > 1:
+          from .clide.english import and_join
+
           raise CommandParseException(
               "Arguments are conflicting %s"
               % and_join(['"--%s"' % arg.replace("_", "-") for arg in seen])
@@ -135,6 +400,7 @@ Refuse to run the command if conflicting parameters are provided.
       self.default_command = command
 
     self.commands[name] = command
+    self.index.add(name)
 
   def has_default(self):
     return True if self.default_command else False
@@ -149,6 +415,13 @@ Refuse to run the command if conflicting parameters are provided.
 
     options = {}
     idx = 0
+    # Each mounted tooler on the way down is a single lookup in the commands of
+    # the one above it, so nested commands resolve in one pass over `args`
+    tooler = self
+    path = []
+    # Where the arguments after the last mount start. A default command gets
+    # everything from there on, tooler arguments included, as it always has
+    start = 0
     command = None
     selector = None
     while idx < len(args):
@@ -156,8 +429,9 @@ Refuse to run the command if conflicting parameters are provided.
       # We don't use it as a command and rather keep it as the first argument
       # This is done before parsing `--<x>` style arguments so they are passed
       # on to the default command as well.
-      if self.default_command:
-        if args[idx] not in self.commands:
+      if tooler.default_command:
+        if args[idx] not in tooler.commands:
+          args = args[start:]
           break
 
       arg_match = ARG_REGEX.match(args[idx])
@@ -187,86 +461,358 @@ Refuse to run the command if conflicting parameters are provided.
       else:
         # If we have a default command set, and this command doesn't exist
         # We don't use it as a command and rather keep it as the first argument
-        if self.default_command:
-          if args[idx] not in self.commands:
+        if tooler.default_command:
+          if args[idx] not in tooler.commands:
+            args = args[start:]
             break
 
+        entry = tooler.commands.get(args[idx])
+        if isinstance(entry, MountCommand):
+          tooler = entry.resolve()
+          path.append(args[idx])
+          idx += 1
+          start = idx
+          continue
+
         command = args[idx]
         if ":" in command:
           (command, selector) = command.split(":", 1)
         args = args[idx + 1:]
         break
+    else:
+      args = args[start:]
 
     # If no command was in the command line, use our default
-    if command is None and self.default_command:
-      command = self.default_command
+    if command is None and tooler.default_command:
+      command = tooler.default_command
 
     # Default to help, or overwrite if --help is set
     if command is None or "help" in options:
-      command = UsageCommand(self)
+      command = UsageCommand(tooler, _usage_prefix(script_name, path) if path else None)
 
     if isinstance(command, Command):
       return (options, command, selector, args)
 
-    if command in self.commands:
-      return (options, self.commands[command], selector, args)
+    if command in tooler.commands:
+      return (options, tooler.commands[command], selector, args)
 
+    message = "Invalid command: %s" % command
+    suggestions = tooler.index.suggest(command)
+    if suggestions:
+      message += ' (did you mean "%s"?)' % suggestions[0]
     raise CommandParseException(
-        "Invalid command: %s" % command,
-        usage=self.usage(script_name, search_command=command, output=False),
+        message,
+        usage=tooler.usage(
+            _usage_prefix(script_name, path), search_command=command, output=False
+        ),
     )
 
   def run(self, args=None, script_name=None, output=output_default):
     try:
-      (options, command, selector, args) = self.parse_command(args, script_name)
+      return self._run_args(args, script_name, output)
+    except ExceptionWithHelp as e:
+      e.print_help()
+      return False
+
+  def _run_args(self, args, script_name, output):
+    """`run`, raising `ExceptionWithHelp` for command lines that cannot be run"""
+    started = time.perf_counter()
+    if args is not None and PIPE_OPERATOR in args:
+      from .pipeline import split_stages
+
+      stages = split_stages(args, self.commands)
+      if len(stages) > 1:
+        return self._pipe(stages, script_name, output, started)
+
+    (options, command, selector, args) = self.parse_command(args, script_name)
+    self.root.options.update(options)
+
+    with self._measure(command, started) as measure:
+      return measure.done(self._run(command, selector, args, output))
+
+  def _measure(self, command, started):
+    """Times running `command` for `--profile` and the metrics, see `_Measure`"""
+    name = _command_name(command)
+    profile = Profile.from_options(name, self.root.options)
+    return _Measure(name, profile, self.root.metrics, started)
+
+  def _run(self, command, selector, args, output):
+    output = self._output(output)
+    result = command.run(selector, args)
+
+    if isinstance(result, CoroutineType):
+      from .runtime import run_until_complete
+
+      with phase("command"):
+        result = run_until_complete(result)
+
+    if isinstance(result, AsyncGeneratorType):
+      from .runtime import iterate
+
+      result = iterate(result)
+
+    if result is not None and output is not None:
+      with phase("output"):
+        # Streamed results are used up by the output
+        if isinstance(result, GeneratorType):
+          return _output_streamed(output, result)
+        output(result)
+    return result
+
+  def pipe(self, *stages, script_name=None, output=output_default):
+    """
+Run commands in this process as a pipeline, each stage an argv. Every stage
+after the first is given the result of the one before it as a Python object,
+see `tooler.pipeline`, and only the result of the last is output.
+
+  tooler.pipe(["list-hosts"], ["check-host", "--timeout=5"])
+"""
+    try:
+      return self._pipe(stages, script_name, output, time.perf_counter())
+    except ExceptionWithHelp as e:
+      e.print_help()
+      return False
+
+  def _pipe(self, stages, script_name, output, started):
+    from .pipeline import settle, with_input
+
+    assert stages, "A pipeline needs at least one stage"
+    # Every stage is parsed before any is run
+    parsed = []
+    for stage in stages:
+      (options, command, selector, args) = self.parse_command(list(stage), script_name)
       self.root.options.update(options)
-      result = command.run(selector, args)
+      parsed.append((command, selector, args))
+
+    # Timed and reported as a run of the last stage, failures of earlier
+    # stages included
+    with self._measure(parsed[-1][0], started) as measure:
+      result = None
+      for (index, (command, selector, args)) in enumerate(parsed):
+        if index:
+          args = with_input(args, result)
+        if index == len(parsed) - 1:
+          break
+        # Generators are passed on as they are, to be streamed through
+        result = settle(command.run(selector, args))
+      return measure.done(self._run(command, selector, args, output))
+
+  async def run_async(self, args=None, script_name=None, output=output_default):
+    """
+Like `run`, but awaits coroutine commands in the running event loop so they
+can run concurrently with other tasks.
+"""
+    try:
+      return await self._run_args_async(args, script_name, output)
     except ExceptionWithHelp as e:
       e.print_help()
       return False
 
-    if asyncio.iscoroutine(result):
-      loop = asyncio.get_event_loop()
-      result = loop.run_until_complete(result)
+  async def _run_args_async(self, args, script_name, output):
+    started = time.perf_counter()
+    (options, command, selector, args) = self.parse_command(args, script_name)
+    self.root.options.update(options)
+    with self._measure(command, started) as measure:
+      return measure.done(await self._run_async(command, selector, args, output))
+
+  async def _run_async(self, command, selector, args, output):
+    import asyncio
+    output = self._output(output)
+    result = command.run(selector, args)
+
+    if isinstance(result, CoroutineType):
+      with phase("command"):
+        result = await result
+
+    if isinstance(result, AsyncGeneratorType) and output is not None:
+      # Write from a thread so the loop keeps producing items meanwhile
+      from .runtime import iterate_threadsafe
+
+      loop = asyncio.get_running_loop()
+      with phase("output"):
+        await asyncio.to_thread(output, iterate_threadsafe(result, loop))
+      return None
 
     if result is not None and output is not None:
-      output(result)
+      with phase("output"):
+        # Streamed results are used up by the output
+        if isinstance(result, GeneratorType):
+          return _output_streamed(output, result)
+        output(result)
     return result
 
+  def _output(self, output):
+    # The default output picks up the format from `--output-format`
+    output_format = self.root.options["output-format"]
+    if output is output_default and output_format is not None:
+      from .output import get_format
+
+      get_format(output_format)
+      return functools.partial(output_default, format=output_format)
+    return output
+
+  def run_batch(self, commands, script_name=None, output=output_json_line):
+    """
+Run each argv in `commands` in this process, one after another.
+
+`output` is called with a record per command holding its `index`, `args`,
+`status` (the exit code it would have had when run on its own) and either its
+`result` or the `error` it raised. Returns True if every command succeeded.
+"""
+    success = True
+    for (index, args) in enumerate(commands, 1):
+      record = {"index": index, "args": list(args)}
+
+      # Tooler arguments only apply to the line they were given on
+      options = dict(self.root.options)
+      try:
+        result = self._run_args(list(args), script_name, None)
+        if isinstance(result, GeneratorType):
+          (result, returned) = _collect(result)
+          record["status"] = exit_code(returned)
+        else:
+          record["status"] = exit_code(result)
+        record["result"] = result
+      except ExceptionWithHelp as e:
+        # The error goes in the record rather than to stderr with its usage
+        record["status"] = 1
+        record["error"] = str(e)
+      except SystemExit as e:
+        record["status"] = _system_exit_code(e)
+      except Exception as e:
+        record["status"] = 1
+        record["error"] = "%s: %s" % (type(e).__name__, e)
+      finally:
+        self.root.options.clear()
+        self.root.options.update(options)
+
+      success = success and record["status"] == 0
+      if output is not None:
+        output(record)
+    return success
+
   def main(self, argv=None):
+    try:
+      code = self._main(argv)
+      sys.stdout.flush()
+    except BrokenPipeError:
+      # The reader went away, as in `tool ... | head`. That is not an error, so
+      # exit quietly with the status of a process killed by SIGPIPE.
+      silence_stdout()
+      code = 128 + 13
+    sys.exit(code)
+
+  def _main(self, argv):
     if argv is None:
       argv = sys.argv
     script_name = argv[0]
     args = argv[1:]
 
+    if len(args) == 2 and args[0] == "--serve":
+      self.serve(args[1], script_name=script_name)
+      return 0
+
+    if len(args) == 2 and args[0] == "--batch":
+      from .batch import read_command_lines
+
+      if args[1] == "-":
+        success = self.run_batch(read_command_lines(sys.stdin.buffer), script_name)
+      else:
+        with open(args[1], "rb") as f:
+          success = self.run_batch(read_command_lines(f), script_name)
+      return 0 if success else 1
+
+    if self.manifest is not None and self._main_from_manifest(args):
+      return 0
+
     if args == ["--bash-completion"]:
       words = os.environ["COMP_WORDS"].split("\n")
       word = int(os.environ["COMP_CWORD"])
-      if word == 1 and len(words) >= 1:
-        for command in self.commands.keys():
-          if command.startswith(words[1]):
-            print(command)
-      sys.exit(0)
+      for command in self._complete_commands(words, word) or []:
+        print(command)
+      return 0
 
     rv = self.run(args, script_name=script_name)
-    sys.exit(0 if rv in (True, None) else 1)
+    return exit_code(rv)
+
+  def serve(self, socket_path, script_name=None):
+    """
+Keep this tool warm in a fork-server listening on `socket_path`. Commands are
+run against it with `python tooler/client.py <socket_path> [args...]`.
+"""
+    from .server import serve
+
+    serve(self, socket_path, script_name=script_name)
+
+  def load_manifest(self):
+    """
+Load the command manifest, rebuilding and saving it if it is missing or stale.
+"""
+    from .manifest import build_manifest, load_manifest, save_manifest
+
+    manifest = load_manifest(self.manifest, self)
+    if manifest is None:
+      manifest = build_manifest(self)
+      save_manifest(self.manifest, manifest)
+    return manifest
+
+  def _main_from_manifest(self, args):
+    if args == ["--bash-completion"]:
+      words = os.environ["COMP_WORDS"].split("\n")
+      word = int(os.environ["COMP_CWORD"])
+      # Answered from the manifest, so mounts by reference are not imported
+      from .manifest import complete_commands, complete_options
+
+      manifest = self.load_manifest()
+      candidates = complete_commands(manifest, words, word)
+      if candidates is None:
+        candidates = complete_options(manifest, words, word)
+      for candidate in candidates:
+        print(candidate)
+      return True
+
+    if len(args) == 2 and args[1] == "--help" and args[0] in self.commands:
+      usage = self.load_manifest()["commands"][args[0]]["usage"]
+      if usage is None:
+        # Custom parsers handle their own help
+        return False
+      print(usage)
+      return True
+
+    return False
+
+  def _complete_commands(self, words, word):
+    """
+Commands completing `words[word]` of bash's COMP_WORDS, following mounts for
+the words before it. Returns `None` when it is not a command position.
+"""
+    if word < 1:
+      return None
+    tooler = self
+    for name in words[1:word]:
+      entry = tooler.commands.get(name)
+      if not isinstance(entry, MountCommand):
+        return None
+      tooler = entry.resolve()
+    return tooler.index.complete(words[word] if word < len(words) else "")
 
   def usage(self, script_name="t", search_command=None, output=True):
     prefix = script_name + " " if script_name else ""
 
     usage = "Usage: %s<command> [options...]\n\n" % prefix
 
-    list_commands = list(self.commands.keys())
-
     if search_command is None:
+      list_commands = sorted(self.commands.keys())
       usage += "Available commands:\n" if list_commands else "No commands available.\n"
     else:
-      list_commands = [cmd for cmd in list_commands if _is_similar(cmd, search_command)]
+      # Already ranked with the closest match first
+      list_commands = self.index.suggest(search_command)
       usage += "Similar commands:\n" if list_commands else "No similar commands.\n"
 
-    if list_commands:
-      for command in sorted(list_commands):
-        usage += "  %s\n" % command
+    for command in list_commands:
+      if isinstance(self.commands.get(command), MountCommand):
+        command += " <command>"
+      usage += "  %s\n" % command
 
     usage += "\n"
 
@@ -277,5 +823,5 @@ Refuse to run the command if conflicting parameters are provided.
     if self.help:
       usage += "\n" + self.help + "\n"
     if output:
-      sys.stderr.write(usage)
+      status.write(usage)
     return usage
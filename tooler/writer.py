@@ -0,0 +1,199 @@
+"""
+Writing command output as bytes, and status messages to stderr.
+
+`Writer` gathers encoded output and hands it to the kernel in large chunks,
+with `os.writev` when the stream has a file descriptor, rather than going
+through the text layer of `sys.stdout` a line at a time. `StatusChannel`
+writes status messages to stderr a whole line (or batch of lines) at a time.
+"""
+import atexit
+import contextlib
+import os
+import sys
+
+# Output is sent once this much is pending, a pipe holds 64KiB on Linux
+CHUNK_SIZE = 1 << 16
+
+# Most parts a single `os.writev` call takes
+try:
+  IOV_MAX = max(16, os.sysconf("SC_IOV_MAX"))
+except (AttributeError, OSError, ValueError):
+  IOV_MAX = 1024
+
+_stdout = None
+
+
+def _fileno(stream):
+  try:
+    return stream.fileno()
+  except (AttributeError, OSError, ValueError):
+    # Replaced streams (such as captured output) have no descriptor
+    return None
+
+
+def _writev(fd, parts):
+  views = [memoryview(part) for part in parts]
+  start = 0
+  while start < len(views):
+    written = os.writev(fd, views[start:start + IOV_MAX])
+    # Skip what was written, a partial write leaves the rest of a part
+    while written:
+      size = views[start].nbytes
+      if written >= size:
+        written -= size
+        start += 1
+      else:
+        views[start] = views[start][written:]
+        written = 0
+
+
+class Writer:
+  """
+Bytes written to `stream` in chunks of at least `chunk_size`, except when
+flushed. Parts are passed to the kernel as they are, without joining them.
+"""
+
+  def __init__(self, stream, chunk_size=CHUNK_SIZE):
+    self.stream = stream
+    self.chunk_size = chunk_size
+    self._parts = []
+    self._size = 0
+    self._fd = _fileno(stream) if hasattr(os, "writev") else None
+
+  def write(self, data):
+    if not data:
+      return
+    self._parts.append(data)
+    self._size += len(data)
+    if self._size >= self.chunk_size or len(self._parts) >= IOV_MAX:
+      self._send()
+
+  def flush(self):
+    self._send()
+    if self._fd is None:
+      self.stream.flush()
+
+  def discard(self):
+    """Drop anything pending, such as after the reader has gone away"""
+    self._parts = []
+    self._size = 0
+
+  def _send(self):
+    parts = self._parts
+    if not parts:
+      return
+    self.discard()
+
+    # Anything already printed through the text layer has to go out first
+    self.stream.flush()
+    if self._fd is not None:
+      _writev(self._fd, parts)
+      return
+
+    buffer = getattr(self.stream, "buffer", None)
+    if buffer is None:
+      self.stream.write(b"".join(parts).decode("utf-8"))
+    else:
+      for part in parts:
+        buffer.write(part)
+
+
+def stdout_writer():
+  """The `Writer` for the current `sys.stdout`"""
+  global _stdout
+  if _stdout is None or _stdout.stream is not sys.stdout:
+    # Output is flushed at the end of every write, so nothing is left pending
+    # for a stream that has been replaced (and possibly closed)
+    _stdout = Writer(sys.stdout)
+  return _stdout
+
+
+def silence_stdout():
+  """
+Point stdout at /dev/null after a `BrokenPipeError`, so the interpreter does not
+fail again flushing it on the way out.
+"""
+  if _stdout is not None:
+    _stdout.discard()
+  fd = _fileno(sys.stdout)
+  if fd is None:
+    return
+  devnull = os.open(os.devnull, os.O_WRONLY)
+  try:
+    os.dup2(devnull, fd)
+  finally:
+    os.close(devnull)
+
+
+class StatusChannel:
+  """
+Status messages for stderr, written a whole line at a time. Lines written
+inside `batch()` are held and written together once it ends.
+"""
+
+  def __init__(self):
+    self._pending = []
+    self._batching = 0
+    # Live progress lines, taken down while messages are written above them
+    self.live = None
+
+  def write(self, text):
+    self._pending.append(text)
+    if not self._batching and "\n" in text:
+      self.flush(lines_only=True)
+
+  def flush(self, lines_only=False):
+    text = "".join(self._pending)
+    self._pending = []
+    if lines_only:
+      # Keep a partial line back until it is finished
+      end = text.rfind("\n") + 1
+      if end < len(text):
+        self._pending.append(text[end:])
+      text = text[:end]
+    if not text:
+      return
+    live = self.live
+    if live is None:
+      sys.stderr.write(text)
+      sys.stderr.flush()
+    else:
+      with live.suspended():
+        sys.stderr.write(text)
+        sys.stderr.flush()
+
+  @contextlib.contextmanager
+  def batch(self):
+    self._batching += 1
+    try:
+      yield self
+    finally:
+      self._batching -= 1
+      if not self._batching:
+        self.flush(lines_only=True)
+
+  def message(self, color_escape, code, message):
+    """A line in the style of `clide.ansi` messages"""
+    from .clide import ansi
+
+    self.write(ansi.format_message(color_escape, code, message) + "\n")
+
+  def info(self, message):
+    from .clide import ansi
+
+    self.message(ansi.white(bold=True), "INFO", message)
+
+  def warn(self, message):
+    from .clide import ansi
+
+    self.message(ansi.yellow(bold=True), "WARN", message)
+
+  def error(self, message):
+    from .clide import ansi
+
+    self.message(ansi.red(bold=True), "ERR!", message)
+
+
+status = StatusChannel()
+# A partial line still pending at exit is written rather than lost
+atexit.register(status.flush)